@@ -0,0 +1,105 @@
+"""Admission control for the API.
+
+Requests are grouped into endpoint classes (interactive CRUD, bulk work,
+reports), each with its own concurrency limit and bounded wait queue, so a
+burst of heavy requests cannot take every database connection away from
+ordinary CRUD calls.
+"""
+import asyncio
+from typing import Callable, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded FIFO wait queue."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                raise AdmissionRejected(self.name)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise AdmissionRejected(self.name)
+            finally:
+                self.queued -= 1
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def metrics(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queueSize": self.queue_size,
+            "active": self.active,
+            "queued": self.queued,
+            "maxQueued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware that admits each request through its class's limiter.
+
+    ``classify`` maps a request path and method to a key of ``limiters``, or
+    to ``None`` to let the request through unlimited.
+    """
+
+    def __init__(self, app, limiters: Dict[str, AdmissionLimiter],
+                 classify: Callable[[str, str], Optional[str]], retry_after: int = 1):
+        self.app = app
+        self.limiters = limiters
+        self.classify = classify
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        endpoint_class = self.classify(scope["path"], scope["method"])
+        if endpoint_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[endpoint_class]
+        try:
+            await limiter.acquire()
+        except AdmissionRejected:
+            response = JSONResponse(
+                {"detail": f"Too many concurrent {endpoint_class} requests, retry later"},
+                status_code=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,236 @@
+"""Streaming backup and restore of the whole database.
+
+An archive is a gzip-compressed NDJSON stream. Every line but the last holds
+one document as MongoDB extended JSON, tagged with its collection::
+
+    {"collection": "products", "doc": {...}}
+
+The final line is the manifest, with the document count, a SHA-256 of the
+document lines and the index definitions of every collection::
+
+    {"manifest": {"version": 1, "createdAt": "...", "collections": {...}}}
+
+Both directions work on one document (or one insert chunk) at a time, so
+memory use does not grow with the size of the database.
+"""
+import asyncio
+import hashlib
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from pymongo.errors import BulkWriteError
+
+ARCHIVE_VERSION = 1
+
+# gzip container (wbits 16 + 15) so archives open with standard tools
+GZIP_WBITS = 31
+
+# Restores load into "<name>__restore" and swap it in once verified
+STAGING_SUFFIX = "__restore"
+
+DUPLICATE_KEY = 11000
+
+
+class BackupError(Exception):
+    pass
+
+
+def encode_line(data: dict) -> bytes:
+    return (json_util.dumps(data, json_options=RELAXED_JSON_OPTIONS) + "\n").encode()
+
+
+async def export_archive(db, manifest: Optional[dict] = None,
+                         batch_size: int = 1000) -> AsyncIterator[bytes]:
+    """Yield the compressed archive of every collection in ``db``.
+
+    If ``manifest`` is given it is filled in with the archive manifest as the
+    export progresses.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+    if manifest is None:
+        manifest = {}
+    manifest.update(version=ARCHIVE_VERSION, createdAt=datetime.utcnow().isoformat(), collections={})
+
+    for name in sorted(await db.list_collection_names()):
+        if name.startswith("system.") or name.endswith(STAGING_SUFFIX):
+            continue
+        collection = db[name]
+        digest = hashlib.sha256()
+        count = 0
+        async for doc in collection.find({}, batch_size=batch_size).sort("_id", 1):
+            line = encode_line({"collection": name, "doc": doc})
+            digest.update(line)
+            count += 1
+            chunk = compressor.compress(line)
+            if chunk:
+                yield chunk
+        indexes = [
+            {"keys": info["key"], **{k: v for k, v in info.items() if k not in ("key", "v", "ns")}}
+            for index_name, info in (await collection.index_information()).items()
+            if index_name != "_id_"
+        ]
+        manifest["collections"][name] = {"count": count, "sha256": digest.hexdigest(), "indexes": indexes}
+
+    yield compressor.compress(encode_line({"manifest": manifest}))
+    yield compressor.flush()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Decompress an archive stream and yield its lines (newline included)."""
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    pending = b""
+    try:
+        async for chunk in chunks:
+            pending += decompressor.decompress(chunk)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line + b"\n"
+        pending += decompressor.flush()
+    except zlib.error as e:
+        raise BackupError(f"Archive is not valid gzip: {e}")
+    if pending.strip():
+        yield pending if pending.endswith(b"\n") else pending + b"\n"
+
+
+async def restore_archive(db, chunks: AsyncIterator[bytes], drop: bool = True,
+                          chunk_size: int = 1000, concurrency: int = 4) -> dict:
+    """Load an archive produced by :func:`export_archive` into ``db``.
+
+    Documents are inserted in chunks of ``chunk_size`` with up to
+    ``concurrency`` ``insert_many`` calls in flight, into a staging
+    ``<name>__restore`` collection per archived collection. Only once the
+    manifest, counts and checksums all check out are the staging collections
+    renamed over the live ones (or, with ``drop=False``, copied into them);
+    on any failure they are dropped and the live data is left untouched.
+    """
+    pending: set = set()
+    buffers: Dict[str, List[dict]] = {}
+    digests: Dict[str, "hashlib._Hash"] = {}
+    counts: Dict[str, int] = {}
+    manifest: Optional[dict] = None
+
+    async def flush(name: str):
+        docs = buffers.pop(name, [])
+        if not docs:
+            return
+        while len(pending) >= concurrency:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                task.result()
+        pending.add(asyncio.ensure_future(db[staging_name(name)].insert_many(docs, ordered=False)))
+
+    try:
+        async for line in iter_lines(chunks):
+            try:
+                record = json_util.loads(line)
+            except ValueError:
+                raise BackupError("Archive contains a corrupt line; it is truncated or damaged")
+            if "manifest" in record:
+                manifest = record["manifest"]
+                continue
+            name = record["collection"]
+            if name not in counts:
+                # Leftovers of an earlier failed restore must not count towards this one
+                await db.drop_collection(staging_name(name))
+                counts[name] = 0
+                digests[name] = hashlib.sha256()
+            counts[name] += 1
+            digests[name].update(line)
+            buffers.setdefault(name, []).append(record["doc"])
+            if len(buffers[name]) >= chunk_size:
+                await flush(name)
+
+        for name in list(buffers):
+            await flush(name)
+        if pending:
+            await asyncio.gather(*pending)
+
+        if manifest is None:
+            raise BackupError("Archive has no manifest; it is truncated or not a backup")
+        if manifest.get("version") != ARCHIVE_VERSION:
+            raise BackupError(f"Unsupported archive version {manifest.get('version')}")
+
+        report = {}
+        for name in counts:
+            if name not in manifest["collections"]:
+                raise BackupError(f"Collection {name} is missing from the manifest")
+        for name, expected in manifest["collections"].items():
+            restored = counts.get(name, 0)
+            checksum = digests[name].hexdigest() if name in digests else hashlib.sha256().hexdigest()
+            checksum_ok = checksum == expected["sha256"]
+            if restored != expected["count"] or not checksum_ok:
+                raise BackupError(f"Collection {name} does not match the manifest "
+                                  f"({restored}/{expected['count']} documents, checksum ok: {checksum_ok})")
+            report[name] = restored
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        await drop_staging(db, counts)
+        raise
+
+    try:
+        for name, expected in manifest["collections"].items():
+            # Empty in the archive, so there is no staging collection to swap in
+            staged = name in counts
+            if drop and not staged:
+                await db.drop_collection(name)
+            target = db[staging_name(name)] if drop and staged else db[name]
+            for index in expected["indexes"]:
+                options = {k: v for k, v in index.items() if k != "keys"}
+                await target.create_index([tuple(key) for key in index["keys"]], **options)
+            if drop and staged:
+                await target.rename(name, dropTarget=True)
+            elif staged:
+                await copy_collection(db[staging_name(name)], target, chunk_size)
+    finally:
+        await drop_staging(db, counts)
+    return {"createdAt": manifest["createdAt"], "collections": report}
+
+
+def staging_name(name: str) -> str:
+    return f"{name}{STAGING_SUFFIX}"
+
+
+async def drop_staging(db, names) -> None:
+    for name in names:
+        await db.drop_collection(staging_name(name))
+
+
+async def copy_collection(source, target, chunk_size: int) -> None:
+    """Insert every document of ``source`` that ``target`` does not hold yet."""
+    async def insert(docs: List[dict]):
+        try:
+            await target.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+
+    docs: List[dict] = []
+    async for doc in source.find({}, batch_size=chunk_size):
+        docs.append(doc)
+        if len(docs) >= chunk_size:
+            await insert(docs)
+            docs = []
+    if docs:
+        await insert(docs)
+
+
+async def read_file_chunks(path: str, size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def export_to_file(db, path: str) -> dict:
+    manifest: dict = {}
+    with open(path, "wb") as f:
+        async for chunk in export_archive(db, manifest):
+            await asyncio.to_thread(f.write, chunk)
+    return manifest
@@ -0,0 +1,91 @@
+"""Micro-batched inserts for high-frequency, low-value writes.
+
+Handlers hand documents to a :class:`BatchWriter` instead of inserting them
+one by one. A single background task writes whatever has accumulated with
+one ``insert_many`` as soon as ``max_records`` are waiting or ``max_delay``
+seconds after the first of them arrived, whichever comes first. So a steady
+stream of requests costs a few writes per second rather than one per request.
+
+By default :meth:`BatchWriter.submit` returns as soon as the document is
+queued. The document is lost if the process dies before the next flush, and
+a failed flush is logged and dropped. With ``durable=True`` the caller
+instead waits for the flush that carries its document and sees its error.
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    def __init__(self, repo, max_records: int = 500, max_delay: float = 0.05):
+        self.repo = repo
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._pending: List[Tuple[dict, Optional[asyncio.Future]]] = []
+        self._first = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def submit(self, doc: dict, durable: bool = False):
+        waiter = asyncio.get_running_loop().create_future() if durable else None
+        self._pending.append((doc, waiter))
+        self._first.set()
+        if len(self._pending) >= self.max_records:
+            self._full.set()
+        if self._task is None:
+            # Not started (or already stopped): write through
+            await self.flush()
+        if waiter:
+            await waiter
+
+    async def flush(self) -> int:
+        """Write everything queued so far in one ``insert_many``."""
+        batch, self._pending = self._pending, []
+        self._first.clear()
+        self._full.clear()
+        if not batch:
+            return 0
+        try:
+            await self.repo.insert_many([doc for doc, _ in batch])
+        except Exception as e:
+            logger.exception("Batched insert of %d documents into %s failed", len(batch), self.repo.name)
+            for _, waiter in batch:
+                if waiter and not waiter.done():
+                    waiter.set_exception(e)
+            return 0
+        for _, waiter in batch:
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+        return len(batch)
+
+    async def _run(self):
+        while not self._stopping:
+            await self._first.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        # Fresh events, bound to the loop the flusher runs on (the app may be restarted)
+        self._first = asyncio.Event()
+        self._full = asyncio.Event()
+        if self._pending:
+            self._first.set()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still queued."""
+        if self._task:
+            # Let an in-flight flush finish rather than cancelling it halfway
+            self._stopping = True
+            self._first.set()
+            self._full.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
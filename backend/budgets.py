@@ -0,0 +1,98 @@
+"""Per-endpoint-class database time budgets and cancellation on disconnect.
+
+Every request runs inside ``pymongo.timeout()`` with the budget of its
+endpoint class, so each query it issues is sent with a ``maxTimeMS`` no
+larger than what is left of the budget and the server gives up on it once the
+budget is spent. Read-only requests (GET and HEAD) also run in their own task
+that is cancelled as soon as the client disconnects, so an abandoned list or
+report stops issuing queries and fetching cursor batches instead of running
+to completion. Writes always run to completion: several of them take more
+than one step, and stopping halfway would leave partial state behind.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+import pymongo
+from pymongo.errors import AutoReconnect, PyMongoError, ServerSelectionTimeoutError
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Only requests without side effects are abandoned when the client disconnects
+CANCELLABLE_METHODS = ("GET", "HEAD")
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware applying ``budgets`` (seconds per endpoint class).
+
+    ``classify`` maps a request path and method to a key of ``budgets``;
+    classes that are missing, or have a budget of 0, run without a time limit
+    but reads are still cancelled when the client goes away.
+    """
+
+    def __init__(self, app, budgets: Dict[str, float], classify: Callable[[str, str], Optional[str]]):
+        self.app = app
+        self.budgets = budgets
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = self.budgets.get(self.classify(scope["path"], scope["method"])) or None
+        if scope["method"] not in CANCELLABLE_METHODS:
+            with pymongo.timeout(budget):
+                await self.app(scope, receive, send)
+            return
+
+        # Only the watcher reads from the server; the app gets messages through
+        # a one-slot queue, which keeps backpressure on streamed request bodies
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                await messages.put(message)
+
+        response_sent = False
+
+        async def tracking_send(message):
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                response_sent = True
+            await send(message)
+
+        with pymongo.timeout(budget):
+            handler = asyncio.ensure_future(self.app(scope, messages.get, tracking_send))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait({handler, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            handler.cancel()
+            raise
+        finally:
+            watcher.cancel()
+        # Once the response is out, let background tasks finish on their own
+        if handler.done() or response_sent:
+            await handler
+            return
+        handler.cancel()
+        logger.info("Client disconnected, cancelled %s %s", scope["method"], scope["path"])
+        try:
+            await handler
+        except asyncio.CancelledError:
+            pass
+
+
+async def database_error_handler(request: Request, exc: PyMongoError):
+    """Map database timeouts to 504 and an unreachable database to 503."""
+    if isinstance(exc, (ServerSelectionTimeoutError, AutoReconnect)):
+        return JSONResponse({"detail": "Database unavailable, retry later"}, status_code=503,
+                            headers={"Retry-After": "5"})
+    if exc.timeout:
+        return JSONResponse({"detail": "Database query exceeded its time budget"}, status_code=504)
+    raise exc
@@ -0,0 +1,109 @@
+"""Server-side Excel exports of products and invoices.
+
+Rows are pulled from a Motor cursor and appended to a write-only openpyxl
+workbook, which flushes each row to a temporary file instead of keeping the
+sheet in memory. The finished file is then streamed back in chunks, so an
+export of any size runs in constant memory.
+
+The column layouts mirror ``INVENTORY_HEADERS`` and ``INVOICE_HEADERS`` in
+``frontend/src/utils/excelUtils.js``, so an exported sheet can be fed
+straight back into the importers.
+"""
+import asyncio
+import tempfile
+from datetime import date, datetime
+from typing import AsyncIterator, IO, Iterable, List
+
+from openpyxl import Workbook
+
+INVENTORY_HEADERS = [
+    "Product Name *", "SKU", "Category", "Price *", "Stock Quantity *",
+    "Unit", "GST Rate (%)", "HSN Code", "Supplier",
+]
+
+INVOICE_HEADERS = [
+    "Invoice Number *", "Customer Name *", "Customer Email", "Customer Phone",
+    "Customer Address", "Customer GSTIN", "Invoice Date *", "Due Date",
+    "Product Name *", "SKU", "Category", "Price *", "Stock Quantity *",
+    "Unit", "GST Rate (%)", "HSN Code", "Supplier", "Notes",
+]
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def format_date(value) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return value or ""
+
+
+def product_rows(product: dict) -> List[list]:
+    return [[
+        product.get("name", ""), product.get("sku", ""), product.get("category", ""),
+        product.get("price", 0), product.get("stock", 0), product.get("unit", ""),
+        product.get("gstRate", ""), product.get("hsn", ""), product.get("supplier", ""),
+    ]]
+
+
+def invoice_rows(invoice: dict) -> List[list]:
+    """One row per line item; the importer groups them back by invoice number."""
+    head = [
+        invoice.get("invoiceNumber", ""), invoice.get("customerName", ""),
+        invoice.get("customerEmail", ""), invoice.get("customerPhone", ""),
+        invoice.get("customerAddress", ""), invoice.get("customerGSTIN", ""),
+        format_date(invoice.get("date")), format_date(invoice.get("dueDate")),
+    ]
+    return [
+        head + [
+            item.get("name", ""), item.get("sku", ""), item.get("category", ""),
+            item.get("price", 0), item.get("quantity", 0), item.get("unit", ""),
+            item.get("gstRate", ""), item.get("hsn", ""),
+            # Line items do not carry the supplier
+            "", invoice.get("notes", ""),
+        ]
+        for item in invoice.get("items", [])
+    ]
+
+
+def append_rows(sheet, rows: Iterable[list]):
+    for row in rows:
+        sheet.append(row)
+
+
+async def write_workbook(cursors, headers: List[str], to_rows, title: str,
+                         batch_size: int = 1000) -> IO[bytes]:
+    """Write every document from ``cursors`` into a new workbook.
+
+    Rows are handed to a worker thread ``batch_size`` at a time so the event
+    loop is not blocked while openpyxl serialises them. Returns the finished
+    file, rewound and ready to stream.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    batch: List[list] = []
+    for cursor in cursors:
+        async for doc in cursor:
+            batch.extend(to_rows(doc))
+            if len(batch) >= batch_size:
+                await asyncio.to_thread(append_rows, sheet, batch)
+                batch = []
+    if batch:
+        await asyncio.to_thread(append_rows, sheet, batch)
+
+    out = tempfile.TemporaryFile()
+    await asyncio.to_thread(workbook.save, out)
+    out.seek(0)
+    return out
+
+
+async def iter_file(f: IO[bytes], size: int = 1 << 16) -> AsyncIterator[bytes]:
+    """Stream ``f`` in chunks and close (and so delete) it afterwards."""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
@@ -0,0 +1,154 @@
+"""GST computation for invoices.
+
+Supplies within one state are taxed as CGST + SGST at half the rate each;
+supplies across states are taxed as IGST at the full rate. The two states are
+the first two digits of the supplier's and the customer's GSTIN. When either
+GSTIN is missing the supply is treated as intra-state, which is the case for
+walk-in (B2C) sales.
+
+Rates come from an HSN/SAC rate table, matched on the longest prefix of the
+item's code (a chapter or heading rate covers every code under it), and fall
+back to the rate on the item. All amounts are Decimals rounded half-up to the
+paisa per line and per tax head, and invoice totals are the sums of the
+rounded lines, so lines always add up to the invoice.
+"""
+import re
+import time as clock
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional
+
+PAISA = Decimal("0.01")
+GSTIN_PATTERN = re.compile(r"^(\d{2})[0-9A-Z]{10}[0-9A-Z]Z[0-9A-Z]$")
+TAX_HEADS = ("cgst", "sgst", "igst")
+
+
+def state_code(gstin: Optional[str]) -> Optional[str]:
+    match = GSTIN_PATTERN.match((gstin or "").strip().upper())
+    return match.group(1) if match else None
+
+
+def money(value) -> Decimal:
+    return Decimal(str(value)).quantize(PAISA, rounding=ROUND_HALF_UP)
+
+
+def as_number(value: Decimal):
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+class HsnRateTable:
+    """HSN/SAC code -> GST rate, read from a collection and cached for ``ttl_seconds``."""
+
+    def __init__(self, repo, ttl_seconds: float = 300):
+        self.repo = repo
+        self.ttl_seconds = ttl_seconds
+        self._rates: Optional[Dict[str, Decimal]] = None
+        self._loaded_at = 0.0
+
+    async def load(self) -> Dict[str, Decimal]:
+        if self._rates is None or clock.monotonic() - self._loaded_at > self.ttl_seconds:
+            rows = await self.repo.list({}, {"_id": 0, "hsn": 1, "rate": 1})
+            self._rates = {row["hsn"]: Decimal(str(row["rate"])) for row in rows}
+            self._loaded_at = clock.monotonic()
+        return self._rates
+
+    def invalidate(self):
+        self._rates = None
+
+
+def resolve_rate(rates: Dict[str, Decimal], hsn: str, default) -> Decimal:
+    code = re.sub(r"\D", "", hsn or "")
+    while code:
+        if code in rates:
+            return rates[code]
+        code = code[:-1]
+    return Decimal(str(default))
+
+
+def compute_line(item: dict, rate: Decimal, inter_state: bool) -> dict:
+    taxable = money(item["amount"])
+    if inter_state:
+        taxes = {"cgst": Decimal(0), "sgst": Decimal(0), "igst": money(taxable * rate / 100)}
+    else:
+        half = money(taxable * rate / 200)
+        taxes = {"cgst": half, "sgst": half, "igst": Decimal(0)}
+    return {**item, "amount": as_number(taxable), "gstRate": as_number(rate),
+            **{head: as_number(value) for head, value in taxes.items()}}
+
+
+def compute_invoice(items: List[dict], supplier_gstin: str, customer_gstin: str,
+                    rates: Dict[str, Decimal]) -> dict:
+    """Tax every line of an invoice and total it.
+
+    Returns the taxed ``items`` plus the invoice-level fields: ``supplyType``
+    ("intra" or "inter"), ``placeOfSupply`` (state code), ``amount``,
+    ``cgstAmount``, ``sgstAmount``, ``igstAmount``, ``gstAmount`` and
+    ``totalAmount``.
+    """
+    supplier_state, customer_state = state_code(supplier_gstin), state_code(customer_gstin)
+    inter_state = bool(supplier_state and customer_state and supplier_state != customer_state)
+    lines = [compute_line(item, resolve_rate(rates, item.get("hsn", ""), item.get("gstRate", 0)), inter_state)
+             for item in items]
+    totals = {key: sum((money(line[key]) for line in lines), Decimal(0))
+              for key in ("amount",) + TAX_HEADS}
+    gst = totals["cgst"] + totals["sgst"] + totals["igst"]
+    return {
+        "items": lines,
+        "supplyType": "inter" if inter_state else "intra",
+        "placeOfSupply": customer_state or supplier_state or "",
+        "amount": as_number(totals["amount"]),
+        "cgstAmount": as_number(totals["cgst"]),
+        "sgstAmount": as_number(totals["sgst"]),
+        "igstAmount": as_number(totals["igst"]),
+        "gstAmount": as_number(gst),
+        "totalAmount": as_number(totals["amount"] + gst),
+    }
+
+
+def compute_invoices(invoices: Iterable[dict], supplier_gstin: str, rates: Dict[str, Decimal]) -> List[dict]:
+    """Batch form of :func:`compute_invoice`; each invoice has ``items`` and ``customerGSTIN``."""
+    return [compute_invoice(invoice["items"], supplier_gstin, invoice.get("customerGSTIN", ""), rates)
+            for invoice in invoices]
+
+
+def summarize(invoices: Iterable[dict]) -> dict:
+    """GSTR-1 style summary of taxed invoices.
+
+    ``b2b`` has one row per customer GSTIN, ``b2c`` one row per place of
+    supply and ``hsn`` one row per HSN code and rate; ``totals`` covers all.
+    """
+    def bucket():
+        return {"invoices": 0, "taxableValue": Decimal(0), "cgst": Decimal(0),
+                "sgst": Decimal(0), "igst": Decimal(0)}
+
+    b2b: Dict[str, dict] = {}
+    b2c: Dict[str, dict] = {}
+    hsn: Dict[tuple, dict] = {}
+    totals = bucket()
+    for invoice in invoices:
+        gstin = (invoice.get("customerGSTIN") or "").strip().upper()
+        row = b2b.setdefault(gstin, bucket()) if state_code(gstin) else \
+            b2c.setdefault(invoice.get("placeOfSupply", ""), bucket())
+        for target in (row, totals):
+            target["invoices"] += 1
+            target["taxableValue"] += money(invoice.get("amount", 0))
+            for head in TAX_HEADS:
+                target[head] += money(invoice.get(f"{head}Amount", 0))
+        for item in invoice.get("items", []):
+            line = hsn.setdefault((item.get("hsn", ""), money(item.get("gstRate", 0))),
+                                  {**bucket(), "quantity": 0})
+            line["invoices"] += 1
+            line["quantity"] += item.get("quantity", 0)
+            line["taxableValue"] += money(item.get("amount", 0))
+            for head in TAX_HEADS:
+                line[head] += money(item.get(head, 0))
+
+    def export(row: dict) -> dict:
+        return {key: as_number(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+
+    return {
+        "b2b": [{"customerGSTIN": gstin, **export(row)} for gstin, row in sorted(b2b.items())],
+        "b2c": [{"placeOfSupply": state, **export(row)} for state, row in sorted(b2c.items())],
+        "hsn": [{"hsn": code, "gstRate": as_number(rate), **export(row)}
+                for (code, rate), row in sorted(hsn.items())],
+        "totals": export(totals),
+    }
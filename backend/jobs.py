@@ -0,0 +1,180 @@
+"""Durable background jobs backed by a ``jobs`` collection.
+
+Heavy operations are enqueued as a job document and picked up by a small
+pool of in-process workers. A worker claims a job by taking a lease on it and
+keeps the lease alive with a heartbeat while the handler runs; if the process
+dies the lease lapses and another worker (or the restarted process) picks the
+job up again. Failed jobs are retried with exponential backoff until they run
+out of attempts; a lapsed lease uses up an attempt too, so a job that keeps
+crashing its process ends up failed instead of being retried forever.
+
+Job documents look like::
+
+    {"id", "kind", "companyId", "params", "status", "attempts", "maxAttempts",
+     "runAt", "leaseUntil", "workerId", "progress", "result", "error",
+     "createdAt", "updatedAt", "finishedAt"}
+
+where ``status`` moves queued -> running -> succeeded | failed, and back to
+queued between retries.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# handler(job, progress) -> result; progress(done, total=None, message="")
+Handler = Callable[[dict, Callable[..., Awaitable[None]]], Awaitable[dict]]
+
+MAX_BACKOFF_SECONDS = 300
+
+
+class JobQueue:
+    def __init__(self, jobs, workers: int = 2, lease_seconds: float = 60,
+                 max_attempts: int = 3, backoff_seconds: float = 5,
+                 poll_interval: float = 2):
+        self.jobs = jobs
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, Handler] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, kind: str, handler: Handler):
+        self.handlers[kind] = handler
+
+    async def enqueue(self, kind: str, params: Optional[dict] = None,
+                      company_id: Optional[str] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "companyId": company_id,
+            "params": params or {},
+            "status": "queued",
+            "attempts": 0,
+            "maxAttempts": self.max_attempts,
+            "runAt": now,
+            "leaseUntil": None,
+            "workerId": None,
+            "progress": {},
+            "result": None,
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now,
+            "finishedAt": None,
+        }
+        await self.jobs.insert(dict(job))
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.get({"id": job_id}, {"_id": 0})
+
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        """Lease the next due job, including running jobs whose lease lapsed."""
+        while True:
+            now = datetime.utcnow()
+            job = await self.jobs.find_one_and_update(
+                {"$or": [
+                    {"status": "queued", "runAt": {"$lte": now}},
+                    {"status": "running", "leaseUntil": {"$lt": now}},
+                ]},
+                set={"status": "running", "workerId": worker_id, "updatedAt": now,
+                     "leaseUntil": now + timedelta(seconds=self.lease_seconds)},
+                inc={"attempts": 1},
+                sort=[("runAt", 1)],
+            )
+            if not job:
+                return None
+            job.pop("_id", None)
+            if job["attempts"] <= job["maxAttempts"]:
+                return job
+            # Only a lapsed lease gets here: the process running the last attempt died
+            logger.error("Job %s (%s) lost its worker on all %d attempts", job["id"], job["kind"],
+                         job["maxAttempts"])
+            await self._update(job, worker_id, {
+                "status": "failed", "attempts": job["maxAttempts"], "leaseUntil": None, "finishedAt": now,
+                "error": "The worker stopped while running the job",
+            })
+
+    async def _update(self, job: dict, worker_id: str, update: dict) -> bool:
+        # Only the lease holder may write; a lapsed lease means someone else owns it
+        update.setdefault("updatedAt", datetime.utcnow())
+        return await self.jobs.update({"id": job["id"], "workerId": worker_id}, set=update) == 1
+
+    async def _heartbeat(self, job: dict, worker_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            until = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+            if not await self._update(job, worker_id, {"leaseUntil": until}):
+                return
+
+    async def run_job(self, job: dict, worker_id: str):
+        async def progress(done: int, total: Optional[int] = None, message: str = ""):
+            await self._update(job, worker_id, {"progress": {"done": done, "total": total, "message": message}})
+
+        handler = self.handlers.get(job["kind"])
+        heartbeat = asyncio.create_task(self._heartbeat(job, worker_id))
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind {job['kind']!r}")
+            result = await handler(job, progress)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without spending an attempt
+            await self.jobs.update(
+                {"id": job["id"], "workerId": worker_id},
+                set={"status": "queued", "leaseUntil": None, "workerId": None, "runAt": datetime.utcnow()},
+                inc={"attempts": -1},
+            )
+            raise
+        except Exception as e:
+            logger.exception("Job %s (%s) failed on attempt %d", job["id"], job["kind"], job["attempts"])
+            now = datetime.utcnow()
+            if job["attempts"] < job["maxAttempts"]:
+                delay = min(self.backoff_seconds * 2 ** (job["attempts"] - 1), MAX_BACKOFF_SECONDS)
+                await self._update(job, worker_id, {"status": "queued", "error": str(e), "leaseUntil": None,
+                                                    "runAt": now + timedelta(seconds=delay)})
+            else:
+                await self._update(job, worker_id, {"status": "failed", "error": str(e),
+                                                    "leaseUntil": None, "finishedAt": now})
+        else:
+            await self._update(job, worker_id, {"status": "succeeded", "result": result, "error": None,
+                                                "leaseUntil": None, "finishedAt": datetime.utcnow()})
+        finally:
+            heartbeat.cancel()
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                job = await self.claim(worker_id)
+            except Exception:
+                logger.exception("Job worker %s could not claim a job", worker_id)
+                job = None
+            if job:
+                await self.run_job(job, worker_id)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        # A fresh event, bound to the loop the workers run on (the app may be restarted)
+        self._wakeup = asyncio.Event()
+        prefix = uuid.uuid4().hex[:8]
+        self._tasks = [asyncio.create_task(self._worker(f"{prefix}-{n}")) for n in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,108 @@
+"""Maintenance commands for the Inventory Management System backend.
+
+Run from the ``backend`` directory, e.g.::
+
+    python manage.py reconcile-customers
+"""
+import asyncio
+import json
+
+import typer
+
+import backup
+import server
+
+cli = typer.Typer(help="Inventory Management System maintenance commands")
+
+
+@cli.callback()
+def main():
+    """Inventory Management System maintenance commands."""
+
+
+def run(coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        server.store.close()
+
+
+def require_mongo():
+    if server.db is None:
+        typer.echo("backup and restore need STORAGE_BACKEND=mongo", err=True)
+        raise typer.Exit(1)
+
+
+def echo_json(data):
+    typer.echo(json.dumps(data, indent=2, default=str))
+
+
+@cli.command("reconcile-customers")
+def reconcile_customers():
+    """Re-copy customer details onto every open invoice that has drifted."""
+    echo_json(run(server.reconcile_customer_invoices()))
+
+
+@cli.command("archive-invoices")
+def archive_invoices(
+    older_than_days: int = typer.Option(server.ARCHIVE_AFTER_DAYS, help="Archive paid invoices older than this"),
+    batch_size: int = typer.Option(server.ARCHIVE_BATCH_SIZE, help="Invoices moved per batch"),
+):
+    """Move old paid invoices into the invoices_archive collection."""
+    echo_json(run(server.archive_paid_invoices(older_than_days, batch_size)))
+
+
+@cli.command("migrate-dates")
+def migrate_dates():
+    """Convert string-formatted invoice and product dates to BSON dates."""
+    echo_json(run(server.migrate_date_fields()))
+
+
+@cli.command("sweep-overdue")
+def sweep_overdue():
+    """Mark every pending invoice past its due date as overdue."""
+    echo_json(run(server.sweep_overdue_invoices()))
+
+
+@cli.command("backfill-company")
+def backfill_company(
+    company_id: str = typer.Argument(server.DEFAULT_COMPANY_ID, help="Company that owns existing data"),
+):
+    """Assign products, customers and invoices without a companyId to a company."""
+    echo_json(run(server.backfill_company_id(company_id)))
+
+
+@cli.command("snapshot-stock")
+def snapshot_stock():
+    """Record a stock snapshot for every product."""
+    echo_json(run(server.snapshot_stock_levels()))
+
+
+@cli.command("backup")
+def backup_database(path: str = typer.Argument(..., help="Archive file to write (.ndjson.gz)")):
+    """Stream every collection into a compressed NDJSON archive."""
+    require_mongo()
+    manifest = run(backup.export_to_file(server.db, path))
+    echo_json({name: info["count"] for name, info in manifest["collections"].items()})
+
+
+@cli.command("restore")
+def restore_database(
+    path: str = typer.Argument(..., help="Archive file written by 'backup'"),
+    drop: bool = typer.Option(True, help="Replace each collection rather than adding to it"),
+    concurrency: int = typer.Option(4, help="insert_many calls in flight"),
+):
+    """Load an archive with parallel chunked inserts, then rebuild indexes."""
+    require_mongo()
+
+    async def restore():
+        report = await backup.restore_archive(server.db, backup.read_file_chunks(path),
+                                              drop=drop, concurrency=concurrency)
+        await server.create_indexes()
+        return report
+
+    echo_json(run(restore()))
+
+
+if __name__ == "__main__":
+    cli()
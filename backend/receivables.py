@@ -0,0 +1,87 @@
+"""Receivables aging of open invoices by days past their due date.
+
+Open invoices fall into one of the ``AGING_BUCKETS``: ``current`` (not yet
+due), then 0-30, 31-60, 61-90 and 90+ days overdue. The buckets are computed
+in the database by one ``$match`` + ``$bucket`` over ``dueDate``, so only a
+handful of rows come back however many invoices are open; the boundaries are
+midnights counted back from the as-of date.
+"""
+import time as clock
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+AGING_BUCKETS = ["current", "0-30", "31-60", "61-90", "90+"]
+NO_DUE_DATE = "noDueDate"
+
+
+def aging_boundaries(as_of: date) -> List[datetime]:
+    """Ascending ``dueDate`` boundaries, oldest bucket (90+) first."""
+    today = datetime.combine(as_of, time.min)
+    return [datetime.min, today - timedelta(days=90), today - timedelta(days=60),
+            today - timedelta(days=30), today + timedelta(days=1), datetime.max]
+
+
+def days_overdue(due: datetime, as_of: date) -> int:
+    return (as_of - due.date()).days
+
+
+def aging_bucket(days: int) -> str:
+    if days < 0:
+        return "current"
+    if days <= 30:
+        return "0-30"
+    if days <= 60:
+        return "31-60"
+    if days <= 90:
+        return "61-90"
+    return "90+"
+
+
+async def aging(repo, filter: dict, as_of: date, amount_field: str = "totalAmount") -> dict:
+    """Invoice count and amount per aging bucket of the invoices matching ``filter``."""
+    boundaries = aging_boundaries(as_of)
+    # Boundaries run oldest-first, the buckets newest-first
+    labels = dict(zip(boundaries, reversed(AGING_BUCKETS)))
+    rows = await repo.bucket(filter, "dueDate", boundaries, NO_DUE_DATE, {"amount": amount_field})
+    found = {labels.get(row["_id"], NO_DUE_DATE): row for row in rows}
+    buckets = [{"bucket": label, "invoices": found.get(label, {}).get("count", 0),
+                "amount": round(found.get(label, {}).get("amount", 0), 2)}
+               for label in AGING_BUCKETS]
+    if NO_DUE_DATE in found:
+        buckets.append({"bucket": NO_DUE_DATE, "invoices": found[NO_DUE_DATE]["count"],
+                        "amount": round(found[NO_DUE_DATE]["amount"], 2)})
+    return {
+        "asOf": as_of.isoformat(),
+        "buckets": buckets,
+        "totalInvoices": sum(b["invoices"] for b in buckets),
+        "totalDue": round(sum(b["amount"] for b in buckets), 2),
+        "overdue": round(sum(b["amount"] for b in buckets if b["bucket"] not in ("current", NO_DUE_DATE)), 2),
+    }
+
+
+class AgingCache:
+    """Results per (company, key, as-of date), kept for ``ttl_seconds``.
+
+    Invoice writes call :meth:`invalidate` for their company, so the cache
+    only ever saves the repeat reads of an unchanged book.
+    """
+
+    def __init__(self, ttl_seconds: float = 30):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, Optional[str], date], Tuple[float, dict]] = {}
+
+    def get(self, company_id: str, key: Optional[str], as_of: date) -> Optional[dict]:
+        entry = self._entries.get((company_id, key, as_of))
+        if entry and clock.monotonic() - entry[0] <= self.ttl_seconds:
+            return entry[1]
+        return None
+
+    def put(self, company_id: str, key: Optional[str], as_of: date, value: dict):
+        if self.ttl_seconds > 0:
+            now = clock.monotonic()
+            # Drop expired entries as new ones come in, so the dict stays small
+            self._entries = {k: v for k, v in self._entries.items() if now - v[0] <= self.ttl_seconds}
+            self._entries[(company_id, key, as_of)] = (now, value)
+
+    def invalidate(self, company_id: str):
+        self._entries = {k: v for k, v in self._entries.items() if k[0] != company_id}
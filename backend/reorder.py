@@ -0,0 +1,96 @@
+"""Reorder suggestions for a whole catalogue at once.
+
+Daily demand per product comes from the ``product_sales`` rollups and is laid
+out as one products x days matrix, so every statistic below is a single NumPy
+operation over all products instead of a Python loop per SKU:
+
+* ``avgDailyDemand`` - moving average over the last ``window`` days
+* ``demandStdDev`` - day-to-day standard deviation over the same window
+* ``daysOfCover`` - current stock divided by average demand
+* ``reorderPoint`` - demand over the lead time plus safety stock of
+  ``service_z`` standard deviations scaled to the lead time
+* ``suggestedQuantity`` - for products at or below their reorder point, the
+  quantity that tops stock up to the reorder point plus ``review_days`` of
+  demand
+
+``suggestedMinStock`` is the reorder point rounded up, a drop-in value for
+``Product.minStock``.
+"""
+import math
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def demand_matrix(product_ids: Sequence[str], rows: Sequence[dict], start: datetime, days: int) -> np.ndarray:
+    """Quantity sold per product (row, in ``product_ids`` order) and day (column) from ``start``."""
+    index = {product_id: n for n, product_id in enumerate(product_ids)}
+    demand = np.zeros((len(product_ids), days), dtype=np.float64)
+    hits = [(index[row["productId"]], (row["day"] - start).days, row["quantity"]) for row in rows
+            if row["productId"] in index and 0 <= (row["day"] - start).days < days]
+    if hits:
+        products, day_numbers, quantities = (np.asarray(column) for column in zip(*hits))
+        np.add.at(demand, (products, day_numbers), quantities)
+    return demand
+
+
+def suggest(stock: np.ndarray, demand: np.ndarray, lead_time_days: float, review_days: float,
+            service_z: float) -> Dict[str, np.ndarray]:
+    """Vectorised reorder statistics; every array has one entry per product."""
+    average = demand.mean(axis=1)
+    deviation = demand.std(axis=1, ddof=1) if demand.shape[1] > 1 else np.zeros_like(average)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(average > 0, stock / average, np.inf)
+    reorder_point = average * lead_time_days + service_z * deviation * math.sqrt(lead_time_days)
+    order_up_to = reorder_point + average * review_days
+    quantity = np.where((average > 0) & (stock <= reorder_point), np.ceil(order_up_to - stock), 0)
+    return {
+        "avgDailyDemand": average,
+        "demandStdDev": deviation,
+        "daysOfCover": cover,
+        "reorderPoint": reorder_point,
+        "suggestedMinStock": np.ceil(reorder_point),
+        "suggestedQuantity": np.maximum(quantity, 0),
+    }
+
+
+def suggestion_rows(products: List[dict], stats: Dict[str, np.ndarray]) -> List[dict]:
+    """One document per product that needs reordering."""
+    rows = []
+    for n in np.flatnonzero(stats["suggestedQuantity"] > 0):
+        product = products[n]
+        quantity = int(stats["suggestedQuantity"][n])
+        cover = stats["daysOfCover"][n]
+        rows.append({
+            "productId": product["id"],
+            "name": product.get("name", ""),
+            "sku": product.get("sku", ""),
+            "supplier": product.get("supplier", ""),
+            "stock": product.get("stock", 0),
+            "minStock": product.get("minStock", 0),
+            "avgDailyDemand": round(float(stats["avgDailyDemand"][n]), 3),
+            "demandStdDev": round(float(stats["demandStdDev"][n]), 3),
+            "daysOfCover": round(float(cover), 1) if np.isfinite(cover) else None,
+            "reorderPoint": round(float(stats["reorderPoint"][n]), 2),
+            "suggestedMinStock": int(stats["suggestedMinStock"][n]),
+            "suggestedQuantity": quantity,
+            "estimatedCost": round(quantity * product.get("price", 0), 2),
+        })
+    return rows
+
+
+def group_by_supplier(rows: List[dict]) -> List[dict]:
+    """Suggestions per supplier, largest order first within each supplier."""
+    suppliers: Dict[str, List[dict]] = {}
+    for row in rows:
+        suppliers.setdefault(row.get("supplier", ""), []).append(row)
+    return [
+        {
+            "supplier": supplier,
+            "products": sorted(products, key=lambda row: -row["suggestedQuantity"]),
+            "totalQuantity": sum(row["suggestedQuantity"] for row in products),
+            "estimatedCost": round(sum(row["estimatedCost"] for row in products), 2),
+        }
+        for supplier, products in sorted(suppliers.items())
+    ]
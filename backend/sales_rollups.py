@@ -0,0 +1,92 @@
+"""Daily per-product sales rollups.
+
+Line items live inside invoices, so "what sold" would otherwise mean
+unwinding every invoice. Instead a ``product_sales`` collection keeps one
+document per company, product and day::
+
+    {"companyId", "productId", "day", "quantity", "revenue", "lines"}
+
+``revenue`` is the taxable line amount (before GST) and ``lines`` the number
+of invoice lines. Invoice writes apply the difference between the invoice's
+old and new contribution, and :func:`rebuild` recomputes a company's rollups
+from scratch with one unwind/group per invoice collection. Draft invoices are
+not sales and contribute nothing.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+Key = Tuple[str, datetime]
+SUM_FIELDS = ("quantity", "revenue", "lines")
+
+
+def contribution(invoice: Optional[dict]) -> Dict[Key, Dict[str, float]]:
+    """What ``invoice`` adds to the rollups, per (productId, day)."""
+    totals: Dict[Key, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUM_FIELDS, 0))
+    if not invoice or invoice.get("status") == "draft" or not isinstance(invoice.get("date"), datetime):
+        return totals
+    for item in invoice.get("items", []):
+        row = totals[(item["productId"], invoice["date"])]
+        row["quantity"] += item.get("quantity", 0)
+        row["revenue"] += item.get("amount", 0)
+        row["lines"] += 1
+    return totals
+
+
+async def apply_invoice_change(rollups, company_id: str, old: Optional[dict], new: Optional[dict]):
+    """Move the rollups from ``old``'s contribution to ``new``'s (either may be None)."""
+    before, after = contribution(old), contribution(new)
+    for product_id, day in set(before) | set(after):
+        old_row, new_row = before.get((product_id, day), {}), after.get((product_id, day), {})
+        delta = {field: new_row.get(field, 0) - old_row.get(field, 0) for field in SUM_FIELDS}
+        if any(delta.values()):
+            await rollups.update({"companyId": company_id, "productId": product_id, "day": day},
+                                 inc=delta, upsert=True)
+
+
+async def rebuild(rollups, sources, company_id: str) -> dict:
+    """Recompute every rollup of ``company_id`` from the invoice collections ``sources``."""
+    totals: Dict[Key, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUM_FIELDS, 0))
+    match = {"companyId": company_id, "status": {"$ne": "draft"}}
+    for source in sources:
+        rows = await source.unwind_group(
+            match, "items", keys={"productId": "items.productId", "day": "date"},
+            sums={"quantity": "items.quantity", "revenue": "items.amount"},
+        )
+        for row in rows:
+            total = totals[(row["productId"], row["day"])]
+            total["quantity"] += row["quantity"]
+            total["revenue"] += row["revenue"]
+            total["lines"] += row["count"]
+    await rollups.delete_many({"companyId": company_id})
+    await rollups.insert_many([
+        {"companyId": company_id, "productId": product_id, "day": day, **total}
+        for (product_id, day), total in totals.items()
+    ])
+    return {"rollups": len(totals)}
+
+
+def rank(rows: List[dict], by: str) -> List[dict]:
+    """Per-product totals from ``Repository.group`` rows, best seller first."""
+    ranked = [{"productId": row["_id"], "quantity": row["quantity"], "revenue": round(row["revenue"], 2),
+               "lines": row["lines"]} for row in rows if row[by] > 0]
+    return sorted(ranked, key=lambda row: (-row[by], row["productId"]))
+
+
+def abc_classes(ranked: List[dict], by: str, a_share: float = 0.8, b_share: float = 0.95) -> List[dict]:
+    """Label ``ranked`` products A, B or C by their cumulative share of ``by``.
+
+    A products make up the first ``a_share`` of the total, B the next
+    ``b_share - a_share`` and C the rest. A product is classed by the share
+    reached before it is added, so the product that crosses a boundary still
+    falls in the higher class.
+    """
+    total = sum(row[by] for row in ranked) or 1
+    classified, running = [], 0
+    for row in ranked:
+        share_before = running / total
+        running += row[by]
+        label = "A" if share_before < a_share else "B" if share_before < b_share else "C"
+        classified.append({**row, "share": round(row[by] / total, 4),
+                           "cumulativeShare": round(running / total, 4), "class": label})
+    return classified
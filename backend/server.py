@@ -1,24 +1,160 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Response, Request, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import numpy as np
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
 import os
+import re
+import json
+import asyncio
+import hashlib
+import hmac
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta, timezone
+# Alias for models with a field named ``date``, whose default would shadow the type
+from datetime import date as Date
 from enum import Enum
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from admission import AdmissionLimiter, AdmissionControlMiddleware
+from budgets import QueryBudgetMiddleware, database_error_handler
+from batching import BatchWriter
+from backup import BackupError, export_archive, restore_archive
+from excel_export import (INVENTORY_HEADERS, INVOICE_HEADERS, XLSX_MEDIA_TYPE,
+                          invoice_rows, iter_file, product_rows, write_workbook)
+from gst import HsnRateTable, compute_invoice, compute_invoices, summarize
+from jobs import JobQueue
+from reorder import demand_matrix, group_by_supplier, suggest, suggestion_rows
+from receivables import AgingCache, aging, aging_bucket, days_overdue
+from sales_rollups import abc_classes, apply_invoice_change, rank, rebuild
+from storage import DuplicateKey, MotorStorage, SQLiteStorage
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional; fall back to gzip only
+    BrotliMiddleware = None
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'inventory_system')]
+# Storage backend: "mongo" (MONGO_URL/DB_NAME) or "sqlite", an embedded
+# database at SQLITE_PATH for single-node installs (":memory:" for tests)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+if STORAGE_BACKEND == 'sqlite':
+    client = None
+    db = None
+    store = SQLiteStorage(os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'inventory.sqlite3')))
+else:
+    # MongoDB connection
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ.get('DB_NAME', 'inventory_system')]
+    store = MotorStorage(db)
+
+# Tenant used when a request names no company (single-business installs)
+DEFAULT_COMPANY_ID = os.environ.get('DEFAULT_COMPANY_ID', 'default')
+
+# How long an Idempotency-Key replays its stored response, and how many
+# completed keys each process keeps in memory in front of Mongo
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '1024'))
+# A key left pending this long belongs to a request that died without
+# releasing it, and a retry may take it over; keep it above the slowest write
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = int(os.environ.get('IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS', '60'))
+
+# Admission control: concurrent requests and queued requests per endpoint class
+ADMISSION_LIMITS = {
+    "interactive": (int(os.environ.get('ADMISSION_INTERACTIVE_CONCURRENCY', '64')),
+                    int(os.environ.get('ADMISSION_INTERACTIVE_QUEUE', '256'))),
+    "bulk": (int(os.environ.get('ADMISSION_BULK_CONCURRENCY', '2')),
+             int(os.environ.get('ADMISSION_BULK_QUEUE', '8'))),
+    "reports": (int(os.environ.get('ADMISSION_REPORTS_CONCURRENCY', '4')),
+                int(os.environ.get('ADMISSION_REPORTS_QUEUE', '16'))),
+    # POST /api/status only appends to the status write batch, so bursts get a
+    # wide lane of their own instead of taking interactive slots
+    "heartbeat": (int(os.environ.get('ADMISSION_HEARTBEAT_CONCURRENCY', '256')),
+                  int(os.environ.get('ADMISSION_HEARTBEAT_QUEUE', '4096'))),
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '30'))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))
+
+# Database time budget (maxTimeMS) per endpoint class; 0 means unlimited
+QUERY_BUDGETS = {
+    "interactive": int(os.environ.get('QUERY_BUDGET_INTERACTIVE_MS', '5000')) / 1000,
+    "bulk": int(os.environ.get('QUERY_BUDGET_BULK_MS', '0')) / 1000,
+    "reports": int(os.environ.get('QUERY_BUDGET_REPORTS_MS', '60000')) / 1000,
+    "heartbeat": int(os.environ.get('QUERY_BUDGET_HEARTBEAT_MS', '5000')) / 1000,
+}
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# Deleted documents leave tombstones for delta sync clients for this long
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '1000'))
+
+# Shared secret for /api/admin endpoints (X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Seconds between per-product stock snapshots (0 disables the scheduler)
+STOCK_SNAPSHOT_INTERVAL = int(os.environ.get('STOCK_SNAPSHOT_INTERVAL', '86400'))
+
+# Paid invoices older than this many days are moved to invoices_archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+
+# Seconds between sweeps that flip past-due pending invoices to overdue (0 disables)
+OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', '3600'))
+
+# Background job workers per process (0 only enqueues), lease length in
+# seconds, attempts before a job is failed and the base retry backoff
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', '5'))
+
+# Seconds the HSN -> GST rate table is cached per process
+HSN_RATE_CACHE_SECONDS = int(os.environ.get('HSN_RATE_CACHE_SECONDS', '300'))
+# Invoices accepted by one POST /api/gst/calculate
+MAX_GST_BATCH = int(os.environ.get('MAX_GST_BATCH', '5000'))
+
+# Seconds a statement or aging report is reused while the company's invoices are unchanged
+AGING_CACHE_SECONDS = int(os.environ.get('AGING_CACHE_SECONDS', '30'))
+
+# Reorder suggestions: days of demand history averaged, supplier lead time and
+# review period in days, safety-stock z-score, and seconds between scheduled
+# runs for every company (0 disables the scheduler)
+REORDER_WINDOW_DAYS = int(os.environ.get('REORDER_WINDOW_DAYS', '28'))
+REORDER_LEAD_TIME_DAYS = float(os.environ.get('REORDER_LEAD_TIME_DAYS', '7'))
+REORDER_REVIEW_DAYS = float(os.environ.get('REORDER_REVIEW_DAYS', '14'))
+REORDER_SERVICE_Z = float(os.environ.get('REORDER_SERVICE_Z', '1.65'))
+REORDER_INTERVAL = int(os.environ.get('REORDER_INTERVAL', '86400'))
+
+# POST /api/status records are written in batches of up to STATUS_BATCH_SIZE,
+# at most STATUS_BATCH_DELAY_MS after the first one is queued. In "batched"
+# mode the request returns once its record is queued; "durable" waits for the
+# write that carries it
+STATUS_BATCH_SIZE = int(os.environ.get('STATUS_BATCH_SIZE', '500'))
+STATUS_BATCH_DELAY_MS = int(os.environ.get('STATUS_BATCH_DELAY_MS', '50'))
+STATUS_WRITE_MODE = os.environ.get('STATUS_WRITE_MODE', 'batched')
+# Status checks expire after this many days (0 keeps them forever); history
+# pages return at most STATUS_PAGE_SIZE checks
+STATUS_RETENTION_DAYS = int(os.environ.get('STATUS_RETENTION_DAYS', '30'))
+STATUS_PAGE_SIZE = int(os.environ.get('STATUS_PAGE_SIZE', '1000'))
 
 # Create the main app without a prefix
 app = FastAPI(title="Inventory Management System", version="1.0.0")
@@ -26,6 +162,9 @@ app = FastAPI(title="Inventory Management System", version="1.0.0")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Company-scoped routes, mounted under /api and /api/companies/{company_id}
+tenant_router = APIRouter()
+
 
 # Define Models
 class StatusEnum(str, Enum):
@@ -38,6 +177,8 @@ class StatusEnum(str, Enum):
 
 class Product(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    companyId: str = DEFAULT_COMPANY_ID
+    changeSeq: int = 0
     name: str
     sku: str
     category: str
@@ -48,7 +189,7 @@ class Product(BaseModel):
     hsn: str = ""
     gstRate: int = 18
     supplier: str = ""
-    lastUpdated: str = Field(default_factory=lambda: datetime.now().strftime('%Y-%m-%d'))
+    lastUpdated: datetime = Field(default_factory=datetime.now)
 
 class ProductCreate(BaseModel):
     name: str
@@ -76,6 +217,8 @@ class ProductUpdate(BaseModel):
 
 class Customer(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    companyId: str = DEFAULT_COMPANY_ID
+    changeSeq: int = 0
     name: str
     email: str
     phone: str
@@ -136,11 +279,16 @@ class InvoiceItem(BaseModel):
     price: float
     unit: str = "piece"
     hsn: str = ""
-    gstRate: int = 18
+    gstRate: float = 18
     amount: float
+    cgst: float = 0
+    sgst: float = 0
+    igst: float = 0
 
 class Invoice(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    companyId: str = DEFAULT_COMPANY_ID
+    changeSeq: int = 0
     invoiceNumber: str
     customerId: str
     customerName: str
@@ -148,10 +296,15 @@ class Invoice(BaseModel):
     customerPhone: str = ""
     customerAddress: str = ""
     customerGSTIN: str = ""
-    date: str
-    dueDate: str
+    date: date
+    dueDate: date
     items: List[InvoiceItem]
     amount: float
+    supplyType: str = ""
+    placeOfSupply: str = ""
+    cgstAmount: float = 0
+    sgstAmount: float = 0
+    igstAmount: float = 0
     gstAmount: float
     totalAmount: float
     notes: str = ""
@@ -165,8 +318,8 @@ class InvoiceCreate(BaseModel):
     customerPhone: str = ""
     customerAddress: str = ""
     customerGSTIN: str = ""
-    date: str
-    dueDate: str
+    date: date
+    dueDate: date
     items: List[InvoiceItem]
     notes: str = ""
     status: StatusEnum = StatusEnum.draft
@@ -179,12 +332,95 @@ class InvoiceUpdate(BaseModel):
     customerPhone: Optional[str] = None
     customerAddress: Optional[str] = None
     customerGSTIN: Optional[str] = None
-    date: Optional[str] = None
-    dueDate: Optional[str] = None
+    date: Optional[Date] = None
+    dueDate: Optional[Date] = None
     items: Optional[List[InvoiceItem]] = None
     notes: Optional[str] = None
     status: Optional[StatusEnum] = None
 
+class GstInvoiceInput(BaseModel):
+    items: List[InvoiceItem]
+    customerGSTIN: str = ""
+
+class GstBatchRequest(BaseModel):
+    invoices: List[GstInvoiceInput] = Field(..., max_length=MAX_GST_BATCH)
+    # Defaults to the company's own GSTIN
+    supplierGSTIN: Optional[str] = None
+
+class GstComputation(BaseModel):
+    items: List[InvoiceItem]
+    supplyType: str
+    placeOfSupply: str
+    amount: float
+    cgstAmount: float
+    sgstAmount: float
+    igstAmount: float
+    gstAmount: float
+    totalAmount: float
+
+class HsnRate(BaseModel):
+    hsn: str = Field(..., pattern=r"^\d{2,8}$")
+    rate: float = Field(..., ge=0, le=100)
+    description: str = ""
+
+class PropagationTask(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    companyId: str
+    customerId: str
+    status: str = "queued"
+    matched: int = 0
+    modified: int = 0
+    error: Optional[str] = None
+    createdAt: str = Field(default_factory=lambda: datetime.now().isoformat())
+    completedAt: Optional[str] = None
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    companyId: Optional[str] = None
+    params: Dict[str, Any] = {}
+    status: str
+    attempts: int = 0
+    maxAttempts: int
+    progress: Dict[str, Any] = {}
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    createdAt: datetime
+    updatedAt: datetime
+    runAt: datetime
+    finishedAt: Optional[datetime] = None
+
+class StockMovementReason(str, Enum):
+    initial = "initial"
+    adjustment = "adjustment"
+    invoice = "invoice"
+    import_ = "import"
+    return_ = "return"
+
+class StockMovement(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    companyId: str
+    productId: str
+    quantity: int
+    balance: int
+    reason: StockMovementReason
+    reference: str = ""
+    note: str = ""
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StockMovementCreate(BaseModel):
+    quantity: int
+    reason: StockMovementReason = StockMovementReason.adjustment
+    reference: str = ""
+    note: str = ""
+
+class StockLevel(BaseModel):
+    productId: str
+    at: datetime
+    stock: int
+    snapshotAt: Optional[datetime] = None
+    movementsApplied: int
+
 # Basic status check models
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -194,219 +430,1492 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusHistoryPage(BaseModel):
+    items: List[StatusCheck]
+    hasMore: bool
+    # Pass back as before/before_id for the next (older) page
+    nextBefore: Optional[datetime] = None
+    nextBeforeId: Optional[str] = None
+
+# Batched lookup models
+MAX_LOOKUP_IDS = 1000
+
+class LookupRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=MAX_LOOKUP_IDS)
+
+class ProductLookupResponse(BaseModel):
+    items: List[Product]
+    missing: List[str]
+
+class CustomerLookupResponse(BaseModel):
+    items: List[Customer]
+    missing: List[str]
+
+class InvoiceLookupResponse(BaseModel):
+    items: List[Invoice]
+    missing: List[str]
+
+# Rows of each kind accepted by one POST /api/import/validate
+MAX_IMPORT_ROWS = 10000
+
+class ImportProductRow(BaseModel):
+    sku: str
+    name: str = ""
+
+class ImportItemReference(BaseModel):
+    productId: str = ""
+    sku: str = ""
+
+class ImportInvoiceRow(BaseModel):
+    invoiceNumber: str
+    customerId: str = ""
+    # Used to find the customer when customerId is not one of theirs (spreadsheet imports)
+    customerName: str = ""
+    customerGSTIN: str = ""
+    customerEmail: str = ""
+    items: List[ImportItemReference] = []
+
+class ImportValidationRequest(BaseModel):
+    products: List[ImportProductRow] = Field([], max_length=MAX_IMPORT_ROWS)
+    invoices: List[ImportInvoiceRow] = Field([], max_length=MAX_IMPORT_ROWS)
+
+class ImportRowStatus(str, Enum):
+    new = "new"
+    update = "update"
+    conflict = "conflict"
+    missing_reference = "missing-reference"
+
+class ImportRowResult(BaseModel):
+    row: int
+    key: str
+    status: ImportRowStatus
+    existingId: Optional[str] = None
+    # Invoices only: the existing customer the row was matched to
+    customerId: Optional[str] = None
+    problems: List[str] = []
+
+class ImportValidationResponse(BaseModel):
+    products: List[ImportRowResult]
+    invoices: List[ImportRowResult]
+    summary: Dict[str, Dict[str, int]]
+
+
+# Customer fields copied onto invoices so invoice reads need no join
+CUSTOMER_INVOICE_FIELDS = {
+    "name": "customerName",
+    "email": "customerEmail",
+    "phone": "customerPhone",
+    "address": "customerAddress",
+    "gstin": "customerGSTIN",
+}
+
+# Invoices in these states still get customer changes; paid ones are final
+OPEN_INVOICE_STATUSES = [StatusEnum.draft.value, StatusEnum.pending.value, StatusEnum.overdue.value]
+
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware query parameters to match."""
+    if value and value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def to_bson_date(value: date) -> datetime:
+    """BSON has no date-only type, so calendar dates are stored as midnight datetimes."""
+    return datetime.combine(value, time.min)
+
+def invoice_dates_to_bson(invoice_dict: dict) -> dict:
+    for field in ("date", "dueDate"):
+        if isinstance(invoice_dict.get(field), date) and not isinstance(invoice_dict[field], datetime):
+            invoice_dict[field] = to_bson_date(invoice_dict[field])
+    return invoice_dict
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Gate for operator endpoints that reach across tenants; closed unless ADMIN_TOKEN is set."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: ADMIN_TOKEN is not configured")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+async def get_company_id(request: Request, x_company_id: Optional[str] = Header(None)) -> str:
+    """Resolve the tenant from the /companies/{company_id}/ path or X-Company-Id header."""
+    return request.path_params.get("company_id") or x_company_id or DEFAULT_COMPANY_ID
+
+
+async def lookup_by_ids(collection, ids: List[str], scope: Optional[dict] = None):
+    """Fetch documents for ``ids`` with a single ``$in`` query.
+
+    Returns the documents in request order (duplicates collapsed) along with
+    the ids that did not match anything.
+    """
+    ordered_ids = list(dict.fromkeys(ids))
+    if not ordered_ids:
+        return [], []
+    query = {**(scope or {}), "id": {"$in": ordered_ids}}
+    docs = await collection.list(query, limit=len(ordered_ids))
+    by_id = {doc["id"]: doc for doc in docs}
+    found = [by_id[i] for i in ordered_ids if i in by_id]
+    missing = [i for i in ordered_ids if i not in by_id]
+    return found, missing
+
+# ========== CHANGE TRACKING ==========
+# Entities whose changes are published through GET /api/sync
+SYNC_COLLECTIONS = ("products", "customers", "invoices")
+
+# Lowest sequence number of every reservation whose write has not finished.
+# This lives in process memory, so /sync is only gap-free with one server
+# process (see warn_if_multiple_workers)
+writes_in_flight: Counter = Counter()
+last_change_seq = 0
+
+def warn_if_multiple_workers():
+    # uvicorn and gunicorn both take their default worker count from WEB_CONCURRENCY
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1") or 1)
+    if workers > 1:
+        logger.warning("WEB_CONCURRENCY=%d: open change sequence reservations are tracked per process, "
+                       "so /api/sync can skip writes that commit late in another worker. "
+                       "Run a single server process.", workers)
+
+async def next_change_seq(count: int = 1) -> int:
+    """Reserve ``count`` change sequence numbers and return the highest one."""
+    global last_change_seq
+    counter = await store.counters.find_one_and_update({"_id": "changeSeq"}, inc={"seq": count}, upsert=True)
+    last_change_seq = max(last_change_seq, counter["seq"])
+    return counter["seq"]
+
+def release_change_seq(low: int):
+    writes_in_flight[low] -= 1
+    if writes_in_flight[low] <= 0:
+        del writes_in_flight[low]
+
+@asynccontextmanager
+async def reserve_change_seq(count: int = 1):
+    """Reserve change sequence numbers for the write done inside the block.
+
+    Numbers are handed out before the documents are written, so concurrent
+    writes can commit out of order. /sync never moves past a reservation that
+    is still open, so a change that commits late is not skipped.
+    """
+    # Hold the lowest number the counter can return until the real one is known
+    held = last_change_seq + 1
+    writes_in_flight[held] += 1
+    try:
+        seq = await next_change_seq(count)
+        release_change_seq(held)
+        held = seq - count + 1
+        writes_in_flight[held] += 1
+        yield seq
+    finally:
+        release_change_seq(held)
+
+async def record_tombstones(entity: str, company_id: str, ids: List[str]):
+    if not ids:
+        return
+    deleted_at = datetime.utcnow()
+    async with reserve_change_seq() as seq:
+        await store.tombstones.insert_many([
+            {"entity": entity, "id": doc_id, "companyId": company_id,
+             "changeSeq": seq, "deletedAt": deleted_at}
+            for doc_id in ids
+        ])
+
+
+# ========== SPARSE FIELDSETS ==========
+def parse_fields(fields: Optional[str], model) -> Optional[dict]:
+    """Turn ``?fields=a,b`` into a Mongo projection; ``id`` is always returned."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return {"_id": 0, "id": 1, **{name: 1 for name in names}}
+
+@lru_cache(maxsize=None)
+def field_adapter(model, name: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[name].annotation)
+
+def serialize_partial(doc: dict, model) -> dict:
+    """Serialise a projected document field by field, as the full model would."""
+    partial = {}
+    for name, value in doc.items():
+        if name in model.model_fields:
+            adapter = field_adapter(model, name)
+            partial[name] = adapter.dump_python(adapter.validate_python(value), mode="json")
+    return partial
+
+def sparse_response(docs, model) -> JSONResponse:
+    if isinstance(docs, list):
+        return JSONResponse([serialize_partial(doc, model) for doc in docs])
+    return JSONResponse(serialize_partial(docs, model))
+
+
+# ========== ADMISSION CONTROL ==========
+admission_limiters = {
+    name: AdmissionLimiter(name, concurrency, queue_size, ADMISSION_QUEUE_TIMEOUT)
+    for name, (concurrency, queue_size) in ADMISSION_LIMITS.items()
+}
+
+# Matched against the path after /api (and after /companies/{id} for tenant routes)
+BULK_ENDPOINTS = re.compile(
+    r"/(seed|invoices/archive|admin/backup|admin/restore|gst/calculate|import/validate|sales/rollups/rebuild"
+    r"|reorder-suggestions/run)$"
+)
+REPORT_ENDPOINTS = re.compile(
+    r"/(tenants/usage|products/export\.xlsx|invoices/export\.xlsx|gst/summary|receivables/aging|statement"
+    r"|sales/top-products|sales/abc|reorder-suggestions)$"
+)
+
+def classify_endpoint(path: str, method: str = "GET") -> Optional[str]:
+    if not path.startswith("/api") or path.startswith("/api/metrics"):
+        return None
+    if method == "POST" and path == "/api/status":
+        return "heartbeat"
+    if BULK_ENDPOINTS.search(path):
+        return "bulk"
+    if REPORT_ENDPOINTS.search(path):
+        return "reports"
+    return "interactive"
+
+
+# ========== IDEMPOTENCY ==========
+idempotency_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+def remember_idempotent_response(record_id: str, record: dict):
+    idempotency_cache[record_id] = record
+    idempotency_cache.move_to_end(record_id)
+    while len(idempotency_cache) > IDEMPOTENCY_CACHE_SIZE:
+        idempotency_cache.popitem(last=False)
+
+def recall_idempotent_response(record_id: str) -> Optional[dict]:
+    record = idempotency_cache.get(record_id)
+    if record and record["createdAt"] + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS) < datetime.utcnow():
+        del idempotency_cache[record_id]
+        return None
+    return record
+
+async def claim_idempotency_key(record_id: str, fingerprint: str, now: datetime) -> bool:
+    """Claim a key with a pending placeholder, or take over a stale pending claim."""
+    try:
+        await store.idempotency_keys.insert({
+            "_id": record_id, "fingerprint": fingerprint,
+            "status": "pending", "createdAt": now, "claimedAt": now,
+        })
+        return True
+    except DuplicateKey:
+        pass
+    # Matching on the old claimedAt lets only one of several retries win the takeover
+    stale = now - timedelta(seconds=IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS)
+    taken = await store.idempotency_keys.find_one_and_update(
+        {"_id": record_id, "status": "pending", "fingerprint": fingerprint, "claimedAt": {"$lt": stale}},
+        set={"claimedAt": now},
+    )
+    return taken is not None
+
+async def run_idempotent(key: Optional[str], scope: str, payload: BaseModel, create):
+    """Run ``create`` at most once per Idempotency-Key.
+
+    The key is claimed with a placeholder document before the write so that
+    concurrent retries cannot both execute; a replay returns the stored
+    response body. Reusing a key with a different payload is rejected. A
+    claim is a lease: one still pending after IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS
+    is taken over by the next retry, so a crashed request cannot wedge its key.
+    """
+    if not key:
+        return await create()
+    
+    record_id = f"{scope}:{key}"
+    fingerprint = hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True).encode()
+    ).hexdigest()
+    
+    record = recall_idempotent_response(record_id)
+    if record is None:
+        created_at = datetime.utcnow()
+        if not await claim_idempotency_key(record_id, fingerprint, created_at):
+            record = await store.idempotency_keys.get({"_id": record_id})
+            if not record or (record["status"] != "completed" and record["fingerprint"] == fingerprint):
+                raise HTTPException(status_code=409,
+                                    detail="A request with this Idempotency-Key is still in progress")
+        else:
+            try:
+                result = await create()
+            except BaseException:
+                # Release the key so the client can retry a failed or cancelled write,
+                # even when the request's query budget is already spent
+                # (only our own claim, in case a retry has since taken it over)
+                with pymongo.timeout(None):
+                    await store.idempotency_keys.delete({"_id": record_id, "claimedAt": created_at})
+                raise
+            response = jsonable_encoder(result)
+            await store.idempotency_keys.update(
+                {"_id": record_id, "claimedAt": created_at}, set={"status": "completed", "response": response}
+            )
+            remember_idempotent_response(record_id, {
+                "fingerprint": fingerprint, "response": response, "createdAt": created_at,
+            })
+            return result
+    
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422,
+                            detail="Idempotency-Key was already used with a different request body")
+    remember_idempotent_response(record_id, record)
+    return JSONResponse(record["response"], headers={"Idempotent-Replayed": "true"})
+
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Inventory Management System API"}
 
+status_writer = BatchWriter(store.status_checks, max_records=STATUS_BATCH_SIZE,
+                            max_delay=STATUS_BATCH_DELAY_MS / 1000)
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await status_writer.submit(status_obj.dict(), durable=STATUS_WRITE_MODE == "durable")
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+    """The most recent checks, newest first (see /status/history for paging)."""
+    status_checks = await store.status_checks.list({}, sort=[("timestamp", -1), ("id", -1)],
+                                              limit=STATUS_PAGE_SIZE)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+@api_router.get("/status/latest", response_model=List[StatusCheck])
+async def get_latest_status_checks():
+    """The most recent check of every client, by client name."""
+    latest = await store.status_checks.latest_by({}, "client_name", "timestamp", {"_id": 0})
+    return [StatusCheck(**status_check) for status_check in latest]
+
+@api_router.get("/status/history", response_model=StatusHistoryPage)
+async def get_status_history(client_name: Optional[str] = None, since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, before: Optional[datetime] = None,
+                             before_id: Optional[str] = None,
+                             limit: int = Query(100, ge=1)):
+    """Checks in ``[since, until]``, newest first, one page at a time.
+
+    Pages are keyset-paginated on (timestamp, id): pass the returned
+    ``nextBefore``/``nextBeforeId`` as ``before``/``before_id`` to get the next,
+    older page, until ``hasMore`` is false.
+    """
+    limit = min(limit, STATUS_PAGE_SIZE)
+    since, until, before = (as_naive_utc(value) for value in (since, until, before))
+    query: Dict[str, Any] = {}
+    if client_name is not None:
+        query["client_name"] = client_name
+    bounds = {"$gte": since, "$lte": until, "$lt": None if before_id else before}
+    bounds = {op: value for op, value in bounds.items() if value}
+    if bounds:
+        query["timestamp"] = bounds
+    if before and before_id:
+        query["$or"] = [{"timestamp": {"$lt": before}}, {"timestamp": before, "id": {"$lt": before_id}}]
+    docs = await store.status_checks.list(query, {"_id": 0}, sort=[("timestamp", -1), ("id", -1)], limit=limit + 1)
+    has_more = len(docs) > limit
+    items = [StatusCheck(**doc) for doc in docs[:limit]]
+    return StatusHistoryPage(
+        items=items, hasMore=has_more,
+        nextBefore=items[-1].timestamp if has_more else None,
+        nextBeforeId=items[-1].id if has_more else None,
+    )
+
 
 # ========== PRODUCT ENDPOINTS ==========
-@api_router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate):
-    product_dict = product.dict()
-    if not product_dict.get('sku'):
-        product_dict['sku'] = f"SKU-{datetime.now().timestamp()}"
+@tenant_router.post("/products", response_model=Product)
+async def create_product(product: ProductCreate, tenant_id: str = Depends(get_company_id),
+                         idempotency_key: Optional[str] = Header(None)):
+    async def create():
+        product_dict = product.dict()
+        if not product_dict.get('sku'):
+            product_dict['sku'] = f"SKU-{datetime.now().timestamp()}"
+        
+        async with reserve_change_seq() as seq:
+            product_obj = Product(**product_dict, companyId=tenant_id, changeSeq=seq)
+            await store.products.insert(product_obj.dict())
+        if product_obj.stock:
+            await record_stock_movement(tenant_id, product_obj.id, product_obj.stock,
+                                        product_obj.stock, StockMovementReason.initial)
+        return product_obj
     
-    product_obj = Product(**product_dict)
-    await db.products.insert_one(product_obj.dict())
-    return product_obj
+    return await run_idempotent(idempotency_key, f"{tenant_id}:products", product, create)
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find().to_list(1000)
+@tenant_router.get("/products", response_model=List[Product])
+async def get_products(fields: Optional[str] = None, tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Product)
+    products = await store.products.list({"companyId": tenant_id}, projection, limit=1000)
+    if projection:
+        return sparse_response(products, Product)
     return [Product(**product) for product in products]
 
-@api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
+@tenant_router.get("/products/export.xlsx")
+async def export_products(tenant_id: str = Depends(get_company_id)):
+    """Stream every product as a workbook in the inventory import layout."""
+    cursor = store.products.iterate({"companyId": tenant_id}, sort=[("name", 1)])
+    workbook = await write_workbook([cursor], INVENTORY_HEADERS, product_rows, "Inventory")
+    return xlsx_response(workbook, "inventory")
+
+@tenant_router.post("/products/lookup", response_model=ProductLookupResponse)
+async def lookup_products(request: LookupRequest, tenant_id: str = Depends(get_company_id)):
+    found, missing = await lookup_by_ids(store.products, request.ids, {"companyId": tenant_id})
+    return ProductLookupResponse(items=[Product(**p) for p in found], missing=missing)
+
+@tenant_router.get("/products/{product_id}", response_model=Product)
+async def get_product(product_id: str, fields: Optional[str] = None,
+                      tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Product)
+    product = await store.products.get({"id": product_id, "companyId": tenant_id}, projection)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    if projection:
+        return sparse_response(product, Product)
     return Product(**product)
 
-@api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product: ProductUpdate):
-    existing_product = await db.products.find_one({"id": product_id})
+@tenant_router.put("/products/{product_id}", response_model=Product)
+async def update_product(product_id: str, product: ProductUpdate, tenant_id: str = Depends(get_company_id)):
+    existing_product = await store.products.get({"id": product_id, "companyId": tenant_id})
     if not existing_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = {k: v for k, v in product.dict().items() if v is not None}
-    update_data['lastUpdated'] = datetime.now().strftime('%Y-%m-%d')
+    update_data['lastUpdated'] = datetime.now()
     
-    await db.products.update_one({"id": product_id}, {"$set": update_data})
-    updated_product = await db.products.find_one({"id": product_id})
+    async with reserve_change_seq() as seq:
+        update_data['changeSeq'] = seq
+        # Read the previous stock atomically so the ledger records the exact delta
+        previous = await store.products.find_one_and_update(
+            {"id": product_id, "companyId": tenant_id}, set=update_data, return_new=False,
+        )
+    if previous and 'stock' in update_data and update_data['stock'] != previous.get('stock', 0):
+        await record_stock_movement(tenant_id, product_id, update_data['stock'] - previous.get('stock', 0),
+                                    update_data['stock'], StockMovementReason.adjustment)
+    updated_product = await store.products.get({"id": product_id, "companyId": tenant_id})
     return Product(**updated_product)
 
-@api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str):
-    result = await db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+@tenant_router.delete("/products/{product_id}")
+async def delete_product(product_id: str, tenant_id: str = Depends(get_company_id)):
+    if not await store.products.delete({"id": product_id, "companyId": tenant_id}):
         raise HTTPException(status_code=404, detail="Product not found")
+    await record_tombstones("products", tenant_id, [product_id])
     return {"message": "Product deleted successfully"}
 
 
+# ========== STOCK LEDGER ==========
+async def record_stock_movement(company_id: str, product_id: str, quantity: int, balance: int,
+                                reason: StockMovementReason, reference: str = "", note: str = ""):
+    movement = StockMovement(companyId=company_id, productId=product_id, quantity=quantity,
+                             balance=balance, reason=reason, reference=reference, note=note)
+    await store.stock_movements.insert(movement.dict())
+    return movement
+
+@tenant_router.post("/products/{product_id}/stock-movements", response_model=StockMovement)
+async def create_stock_movement(product_id: str, movement: StockMovementCreate,
+                                tenant_id: str = Depends(get_company_id)):
+    """Apply a stock delta (sale, receipt, correction) and record it in the ledger."""
+    async with reserve_change_seq() as seq:
+        product = await store.products.find_one_and_update(
+            {"id": product_id, "companyId": tenant_id},
+            inc={"stock": movement.quantity},
+            set={"lastUpdated": datetime.now(), "changeSeq": seq},
+        )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return await record_stock_movement(tenant_id, product_id, movement.quantity, product["stock"],
+                                       movement.reason, movement.reference, movement.note)
+
+@tenant_router.get("/products/{product_id}/stock-movements", response_model=List[StockMovement])
+async def get_stock_movements(product_id: str, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, limit: int = 100,
+                              tenant_id: str = Depends(get_company_id)):
+    query = {"companyId": tenant_id, "productId": product_id}
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lte"] = until
+    limit = max(1, min(limit, 1000))
+    movements = await store.stock_movements.list(query, sort=[("timestamp", -1)], limit=limit)
+    return [StockMovement(**movement) for movement in movements]
+
+@tenant_router.get("/products/{product_id}/stock", response_model=StockLevel)
+async def get_stock_at(product_id: str, at: Optional[datetime] = None,
+                       tenant_id: str = Depends(get_company_id)):
+    """Stock level at ``at``: the latest snapshot before it plus the movements since."""
+    at = at or datetime.utcnow()
+    scope = {"companyId": tenant_id, "productId": product_id}
+    snapshot = await store.stock_snapshots.get(
+        {**scope, "timestamp": {"$lte": at}}, sort=[("timestamp", -1)]
+    )
+    window = {"$lte": at}
+    if snapshot:
+        window["$gt"] = snapshot["timestamp"]
+    totals = await store.stock_movements.group({**scope, "timestamp": window}, sums={"quantity": "quantity"})
+    movements = totals[0] if totals else {"quantity": 0, "count": 0}
+    if not snapshot and not movements["count"]:
+        # No history at all: distinguish an unknown product from an empty ledger
+        if not await store.products.get({"id": product_id, "companyId": tenant_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Product not found")
+    return StockLevel(
+        productId=product_id,
+        at=at,
+        stock=(snapshot["stock"] if snapshot else 0) + movements["quantity"],
+        snapshotAt=snapshot["timestamp"] if snapshot else None,
+        movementsApplied=movements["count"],
+    )
+
+async def snapshot_stock_levels(batch_size: int = 1000):
+    """Record every product's current stock so stock-at-date reads stay bounded.
+
+    Each batch is stamped after its products were read, so movements made
+    while a long scan runs are not both in the stock figure and dated after
+    the snapshot, which would count them twice in stock-at-date reads.
+    """
+    batch = []
+    written = 0
+    timestamp = None
+
+    async def write():
+        nonlocal written, timestamp
+        timestamp = datetime.utcnow()
+        await store.stock_snapshots.insert_many([{**snapshot, "timestamp": timestamp} for snapshot in batch])
+        written += len(batch)
+        batch.clear()
+
+    async for product in store.products.iterate({}, {"_id": 0, "id": 1, "companyId": 1, "stock": 1}):
+        batch.append({"companyId": product.get("companyId", DEFAULT_COMPANY_ID), "productId": product["id"],
+                      "stock": product.get("stock", 0)})
+        if len(batch) >= batch_size:
+            await write()
+    if batch:
+        await write()
+    logger.info("Wrote %d stock snapshots", written)
+    return {"snapshots": written, "timestamp": timestamp}
+
+async def run_stock_snapshotter():
+    delay = 0
+    try:
+        # Pick up the schedule where the last run left it, so a restart
+        # neither skips a snapshot nor takes an extra one
+        latest = await store.stock_snapshots.get({}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", -1)])
+        if latest:
+            elapsed = (datetime.utcnow() - latest["timestamp"]).total_seconds()
+            delay = max(0, STOCK_SNAPSHOT_INTERVAL - elapsed)
+    except Exception:
+        logger.exception("Could not read the last stock snapshot")
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await snapshot_stock_levels()
+        except Exception:
+            logger.exception("Stock snapshot failed")
+        delay = STOCK_SNAPSHOT_INTERVAL
+
+
 # ========== CUSTOMER ENDPOINTS ==========
-@api_router.post("/customers", response_model=Customer)
-async def create_customer(customer: CustomerCreate):
-    customer_dict = customer.dict()
-    customer_obj = Customer(**customer_dict)
-    await db.customers.insert_one(customer_obj.dict())
-    return customer_obj
-
-@api_router.get("/customers", response_model=List[Customer])
-async def get_customers():
-    customers = await db.customers.find().to_list(1000)
+@tenant_router.post("/customers", response_model=Customer)
+async def create_customer(customer: CustomerCreate, tenant_id: str = Depends(get_company_id),
+                          idempotency_key: Optional[str] = Header(None)):
+    async def create():
+        customer_dict = customer.dict()
+        async with reserve_change_seq() as seq:
+            customer_obj = Customer(**customer_dict, companyId=tenant_id, changeSeq=seq)
+            await store.customers.insert(customer_obj.dict())
+        return customer_obj
+    
+    return await run_idempotent(idempotency_key, f"{tenant_id}:customers", customer, create)
+
+@tenant_router.get("/customers", response_model=List[Customer])
+async def get_customers(fields: Optional[str] = None, tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Customer)
+    customers = await store.customers.list({"companyId": tenant_id}, projection, limit=1000)
+    if projection:
+        return sparse_response(customers, Customer)
     return [Customer(**customer) for customer in customers]
 
-@api_router.get("/customers/{customer_id}", response_model=Customer)
-async def get_customer(customer_id: str):
-    customer = await db.customers.find_one({"id": customer_id})
+@tenant_router.post("/customers/lookup", response_model=CustomerLookupResponse)
+async def lookup_customers(request: LookupRequest, tenant_id: str = Depends(get_company_id)):
+    found, missing = await lookup_by_ids(store.customers, request.ids, {"companyId": tenant_id})
+    return CustomerLookupResponse(items=[Customer(**c) for c in found], missing=missing)
+
+@tenant_router.get("/customers/{customer_id}", response_model=Customer)
+async def get_customer(customer_id: str, fields: Optional[str] = None,
+                       tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Customer)
+    customer = await store.customers.get({"id": customer_id, "companyId": tenant_id}, projection)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
+    if projection:
+        return sparse_response(customer, Customer)
     return Customer(**customer)
 
-@api_router.put("/customers/{customer_id}", response_model=Customer)
-async def update_customer(customer_id: str, customer: CustomerUpdate):
-    existing_customer = await db.customers.find_one({"id": customer_id})
+@tenant_router.put("/customers/{customer_id}", response_model=Customer)
+async def update_customer(customer_id: str, customer: CustomerUpdate,
+                          background_tasks: BackgroundTasks, response: Response,
+                          tenant_id: str = Depends(get_company_id)):
+    existing_customer = await store.customers.get({"id": customer_id, "companyId": tenant_id})
     if not existing_customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     update_data = {k: v for k, v in customer.dict().items() if v is not None}
     
-    await db.customers.update_one({"id": customer_id}, {"$set": update_data})
-    updated_customer = await db.customers.find_one({"id": customer_id})
+    async with reserve_change_seq() as seq:
+        update_data['changeSeq'] = seq
+        await store.customers.update({"id": customer_id, "companyId": tenant_id}, set=update_data)
+    updated_customer = await store.customers.get({"id": customer_id, "companyId": tenant_id})
+    
+    # Open invoices carry a copy of these fields; refresh them off the request path
+    if any(updated_customer.get(f) != existing_customer.get(f) for f in CUSTOMER_INVOICE_FIELDS):
+        task = PropagationTask(companyId=tenant_id, customerId=customer_id)
+        await store.propagation_tasks.insert(task.dict())
+        background_tasks.add_task(run_propagation_task, task.id, customer_id)
+        response.headers["X-Propagation-Task"] = task.id
+    
     return Customer(**updated_customer)
 
-@api_router.delete("/customers/{customer_id}")
-async def delete_customer(customer_id: str):
-    result = await db.customers.delete_one({"id": customer_id})
-    if result.deleted_count == 0:
+@tenant_router.delete("/customers/{customer_id}")
+async def delete_customer(customer_id: str, tenant_id: str = Depends(get_company_id)):
+    if not await store.customers.delete({"id": customer_id, "companyId": tenant_id}):
         raise HTTPException(status_code=404, detail="Customer not found")
+    await record_tombstones("customers", tenant_id, [customer_id])
     return {"message": "Customer deleted successfully"}
 
 
+@tenant_router.get("/customers/{customer_id}/propagation", response_model=List[PropagationTask])
+async def get_customer_propagation(customer_id: str, tenant_id: str = Depends(get_company_id)):
+    query = {"companyId": tenant_id, "customerId": customer_id}
+    tasks = await store.propagation_tasks.list(query, sort=[("createdAt", -1)], limit=20)
+    return [PropagationTask(**task) for task in tasks]
+
+
+# ========== CUSTOMER -> INVOICE PROPAGATION ==========
+def customer_invoice_fields(customer: dict) -> dict:
+    return {invoice_field: customer.get(customer_field, "")
+            for customer_field, invoice_field in CUSTOMER_INVOICE_FIELDS.items()}
+
+async def propagate_customer_to_invoices(customer: dict):
+    """Rewrite the denormalised customer fields on the customer's open invoices."""
+    async with reserve_change_seq() as seq:
+        return await store.invoices.update_many(
+            {"companyId": customer["companyId"], "customerId": customer["id"],
+             "status": {"$in": OPEN_INVOICE_STATUSES}},
+            {**customer_invoice_fields(customer), "changeSeq": seq},
+        )
+
+async def run_propagation_task(task_id: str, customer_id: str):
+    # Runs after the response is sent, so outside the request's query budget
+    with pymongo.timeout(None):
+        await store.propagation_tasks.update({"id": task_id}, set={"status": "running"})
+        try:
+            # Re-read so back-to-back updates all propagate the latest values
+            customer = await store.customers.get({"id": customer_id})
+            matched, modified = await propagate_customer_to_invoices(customer) if customer else (0, 0)
+            update = {"status": "completed", "matched": matched, "modified": modified}
+        except Exception as e:
+            logger.exception("Customer propagation failed for %s", customer_id)
+            update = {"status": "failed", "error": str(e)}
+        update["completedAt"] = datetime.now().isoformat()
+        await store.propagation_tasks.update({"id": task_id}, set=update)
+
+async def reconcile_customer_invoices():
+    """Bring every open invoice back in line with its customer record.
+
+    Only invoices whose copied fields actually differ are matched, so a
+    reconcile on a consistent database does no writes.
+    """
+    totals = {"customers": 0, "matched": 0, "modified": 0}
+    async for customer in store.customers.iterate({}):
+        fields = customer_invoice_fields(customer)
+        async with reserve_change_seq() as seq:
+            matched, modified = await store.invoices.update_many(
+                {
+                    "companyId": customer["companyId"],
+                    "customerId": customer["id"],
+                    "status": {"$in": OPEN_INVOICE_STATUSES},
+                    "$or": [{field: {"$ne": value}} for field, value in fields.items()],
+                },
+                {**fields, "changeSeq": seq},
+            )
+        totals["customers"] += 1
+        totals["matched"] += matched
+        totals["modified"] += modified
+    return totals
+
+
 # ========== COMPANY ENDPOINTS ==========
 @api_router.post("/companies", response_model=Company)
-async def create_company(company: CompanyCreate):
-    company_dict = company.dict()
-    company_obj = Company(**company_dict)
-    await db.companies.insert_one(company_obj.dict())
-    return company_obj
+async def create_company(company: CompanyCreate, idempotency_key: Optional[str] = Header(None)):
+    async def create():
+        company_dict = company.dict()
+        company_obj = Company(**company_dict)
+        await store.companies.insert(company_obj.dict())
+        return company_obj
+    
+    return await run_idempotent(idempotency_key, "companies", company, create)
 
 @api_router.get("/companies", response_model=List[Company])
-async def get_companies():
-    companies = await db.companies.find().to_list(1000)
+async def get_companies(fields: Optional[str] = None):
+    projection = parse_fields(fields, Company)
+    companies = await store.companies.list({}, projection, limit=1000)
+    if projection:
+        return sparse_response(companies, Company)
     return [Company(**company) for company in companies]
 
 @api_router.get("/companies/{company_id}", response_model=Company)
-async def get_company(company_id: str):
-    company = await db.companies.find_one({"id": company_id})
+async def get_company(company_id: str, fields: Optional[str] = None):
+    projection = parse_fields(fields, Company)
+    company = await store.companies.get({"id": company_id}, projection)
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
+    if projection:
+        return sparse_response(company, Company)
     return Company(**company)
 
 @api_router.put("/companies/{company_id}", response_model=Company)
 async def update_company(company_id: str, company: CompanyUpdate):
-    existing_company = await db.companies.find_one({"id": company_id})
+    existing_company = await store.companies.get({"id": company_id})
     if not existing_company:
         raise HTTPException(status_code=404, detail="Company not found")
     
     update_data = {k: v for k, v in company.dict().items() if v is not None}
     
-    await db.companies.update_one({"id": company_id}, {"$set": update_data})
-    updated_company = await db.companies.find_one({"id": company_id})
+    await store.companies.update({"id": company_id}, set=update_data)
+    updated_company = await store.companies.get({"id": company_id})
     return Company(**updated_company)
 
 @api_router.delete("/companies/{company_id}")
 async def delete_company(company_id: str):
-    result = await db.companies.delete_one({"id": company_id})
-    if result.deleted_count == 0:
+    if not await store.companies.delete({"id": company_id}):
         raise HTTPException(status_code=404, detail="Company not found")
     return {"message": "Company deleted successfully"}
 
 
+# ========== GST ==========
+hsn_rates = HsnRateTable(store.hsn_rates, ttl_seconds=HSN_RATE_CACHE_SECONDS)
+
+async def company_gstin(company_id: str) -> str:
+    company = await store.companies.get({"id": company_id}, {"_id": 0, "gstin": 1})
+    return (company or {}).get("gstin", "")
+
+async def tax_invoice(company_id: str, items: List[dict], customer_gstin: str) -> dict:
+    """Amounts, CGST/SGST/IGST split and totals for an invoice of ``company_id``."""
+    return compute_invoice(items, await company_gstin(company_id), customer_gstin, await hsn_rates.load())
+
+@tenant_router.post("/gst/calculate", response_model=List[GstComputation])
+async def calculate_gst(request: GstBatchRequest, tenant_id: str = Depends(get_company_id)):
+    """Tax a batch of draft invoices without saving them."""
+    supplier = request.supplierGSTIN if request.supplierGSTIN is not None else await company_gstin(tenant_id)
+    invoices = [invoice.dict() for invoice in request.invoices]
+    return await asyncio.to_thread(compute_invoices, invoices, supplier, await hsn_rates.load())
+
+@tenant_router.get("/gst/summary")
+async def get_gst_summary(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                          status: Optional[StatusEnum] = None, tenant_id: str = Depends(get_company_id)):
+    """GSTR-1 style B2B, B2C and HSN summaries of the company's invoices."""
+    query = invoice_list_query(tenant_id, date_from, date_to, None, None, status)
+    projection = {"_id": 0, "customerGSTIN": 1, "placeOfSupply": 1, "supplyType": 1, "items": 1,
+                  "amount": 1, "cgstAmount": 1, "sgstAmount": 1, "igstAmount": 1}
+    collections = [store.invoices]
+    if reaches_archive(date_from, date_to):
+        collections.append(store.invoices_archive)
+    supplier = await company_gstin(tenant_id)
+    invoices = []
+    for collection in collections:
+        async for invoice in collection.iterate(query, projection):
+            if not invoice.get("supplyType"):
+                # Written before the split was stored: derive it from the invoiced rates
+                invoice.update(compute_invoice(invoice["items"], supplier, invoice.get("customerGSTIN", ""), {}))
+            invoices.append(invoice)
+    return await asyncio.to_thread(summarize, invoices)
+
+@api_router.get("/gst/hsn-rates", response_model=List[HsnRate])
+async def get_hsn_rates():
+    rates = await store.hsn_rates.list({}, {"_id": 0}, sort=[("hsn", 1)])
+    return [HsnRate(**rate) for rate in rates]
+
+@api_router.put("/gst/hsn-rates", response_model=List[HsnRate], dependencies=[Depends(require_admin)])
+async def put_hsn_rates(rates: List[HsnRate]):
+    """Add or change HSN rates; codes may be chapters (2 digits) up to full 8-digit codes.
+
+    The table is shared by every tenant, so changing it needs the admin token.
+    """
+    await store.hsn_rates.replace_many([rate.dict() for rate in rates], key="hsn")
+    hsn_rates.invalidate()
+    return rates
+
+
+# ========== RECEIVABLES ==========
+aging_cache = AgingCache(ttl_seconds=AGING_CACHE_SECONDS)
+
+def open_invoices_query(tenant_id: str, customer_id: Optional[str] = None) -> dict:
+    query = {"companyId": tenant_id, "status": {"$in": OPEN_INVOICE_STATUSES}}
+    if customer_id:
+        query["customerId"] = customer_id
+    return query
+
+@tenant_router.get("/customers/{customer_id}/statement")
+async def get_customer_statement(customer_id: str, as_of: Optional[date] = None,
+                                 tenant_id: str = Depends(get_company_id)):
+    """A customer's open invoices with days overdue, and their aging buckets."""
+    as_of = as_of or date.today()
+    cached = aging_cache.get(tenant_id, customer_id, as_of)
+    if cached:
+        return cached
+    customer = await store.customers.get({"id": customer_id, "companyId": tenant_id},
+                                         {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "gstin": 1})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    query = open_invoices_query(tenant_id, customer_id)
+    projection = {"_id": 0, "id": 1, "invoiceNumber": 1, "date": 1, "dueDate": 1, "status": 1, "totalAmount": 1}
+    invoices = await store.invoices.list(query, projection, sort=[("dueDate", 1)])
+    for invoice in invoices:
+        if isinstance(invoice.get("dueDate"), datetime):
+            invoice["daysOverdue"] = days_overdue(invoice["dueDate"], as_of)
+            invoice["bucket"] = aging_bucket(invoice["daysOverdue"])
+    statement = {"customer": customer, "invoices": invoices, **await aging(store.invoices, query, as_of)}
+    aging_cache.put(tenant_id, customer_id, as_of, statement)
+    return statement
+
+@tenant_router.get("/receivables/aging")
+async def get_receivables_aging(as_of: Optional[date] = None, tenant_id: str = Depends(get_company_id)):
+    """Open invoices of the whole company in 0-30/31-60/61-90/90+ day buckets."""
+    as_of = as_of or date.today()
+    report = aging_cache.get(tenant_id, None, as_of)
+    if not report:
+        report = await aging(store.invoices, open_invoices_query(tenant_id), as_of)
+        aging_cache.put(tenant_id, None, as_of, report)
+    return report
+
+
+# ========== IMPORT VALIDATION ==========
+async def existing_ids_by(collection, field: str, values, tenant_id: str) -> Dict[str, str]:
+    """Map each of ``values`` that exists in ``collection.field`` to its document id, in one query."""
+    values = list(dict.fromkeys(v for v in values if v))
+    if not values:
+        return {}
+    docs = await collection.list({"companyId": tenant_id, field: {"$in": values}}, {"_id": 0, "id": 1, field: 1})
+    return {doc[field]: doc["id"] for doc in docs}
+
+def import_row_result(row: int, key: str, existing_id: Optional[str], problems: List[str],
+                      duplicate: bool, missing: bool, customer_id: Optional[str] = None) -> ImportRowResult:
+    if duplicate:
+        status = ImportRowStatus.conflict
+    elif missing:
+        status = ImportRowStatus.missing_reference
+    elif existing_id:
+        status = ImportRowStatus.update
+    else:
+        status = ImportRowStatus.new
+    return ImportRowResult(row=row, key=key, status=status, existingId=existing_id, customerId=customer_id,
+                           problems=problems)
+
+@tenant_router.post("/import/validate", response_model=ImportValidationResponse)
+async def validate_import(request: ImportValidationRequest, tenant_id: str = Depends(get_company_id)):
+    """Dry-run an import: flag every row as new, update, conflict or missing-reference.
+
+    Nothing is written. Existing SKUs, invoice numbers, customers and products
+    are looked up with one ``$in`` query each, whatever the number of rows.
+    Customers are matched by id, then GSTIN, email and name, so rows whose id
+    was made up by the client still find their customer. A row that matches
+    no customer but names one is not a missing reference: the invoice carries
+    the customer's details itself.
+    """
+    batch_skus = {row.sku for row in request.products if row.sku}
+    item_refs = [item for row in request.invoices for item in row.items]
+    invoice_rows = request.invoices
+    (skus, product_ids, invoice_numbers, archived_numbers,
+     customer_ids, customer_gstins, customer_emails, customer_names) = await asyncio.gather(
+        existing_ids_by(store.products, "sku", [r.sku for r in request.products] + [i.sku for i in item_refs],
+                        tenant_id),
+        existing_ids_by(store.products, "id", [i.productId for i in item_refs], tenant_id),
+        existing_ids_by(store.invoices, "invoiceNumber", [r.invoiceNumber for r in request.invoices], tenant_id),
+        existing_ids_by(store.invoices_archive, "invoiceNumber", [r.invoiceNumber for r in request.invoices],
+                        tenant_id),
+        existing_ids_by(store.customers, "id", [r.customerId for r in invoice_rows], tenant_id),
+        existing_ids_by(store.customers, "gstin", [r.customerGSTIN for r in invoice_rows], tenant_id),
+        existing_ids_by(store.customers, "email", [r.customerEmail for r in invoice_rows], tenant_id),
+        existing_ids_by(store.customers, "name", [r.customerName for r in invoice_rows], tenant_id),
+    )
+
+    products, seen = [], set()
+    for n, row in enumerate(request.products):
+        duplicate = row.sku in seen
+        seen.add(row.sku)
+        problems = [f"SKU {row.sku} appears more than once in this import"] if duplicate else []
+        products.append(import_row_result(n, row.sku, skus.get(row.sku), problems, duplicate, False))
+
+    invoices, seen = [], set()
+    for n, row in enumerate(request.invoices):
+        problems = []
+        existing_id = invoice_numbers.get(row.invoiceNumber) or archived_numbers.get(row.invoiceNumber)
+        duplicate = row.invoiceNumber in seen or bool(existing_id)
+        seen.add(row.invoiceNumber)
+        if existing_id:
+            problems.append(f"Invoice number {row.invoiceNumber} already exists")
+        elif duplicate:
+            problems.append(f"Invoice number {row.invoiceNumber} appears more than once in this import")
+        customer_id = (customer_ids.get(row.customerId) or customer_gstins.get(row.customerGSTIN)
+                       or customer_emails.get(row.customerEmail) or customer_names.get(row.customerName))
+        missing = False
+        if not customer_id and not row.customerName:
+            missing = True
+            problems.append(f"Customer {row.customerId or '(none)'} not found")
+        for item in row.items:
+            if item.productId not in product_ids and item.sku not in skus and item.sku not in batch_skus:
+                missing = True
+                problems.append(f"Product {item.sku or item.productId} not found")
+        invoices.append(import_row_result(n, row.invoiceNumber, existing_id, problems, duplicate, missing,
+                                          customer_id))
+
+    summary = {
+        name: {status.value: sum(r.status == status for r in rows) for status in ImportRowStatus}
+        for name, rows in (("products", products), ("invoices", invoices))
+    }
+    return ImportValidationResponse(products=products, invoices=invoices, summary=summary)
+
+
 # ========== INVOICE ENDPOINTS ==========
-@api_router.post("/invoices", response_model=Invoice)
-async def create_invoice(invoice: InvoiceCreate):
-    invoice_dict = invoice.dict()
-    
-    # Calculate amounts
-    amount = sum(item['amount'] for item in invoice_dict['items'])
-    gst_amount = sum(item['amount'] * item['gstRate'] / 100 for item in invoice_dict['items'])
-    total_amount = amount + gst_amount
+@tenant_router.post("/invoices", response_model=Invoice)
+async def create_invoice(invoice: InvoiceCreate, tenant_id: str = Depends(get_company_id),
+                         idempotency_key: Optional[str] = Header(None)):
+    async def create():
+        invoice_dict = invoice.dict()
+        invoice_dict.update(await tax_invoice(tenant_id, invoice_dict['items'], invoice_dict['customerGSTIN']))
+        
+        async with reserve_change_seq() as seq:
+            invoice_obj = Invoice(**invoice_dict, companyId=tenant_id, changeSeq=seq)
+            invoice_doc = invoice_dates_to_bson(invoice_obj.dict())
+            await store.invoices.insert(invoice_doc)
+        aging_cache.invalidate(tenant_id)
+        await apply_invoice_change(store.product_sales, tenant_id, None, invoice_doc)
+        return invoice_obj
     
-    invoice_dict.update({
-        'amount': amount,
-        'gstAmount': gst_amount,
-        'totalAmount': total_amount
-    })
-    
-    invoice_obj = Invoice(**invoice_dict)
-    await db.invoices.insert_one(invoice_obj.dict())
-    return invoice_obj
+    return await run_idempotent(idempotency_key, f"{tenant_id}:invoices", invoice, create)
+
+def invoice_list_query(tenant_id: str, date_from: Optional[date], date_to: Optional[date],
+                       due_from: Optional[date], due_to: Optional[date],
+                       status: Optional[StatusEnum]) -> dict:
+    query = {"companyId": tenant_id}
+    for field, start, end in (("date", date_from, date_to), ("dueDate", due_from, due_to)):
+        if start or end:
+            query[field] = {}
+            if start:
+                query[field]["$gte"] = to_bson_date(start)
+            if end:
+                query[field]["$lte"] = to_bson_date(end)
+    if status:
+        query["status"] = status.value
+    return query
 
-@api_router.get("/invoices", response_model=List[Invoice])
-async def get_invoices():
-    invoices = await db.invoices.find().to_list(1000)
+def reaches_archive(date_from: Optional[date], date_to: Optional[date]) -> bool:
+    # Only paid invoices older than the archive horizon live in the archive
+    return bool((date_from or date_to) and (not date_from or to_bson_date(date_from) < archive_cutoff()))
+
+@tenant_router.get("/invoices", response_model=List[Invoice])
+async def get_invoices(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       due_from: Optional[date] = None, due_to: Optional[date] = None,
+                       status: Optional[StatusEnum] = None, include_archived: bool = False,
+                       fields: Optional[str] = None, tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Invoice)
+    query = invoice_list_query(tenant_id, date_from, date_to, due_from, due_to, status)
+    invoices = await store.invoices.list(query, projection, limit=1000)
+    
+    if include_archived or reaches_archive(date_from, date_to):
+        archived = await store.invoices_archive.list(query, projection, limit=1000)
+        invoices = sorted(invoices + archived, key=lambda i: i.get("date", datetime.min))[:1000]
+    if projection:
+        return sparse_response(invoices, Invoice)
     return [Invoice(**invoice) for invoice in invoices]
 
-@api_router.get("/invoices/{invoice_id}", response_model=Invoice)
-async def get_invoice(invoice_id: str):
-    invoice = await db.invoices.find_one({"id": invoice_id})
+@tenant_router.get("/invoices/export.xlsx")
+async def export_invoices(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                          due_from: Optional[date] = None, due_to: Optional[date] = None,
+                          status: Optional[StatusEnum] = None, include_archived: bool = False,
+                          tenant_id: str = Depends(get_company_id)):
+    """Stream the invoices matching the list filters, one row per line item."""
+    query = invoice_list_query(tenant_id, date_from, date_to, due_from, due_to, status)
+    cursors = [store.invoices.iterate(query, sort=[("date", 1)])]
+    if include_archived or reaches_archive(date_from, date_to):
+        cursors.insert(0, store.invoices_archive.iterate(query, sort=[("date", 1)]))
+    workbook = await write_workbook(cursors, INVOICE_HEADERS, invoice_rows, "Invoices")
+    return xlsx_response(workbook, "invoices")
+
+@tenant_router.post("/invoices/lookup", response_model=InvoiceLookupResponse)
+async def lookup_invoices(request: LookupRequest, tenant_id: str = Depends(get_company_id)):
+    scope = {"companyId": tenant_id}
+    found, missing = await lookup_by_ids(store.invoices, request.ids, scope)
+    if missing:
+        archived, missing = await lookup_by_ids(store.invoices_archive, missing, scope)
+        position = {i: n for n, i in enumerate(dict.fromkeys(request.ids))}
+        found = sorted(found + archived, key=lambda doc: position[doc["id"]])
+    return InvoiceLookupResponse(items=[Invoice(**i) for i in found], missing=missing)
+
+@api_router.post("/invoices/archive", response_model=Job, status_code=202, dependencies=[Depends(require_admin)])
+async def archive_invoices(response: Response, older_than_days: Optional[int] = Query(None, ge=0)):
+    """Archive paid invoices of every tenant; an operator task, so it needs the admin token."""
+    job = await job_queue.enqueue("archive_invoices", {"older_than_days": older_than_days})
+    return accepted(job, response)
+
+@tenant_router.get("/invoices/{invoice_id}", response_model=Invoice)
+async def get_invoice(invoice_id: str, fields: Optional[str] = None,
+                      tenant_id: str = Depends(get_company_id)):
+    projection = parse_fields(fields, Invoice)
+    query = {"id": invoice_id, "companyId": tenant_id}
+    invoice = await store.invoices.get(query, projection)
+    if not invoice:
+        invoice = await store.invoices_archive.get(query, projection)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    if projection:
+        return sparse_response(invoice, Invoice)
     return Invoice(**invoice)
 
-@api_router.put("/invoices/{invoice_id}", response_model=Invoice)
-async def update_invoice(invoice_id: str, invoice: InvoiceUpdate):
-    existing_invoice = await db.invoices.find_one({"id": invoice_id})
+@tenant_router.put("/invoices/{invoice_id}", response_model=Invoice)
+async def update_invoice(invoice_id: str, invoice: InvoiceUpdate, tenant_id: str = Depends(get_company_id)):
+    existing_invoice = await store.invoices.get({"id": invoice_id, "companyId": tenant_id})
     if not existing_invoice:
+        if await store.invoices_archive.get({"id": invoice_id, "companyId": tenant_id}):
+            raise HTTPException(status_code=409, detail="Archived invoices are read-only")
         raise HTTPException(status_code=404, detail="Invoice not found")
     
     update_data = {k: v for k, v in invoice.dict().items() if v is not None}
     
-    # Recalculate amounts if items are updated
-    if 'items' in update_data:
-        amount = sum(item['amount'] for item in update_data['items'])
-        gst_amount = sum(item['amount'] * item['gstRate'] / 100 for item in update_data['items'])
-        update_data.update({
-            'amount': amount,
-            'gstAmount': gst_amount,
-            'totalAmount': amount + gst_amount
-        })
+    # Recalculate amounts if the items or the place of supply change
+    if 'items' in update_data or 'customerGSTIN' in update_data:
+        update_data.update(await tax_invoice(
+            tenant_id, update_data.get('items', existing_invoice['items']),
+            update_data.get('customerGSTIN', existing_invoice.get('customerGSTIN', '')),
+        ))
     
-    await db.invoices.update_one({"id": invoice_id}, {"$set": update_data})
-    updated_invoice = await db.invoices.find_one({"id": invoice_id})
+    async with reserve_change_seq() as seq:
+        update_data['changeSeq'] = seq
+        update_data = invoice_dates_to_bson(update_data)
+        previous = await store.invoices.find_one_and_update(
+            {"id": invoice_id, "companyId": tenant_id}, set=update_data, return_new=False,
+        )
+    if not previous:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    aging_cache.invalidate(tenant_id)
+    # Diff the document this write replaced, not the earlier read, so rollups
+    # stay right when two updates race
+    updated_invoice = {**previous, **update_data}
+    await apply_invoice_change(store.product_sales, tenant_id, previous, updated_invoice)
     return Invoice(**updated_invoice)
 
-@api_router.delete("/invoices/{invoice_id}")
-async def delete_invoice(invoice_id: str):
-    result = await db.invoices.delete_one({"id": invoice_id})
-    if result.deleted_count == 0:
+@tenant_router.delete("/invoices/{invoice_id}")
+async def delete_invoice(invoice_id: str, tenant_id: str = Depends(get_company_id)):
+    query = {"id": invoice_id, "companyId": tenant_id}
+    for collection in (store.invoices, store.invoices_archive):
+        invoice = await collection.get(query)
+        if invoice and await collection.delete(query):
+            break
+    else:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    aging_cache.invalidate(tenant_id)
+    await apply_invoice_change(store.product_sales, tenant_id, invoice, None)
+    await record_tombstones("invoices", tenant_id, [invoice_id])
     return {"message": "Invoice deleted successfully"}
 
 
+# ========== SALES ANALYTICS ==========
+class SalesMeasure(str, Enum):
+    quantity = "quantity"
+    revenue = "revenue"
+
+async def product_totals(tenant_id: str, date_from: Optional[date], date_to: Optional[date],
+                         by: SalesMeasure) -> List[dict]:
+    """Per-product sales between two days (inclusive), read from the daily rollups only."""
+    query = {"companyId": tenant_id}
+    if date_from or date_to:
+        query["day"] = {}
+        if date_from:
+            query["day"]["$gte"] = to_bson_date(date_from)
+        if date_to:
+            query["day"]["$lte"] = to_bson_date(date_to)
+    rows = await store.product_sales.group(query, "productId",
+                                           {"quantity": "quantity", "revenue": "revenue", "lines": "lines"})
+    ranked = rank(rows, by.value)
+    products, _ = await lookup_by_ids(store.products, [row["productId"] for row in ranked],
+                                      {"companyId": tenant_id})
+    names = {p["id"]: (p.get("name", ""), p.get("sku", "")) for p in products}
+    for row in ranked:
+        row["name"], row["sku"] = names.get(row["productId"], ("", ""))
+    return ranked
+
+@tenant_router.get("/sales/top-products")
+async def get_top_products(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                           by: SalesMeasure = SalesMeasure.revenue, limit: int = Query(10, ge=1, le=1000),
+                           tenant_id: str = Depends(get_company_id)):
+    """Best sellers by quantity or revenue (taxable amount) over a date range."""
+    return (await product_totals(tenant_id, date_from, date_to, by))[:limit]
+
+@tenant_router.get("/sales/abc")
+async def get_abc_classification(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                 by: SalesMeasure = SalesMeasure.revenue,
+                                 a_share: float = Query(0.8, gt=0, lt=1), b_share: float = Query(0.95, gt=0, lt=1),
+                                 tenant_id: str = Depends(get_company_id)):
+    """ABC classes of the products sold in a date range: A up to ``a_share`` of sales, B up to ``b_share``."""
+    if b_share < a_share:
+        raise HTTPException(status_code=422, detail="b_share must not be below a_share")
+    classified = abc_classes(await product_totals(tenant_id, date_from, date_to, by), by.value, a_share, b_share)
+    counts = {label: sum(row["class"] == label for row in classified) for label in "ABC"}
+    return {"by": by.value, "counts": counts, "products": classified}
+
+@tenant_router.post("/sales/rollups/rebuild", response_model=Job, status_code=202)
+async def rebuild_sales_rollups(response: Response, tenant_id: str = Depends(get_company_id)):
+    """Recompute the company's daily sales rollups from its invoices, e.g. after a restore."""
+    job = await job_queue.enqueue("rebuild_sales_rollups", company_id=tenant_id)
+    return accepted(job, response)
+
+
+# ========== REORDER SUGGESTIONS ==========
+async def compute_reorder_suggestions(company_id: str, progress=None, batch_size: int = 1000):
+    """Recompute and store the company's reorder suggestions from its sales rollups."""
+    generated_at = datetime.utcnow()
+    # The window ends with today
+    start = to_bson_date(date.today() - timedelta(days=REORDER_WINDOW_DAYS - 1))
+    projection = {"_id": 0, "id": 1, "name": 1, "sku": 1, "supplier": 1, "stock": 1, "minStock": 1, "price": 1}
+    products = [p async for p in store.products.iterate({"companyId": company_id}, projection)]
+    sales = [row async for row in store.product_sales.iterate(
+        {"companyId": company_id, "day": {"$gte": start}}, {"_id": 0, "productId": 1, "day": 1, "quantity": 1})]
+    if progress:
+        await progress(1, 3, "history loaded")
+
+    def compute():
+        demand = demand_matrix([p["id"] for p in products], sales, start, REORDER_WINDOW_DAYS)
+        stock = np.array([p.get("stock", 0) for p in products], dtype=np.float64)
+        stats = suggest(stock, demand, REORDER_LEAD_TIME_DAYS, REORDER_REVIEW_DAYS, REORDER_SERVICE_Z)
+        return suggestion_rows(products, stats)
+    rows = await asyncio.to_thread(compute)
+    if progress:
+        await progress(2, 3, "computed")
+
+    await store.reorder_suggestions.delete_many({"companyId": company_id})
+    for offset in range(0, len(rows), batch_size):
+        await store.reorder_suggestions.insert_many([
+            {**row, "companyId": company_id} for row in rows[offset:offset + batch_size]
+        ])
+    run = {"generatedAt": generated_at, "products": len(products), "suggestions": len(rows)}
+    await store.reorder_runs.update({"companyId": company_id}, set=run, upsert=True)
+    logger.info("Computed %d reorder suggestions for %d products of %s", len(rows), len(products), company_id)
+    return {**run, "generatedAt": generated_at.isoformat()}
+
+async def enqueue_reorder_runs(stale_only: bool = False) -> int:
+    """Queue a suggestions job per company; ``stale_only`` skips ones computed within the interval."""
+    cutoff = datetime.utcnow() - timedelta(seconds=REORDER_INTERVAL)
+    queued = 0
+    for row in await store.products.group({}, "companyId"):
+        company_id = row["_id"] or DEFAULT_COMPANY_ID
+        if stale_only and await store.reorder_runs.get({"companyId": company_id, "generatedAt": {"$gte": cutoff}}):
+            continue
+        await job_queue.enqueue("reorder_suggestions", company_id=company_id)
+        queued += 1
+    return queued
+
+async def run_reorder_scheduler():
+    # Catch up at startup, so restarts more often than the interval still
+    # refresh suggestions, then run on the interval
+    stale_only = True
+    while True:
+        try:
+            await enqueue_reorder_runs(stale_only)
+        except Exception:
+            logger.exception("Scheduling reorder suggestions failed")
+        stale_only = False
+        await asyncio.sleep(REORDER_INTERVAL)
+
+@tenant_router.get("/reorder-suggestions")
+async def get_reorder_suggestions(supplier: Optional[str] = None, tenant_id: str = Depends(get_company_id)):
+    """The last computed suggestions, grouped by supplier."""
+    query = {"companyId": tenant_id}
+    if supplier is not None:
+        query["supplier"] = supplier
+    run = await store.reorder_runs.get({"companyId": tenant_id}, {"_id": 0, "generatedAt": 1, "products": 1})
+    projection = {"_id": 0, "companyId": 0}
+    rows = [row async for row in store.reorder_suggestions.iterate(query, projection)]
+    return {**(run or {"generatedAt": None, "products": 0}), "suggestions": len(rows),
+            "suppliers": group_by_supplier(rows)}
+
+@tenant_router.post("/reorder-suggestions/run", response_model=Job, status_code=202)
+async def run_reorder_suggestions(response: Response, tenant_id: str = Depends(get_company_id)):
+    job = await job_queue.enqueue("reorder_suggestions", company_id=tenant_id)
+    return accepted(job, response)
+
+
+# ========== INVOICE ARCHIVING ==========
+def archive_cutoff(older_than_days: Optional[int] = None) -> datetime:
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return to_bson_date(date.today() - timedelta(days=days))
+
+async def archive_paid_invoices(older_than_days: Optional[int] = None,
+                                batch_size: int = ARCHIVE_BATCH_SIZE, progress=None):
+    """Move paid invoices dated before the cutoff into invoices_archive.
+
+    Each batch is upserted into the archive before it is removed from the hot
+    collection, so an interrupted run can simply be repeated.
+    """
+    cutoff = archive_cutoff(older_than_days)
+    query = {"status": StatusEnum.paid.value, "date": {"$lt": cutoff}}
+    archived = 0
+    while True:
+        batch = await store.invoices.list(query, sort=[("date", 1)], limit=batch_size)
+        if not batch:
+            break
+        archived_at = datetime.now().isoformat()
+        await store.invoices_archive.replace_many([{**doc, "archivedAt": archived_at} for doc in batch])
+        await store.invoices.delete_many({"id": {"$in": [doc["id"] for doc in batch]}})
+        archived += len(batch)
+        if progress:
+            await progress(archived, message="invoices archived")
+    logger.info("Archived %d paid invoices dated before %s", archived, cutoff)
+    return {"cutoff": cutoff, "archived": archived}
+
+
+# ========== DATE MAINTENANCE ==========
+async def sweep_overdue_invoices():
+    """Flip every pending invoice whose due date has passed to overdue."""
+    async with reserve_change_seq() as seq:
+        _, modified = await store.invoices.update_many(
+            {"status": StatusEnum.pending.value, "dueDate": {"$lt": to_bson_date(date.today())}},
+            {"status": StatusEnum.overdue.value, "changeSeq": seq},
+        )
+    if modified:
+        logger.info("Marked %d invoices overdue", modified)
+    return {"overdue": modified}
+
+async def run_overdue_sweeper():
+    while True:
+        try:
+            await sweep_overdue_invoices()
+        except Exception:
+            logger.exception("Overdue sweep failed")
+        await asyncio.sleep(OVERDUE_SWEEP_INTERVAL)
+
+def parse_stored_date(value: str, date_only: bool) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return to_bson_date(parsed.date()) if date_only else parsed
+
+async def migrate_date_fields(batch_size: int = 500):
+    """Convert dates stored as strings by earlier versions into BSON dates.
+
+    Values that cannot be parsed are left untouched and reported as skipped.
+    """
+    if db is None:
+        # The embedded backend was never written by those versions
+        return {}
+    targets = [
+        (db.invoices, ("date", "dueDate"), True),
+        (db.invoices_archive, ("date", "dueDate"), True),
+        (db.products, ("lastUpdated",), False),
+    ]
+    report = {}
+    for collection, fields, date_only in targets:
+        converted = skipped = 0
+        ops = []
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        async for doc in collection.find(query, {"id": 1, **{field: 1 for field in fields}}):
+            update = {}
+            for field in fields:
+                if isinstance(doc.get(field), str):
+                    parsed = parse_stored_date(doc[field], date_only)
+                    if parsed is None:
+                        skipped += 1
+                    else:
+                        update[field] = parsed
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+                converted += 1
+            if len(ops) >= batch_size:
+                await collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+        report[collection.name] = {"converted": converted, "skipped": skipped}
+    return report
+
+
+# ========== DELTA SYNC ==========
+@tenant_router.get("/sync")
+async def sync_changes(since: int = 0, limit: int = SYNC_PAGE_SIZE,
+                       tenant_id: str = Depends(get_company_id)):
+    """Ids changed or deleted after change sequence ``since``.
+
+    Pass the returned ``next`` as ``since`` on the following call until
+    ``hasMore`` is false. A sequence number shared by several documents (bulk
+    updates) is never split across pages. Clients that have not synced within
+    ``retentionDays`` may have missed tombstones and should resync in full.
+    """
+    limit = max(1, min(limit, SYNC_PAGE_SIZE))
+    query = {"companyId": tenant_id, "changeSeq": {"$gt": since}}
+    if writes_in_flight:
+        # Stop short of writes still in flight: they may commit below what is visible now
+        query["changeSeq"]["$lte"] = min(writes_in_flight) - 1
+    projection = {"_id": 0, "id": 1, "changeSeq": 1, "entity": 1}
+    
+    rows = []
+    for name in SYNC_COLLECTIONS:
+        docs = await store[name].list(query, projection, sort=[("changeSeq", 1)], limit=limit + 1)
+        rows.extend(("changed", name, doc) for doc in docs)
+    tombstones = await store.tombstones.list(query, projection, sort=[("changeSeq", 1)], limit=limit + 1)
+    rows.extend(("deleted", doc["entity"], doc) for doc in tombstones)
+    rows.sort(key=lambda row: row[2]["changeSeq"])
+    
+    has_more = len(rows) > limit
+    if has_more:
+        boundary = rows[limit][2]["changeSeq"]
+        page = [row for row in rows[:limit] if row[2]["changeSeq"] < boundary]
+        if not page:
+            # One bulk update larger than a page: return that whole sequence number
+            page = [("changed", name, doc) for name in SYNC_COLLECTIONS
+                    for doc in await store[name].list({**query, "changeSeq": boundary}, projection)]
+            page += [("deleted", doc["entity"], doc)
+                     for doc in await store.tombstones.list({**query, "changeSeq": boundary}, projection)]
+        rows = page
+    
+    changed = {name: [] for name in SYNC_COLLECTIONS}
+    deleted = {name: [] for name in SYNC_COLLECTIONS}
+    for kind, name, doc in rows:
+        (changed if kind == "changed" else deleted)[name].append(doc["id"])
+    return {
+        "since": since,
+        "next": rows[-1][2]["changeSeq"] if rows else since,
+        "hasMore": has_more,
+        "changed": changed,
+        "deleted": deleted,
+        "retentionDays": SYNC_TOMBSTONE_RETENTION_DAYS,
+    }
+
+
+# ========== EXCEL EXPORT ==========
+def xlsx_response(workbook, name: str) -> StreamingResponse:
+    filename = f"{name}-{datetime.utcnow().strftime('%Y-%m-%d')}.xlsx"
+    return StreamingResponse(
+        iter_file(workbook),
+        media_type=XLSX_MEDIA_TYPE,
+        # xlsx is already a zip archive, so skip the compression middleware
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "Content-Encoding": "identity"},
+    )
+
+
+# ========== BACKUP & RESTORE ==========
+async def require_mongo():
+    # Archives are MongoDB extended JSON; the embedded backend is a single file to copy
+    if db is None:
+        raise HTTPException(status_code=501, detail="Backup and restore need the MongoDB storage backend")
+
+@api_router.get("/admin/backup", dependencies=[Depends(require_admin), Depends(require_mongo)])
+async def backup_database():
+    """Stream a gzip-compressed NDJSON archive of every collection."""
+    filename = f"inventory-backup-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.ndjson.gz"
+    return StreamingResponse(
+        export_archive(db),
+        media_type="application/gzip",
+        # identity keeps the compression middleware from gzipping it again
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "Content-Encoding": "identity"},
+    )
+
+@api_router.post("/admin/restore", dependencies=[Depends(require_admin), Depends(require_mongo)])
+async def restore_database(request: Request, drop: bool = True):
+    """Replace the database contents with an archive sent as the request body."""
+    try:
+        report = await restore_archive(db, request.stream(), drop=drop)
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Recreate anything the application expects that the archive lacked
+    await create_indexes()
+    return report
+
+
+# ========== METRICS ==========
+@api_router.get("/metrics/admission")
+async def get_admission_metrics():
+    return {name: limiter.metrics() for name, limiter in admission_limiters.items()}
+
+
+# ========== TENANCY ==========
+@api_router.get("/tenants/usage")
+async def get_tenant_usage():
+    """Document counts per company, for capacity planning."""
+    usage: Dict[str, Dict[str, int]] = {}
+    for collection in (store.products, store.customers, store.invoices, store.invoices_archive):
+        for row in await collection.group({}, "companyId"):
+            usage.setdefault(row["_id"] or "", {})[collection.name] = row["count"]
+    return [{"companyId": company_id, **counts} for company_id, counts in sorted(usage.items())]
+
+async def backfill_company_id(company_id: str = DEFAULT_COMPANY_ID):
+    """Assign documents written before multi-tenancy to ``company_id``."""
+    report = {}
+    for collection in (store.products, store.customers, store.invoices, store.invoices_archive,
+                       store.propagation_tasks):
+        _, modified = await collection.update_many({"companyId": {"$exists": False}}, {"companyId": company_id})
+        report[collection.name] = modified
+    return report
+
+
+# ========== JOBS ==========
+job_queue = JobQueue(store.jobs, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS,
+                     max_attempts=JOB_MAX_ATTEMPTS, backoff_seconds=JOB_RETRY_BACKOFF)
+
+def accepted(job: dict, response: Response) -> Job:
+    """202 body for an enqueued job, pointing at its status endpoint."""
+    prefix = f"/api/companies/{job['companyId']}" if job.get("companyId") else "/api"
+    response.headers["Location"] = f"{prefix}/jobs/{job['id']}"
+    return Job(**job)
+
+@tenant_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, tenant_id: str = Depends(get_company_id),
+                  x_admin_token: Optional[str] = Header(None)):
+    """A tenant sees its own jobs; jobs of no tenant (archiving) need the admin token."""
+    job = await job_queue.get(job_id)
+    if job and job.get("companyId") is None:
+        await require_admin(x_admin_token)
+    elif not job or job["companyId"] != tenant_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**job)
+
+async def run_seed_job(job: dict, progress):
+    return await seed_company(job["companyId"], progress)
+
+async def run_archive_job(job: dict, progress):
+    return await archive_paid_invoices(job["params"].get("older_than_days"), progress=progress)
+
+async def run_rollup_rebuild_job(job: dict, progress):
+    return await rebuild(store.product_sales, (store.invoices, store.invoices_archive), job["companyId"])
+
+async def run_reorder_job(job: dict, progress):
+    return await compute_reorder_suggestions(job["companyId"], progress)
+
+job_queue.register("seed", run_seed_job)
+job_queue.register("archive_invoices", run_archive_job)
+job_queue.register("rebuild_sales_rollups", run_rollup_rebuild_job)
+job_queue.register("reorder_suggestions", run_reorder_job)
+
+
 # ========== SEED ENDPOINT ==========
-@api_router.post("/seed")
-async def seed_database():
-    """Seed the database with sample data"""
-    # Clear existing data
-    await db.products.delete_many({})
-    await db.customers.delete_many({})
-    await db.companies.delete_many({})
-    await db.invoices.delete_many({})
+@tenant_router.post("/seed", response_model=Job, status_code=202)
+async def seed_database(response: Response, tenant_id: str = Depends(get_company_id)):
+    """Queue a job that seeds the current company with sample data"""
+    job = await job_queue.enqueue("seed", company_id=tenant_id)
+    return accepted(job, response)
+
+async def seed_company(tenant_id: str, progress=None):
+    """Seed the current company with sample data"""
+    # Clear existing data for this company only
+    for name in SYNC_COLLECTIONS:
+        collection = store[name]
+        existing = await collection.list({"companyId": tenant_id}, {"id": 1})
+        await collection.delete_many({"companyId": tenant_id})
+        await record_tombstones(name, tenant_id, [doc["id"] for doc in existing])
+    await store.stock_movements.delete_many({"companyId": tenant_id})
+    await store.stock_snapshots.delete_many({"companyId": tenant_id})
     
     # Seed Products
     sample_products = [
@@ -422,7 +1931,7 @@ async def seed_database():
             "hsn": "85183000",
             "gstRate": 18,
             "supplier": "Audio Tech Supplies",
-            "lastUpdated": "2024-07-25"
+            "lastUpdated": datetime(2024, 7, 25)
         },
         {
             "id": str(uuid.uuid4()),
@@ -436,7 +1945,7 @@ async def seed_database():
             "hsn": "85395000",
             "gstRate": 18,
             "supplier": "Lighting Solutions",
-            "lastUpdated": "2024-07-25"
+            "lastUpdated": datetime(2024, 7, 25)
         },
         {
             "id": str(uuid.uuid4()),
@@ -450,7 +1959,7 @@ async def seed_database():
             "hsn": "94013000",
             "gstRate": 18,
             "supplier": "Furniture Hub",
-            "lastUpdated": "2024-07-25"
+            "lastUpdated": datetime(2024, 7, 25)
         },
         {
             "id": str(uuid.uuid4()),
@@ -464,7 +1973,7 @@ async def seed_database():
             "hsn": "48201000",
             "gstRate": 12,
             "supplier": "Paper Works",
-            "lastUpdated": "2024-07-25"
+            "lastUpdated": datetime(2024, 7, 25)
         }
     ]
     
@@ -511,7 +2020,7 @@ async def seed_database():
     # Seed Companies
     sample_companies = [
         {
-            "id": str(uuid.uuid4()),
+            "id": tenant_id,
             "name": "My Business Inc",
             "email": "contact@mybusiness.com",
             "phone": "+91 9999888877",
@@ -522,46 +2031,64 @@ async def seed_database():
         }
     ]
     
-    # Insert seed data
-    await db.products.insert_many(sample_products)
-    await db.customers.insert_many(sample_customers)
-    await db.companies.insert_many(sample_companies)
+    async with reserve_change_seq() as seq:
+        for doc in sample_products + sample_customers:
+            doc["companyId"] = tenant_id
+            doc["changeSeq"] = seq
     
-    # Create a sample invoice
-    invoice_id = str(uuid.uuid4())
-    sample_invoice = {
-        "id": invoice_id,
-        "invoiceNumber": "INV-001",
-        "customerId": sample_customers[0]["id"],
-        "customerName": sample_customers[0]["name"],
-        "customerEmail": sample_customers[0]["email"],
-        "customerPhone": sample_customers[0]["phone"],
-        "customerAddress": sample_customers[0]["address"],
-        "customerGSTIN": sample_customers[0]["gstin"],
-        "date": "2024-07-20",
-        "dueDate": "2024-08-19",
-        "items": [
-            {
-                "productId": sample_products[0]["id"],
-                "name": sample_products[0]["name"],
-                "sku": sample_products[0]["sku"],
-                "category": sample_products[0]["category"],
-                "quantity": 2,
-                "price": sample_products[0]["price"],
-                "unit": sample_products[0]["unit"],
-                "hsn": sample_products[0]["hsn"],
-                "gstRate": sample_products[0]["gstRate"],
-                "amount": sample_products[0]["price"] * 2
-            }
-        ],
-        "amount": sample_products[0]["price"] * 2,
-        "gstAmount": (sample_products[0]["price"] * 2) * 18 / 100,
-        "totalAmount": (sample_products[0]["price"] * 2) + ((sample_products[0]["price"] * 2) * 18 / 100),
-        "notes": "Payment due in 30 days",
-        "status": "pending"
-    }
+        # Insert seed data
+        await store.products.insert_many(sample_products)
+        await store.stock_movements.insert_many([
+            StockMovement(companyId=tenant_id, productId=p["id"], quantity=p["stock"],
+                          balance=p["stock"], reason=StockMovementReason.initial).dict()
+            for p in sample_products
+        ])
+        if progress:
+            await progress(1, 3, "products")
+        await store.customers.insert_many(sample_customers)
+        # Only create the company record if this tenant does not have one yet
+        for company in sample_companies:
+            await store.companies.update({"id": company["id"]}, set_on_insert=company, upsert=True)
+    
+        if progress:
+            await progress(2, 3, "customers")
+    
+        # Create a sample invoice
+        invoice_id = str(uuid.uuid4())
+        sample_invoice = {
+            "id": invoice_id,
+            "companyId": tenant_id,
+            "changeSeq": seq,
+            "invoiceNumber": "INV-001",
+            "customerId": sample_customers[0]["id"],
+            "customerName": sample_customers[0]["name"],
+            "customerEmail": sample_customers[0]["email"],
+            "customerPhone": sample_customers[0]["phone"],
+            "customerAddress": sample_customers[0]["address"],
+            "customerGSTIN": sample_customers[0]["gstin"],
+            "date": datetime(2024, 7, 20),
+            "dueDate": datetime(2024, 8, 19),
+            "items": [
+                {
+                    "productId": sample_products[0]["id"],
+                    "name": sample_products[0]["name"],
+                    "sku": sample_products[0]["sku"],
+                    "category": sample_products[0]["category"],
+                    "quantity": 2,
+                    "price": sample_products[0]["price"],
+                    "unit": sample_products[0]["unit"],
+                    "hsn": sample_products[0]["hsn"],
+                    "gstRate": sample_products[0]["gstRate"],
+                    "amount": sample_products[0]["price"] * 2
+                }
+            ],
+            "notes": "Payment due in 30 days",
+            "status": "pending"
+        }
+        sample_invoice.update(await tax_invoice(tenant_id, sample_invoice["items"], sample_invoice["customerGSTIN"]))
     
-    await db.invoices.insert_one(sample_invoice)
+        await store.invoices.insert(sample_invoice)
+    await rebuild(store.product_sales, (store.invoices, store.invoices_archive), tenant_id)
     
     return {
         "message": "Database seeded successfully",
@@ -573,27 +2100,27 @@ async def seed_database():
         }
     }
 
-# Include the router in the main app
+# Include the routers in the main app
+api_router.include_router(tenant_router)
+api_router.include_router(tenant_router, prefix="/companies/{company_id}")
 app.include_router(api_router)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Added first so it sits inside admission control: the budget starts once the
+# request is admitted, and time spent queued does not count against it
+app.add_middleware(QueryBudgetMiddleware, budgets=QUERY_BUDGETS, classify=classify_endpoint)
+app.add_exception_handler(PyMongoError, database_error_handler)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limiters=admission_limiters,
+    classify=classify_endpoint,
+    retry_after=ADMISSION_RETRY_AFTER,
 )
-logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
 
 app.add_middleware(
     CORSMiddleware,
@@ -610,6 +2137,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # Every lookup (single and batched) goes through the ``id`` field.
+    for collection in (store.products, store.customers, store.companies, store.invoices, store.invoices_archive):
+        await collection.ensure_index("id", unique=True)
+    # Tenant-scoped queries: every compound index leads with companyId
+    for collection in (store.products, store.customers):
+        await collection.ensure_index([("companyId", 1), ("id", 1)])
+    for collection in (store.invoices, store.invoices_archive):
+        await collection.ensure_index([("companyId", 1), ("id", 1)])
+        await collection.ensure_index([("companyId", 1), ("date", 1)])
+    # Customer propagation and statements (whose $bucket groups on dueDate)
+    await store.invoices.ensure_index([("companyId", 1), ("customerId", 1), ("status", 1), ("dueDate", 1)])
+    await store.invoices.ensure_index([("companyId", 1), ("status", 1), ("dueDate", 1)])
+    await store.invoices.ensure_index([("companyId", 1), ("dueDate", 1)])
+    await store.propagation_tasks.ensure_index([("companyId", 1), ("customerId", 1), ("createdAt", -1)])
+    # Job claiming: due queued jobs and running jobs with a lapsed lease
+    await store.jobs.ensure_index("id", unique=True)
+    await store.jobs.ensure_index([("status", 1), ("runAt", 1)])
+    await store.jobs.ensure_index([("status", 1), ("leaseUntil", 1)])
+    await store.idempotency_keys.ensure_index("createdAt", expire_after_seconds=IDEMPOTENCY_TTL_SECONDS)
+    # Heartbeats: bounded retention, latest per client and time-range history.
+    # ensure_index updates the TTL of an existing index when the setting changes
+    if STATUS_RETENTION_DAYS > 0:
+        await store.status_checks.ensure_index("timestamp", expire_after_seconds=STATUS_RETENTION_DAYS * 86400)
+    else:
+        await store.status_checks.ensure_index("timestamp")
+    # History pages sort on (timestamp, id); id breaks ties between checks of the same instant
+    await store.status_checks.ensure_index([("client_name", 1), ("timestamp", -1), ("id", -1)])
+    await store.status_checks.ensure_index([("timestamp", -1), ("id", -1)])
+    for name in SYNC_COLLECTIONS + ("tombstones",):
+        await store[name].ensure_index([("companyId", 1), ("changeSeq", 1)])
+    await store.tombstones.ensure_index("deletedAt", expire_after_seconds=SYNC_TOMBSTONE_RETENTION_DAYS * 86400)
+    for collection in (store.stock_movements, store.stock_snapshots):
+        await collection.ensure_index([("companyId", 1), ("productId", 1), ("timestamp", -1)])
+    await store.hsn_rates.ensure_index("hsn", unique=True)
+    await store.product_sales.ensure_index([("companyId", 1), ("productId", 1), ("day", 1)], unique=True)
+    await store.product_sales.ensure_index([("companyId", 1), ("day", 1)])
+    await store.reorder_suggestions.ensure_index([("companyId", 1), ("supplier", 1)])
+    # Import validation looks rows up by their natural keys
+    await store.products.ensure_index([("companyId", 1), ("sku", 1)])
+    for collection in (store.invoices, store.invoices_archive):
+        await collection.ensure_index([("companyId", 1), ("invoiceNumber", 1)])
+    # and invoice rows to customers by GSTIN, email or name
+    for field in ("gstin", "email", "name"):
+        await store.customers.ensure_index([("companyId", 1), (field, 1)])
+    # Cross-tenant maintenance jobs (archiving, overdue sweep)
+    await store.invoices.ensure_index([("status", 1), ("date", 1)])
+    await store.invoices.ensure_index([("status", 1), ("dueDate", 1)])
+
+@app.on_event("startup")
+async def start_background_loops():
+    warn_if_multiple_workers()
+    if OVERDUE_SWEEP_INTERVAL > 0:
+        app.state.overdue_sweeper = asyncio.create_task(run_overdue_sweeper())
+    if STOCK_SNAPSHOT_INTERVAL > 0:
+        app.state.stock_snapshotter = asyncio.create_task(run_stock_snapshotter())
+    if REORDER_INTERVAL > 0:
+        app.state.reorder_scheduler = asyncio.create_task(run_reorder_scheduler())
+
+    if JOB_WORKERS > 0:
+        job_queue.start()
+    status_writer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await status_writer.stop()
+    await job_queue.stop()
+    for name in ("overdue_sweeper", "stock_snapshotter", "reorder_scheduler"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    store.close()
@@ -0,0 +1,729 @@
+"""Storage backends behind a small repository interface.
+
+Handlers talk to a :class:`Repository` per collection (``store.products``,
+``store.invoices`` ...) instead of to Motor directly. Two backends implement
+it:
+
+* :class:`MotorStorage` - the MongoDB deployment, a thin pass-through to Motor.
+* :class:`SQLiteStorage` - an embedded database for single-node installs,
+  tests and benchmarks. Each collection is a table of JSON documents, and
+  indexes are SQLite expression indexes over ``json_extract`` so filtered and
+  sorted reads use them exactly like their Mongo counterparts. ``":memory:"``
+  gives a throwaway database that starts in milliseconds.
+
+Filters use the Mongo query subset the application needs: equality, ``$in``,
+``$nin``, ``$ne``, ``$gt``/``$gte``/``$lt``/``$lte``, ``$exists`` and
+``$or``/``$and`` over top-level (or dotted) fields. Sorts are lists of
+``(field, direction)`` pairs and projections are Mongo inclusion projections.
+"""
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time as clock
+from abc import ABC, abstractmethod
+from datetime import date, datetime, time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+Sort = Optional[Sequence[Tuple[str, int]]]
+IndexKeys = Union[str, Sequence[Tuple[str, int]]]
+
+
+class DuplicateKey(Exception):
+    """A write violated a unique index."""
+
+
+class Repository(ABC):
+    name: str
+
+    @abstractmethod
+    async def get(self, filter: dict, projection: Optional[dict] = None, sort: Sort = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def list(self, filter: dict, projection: Optional[dict] = None, sort: Sort = None,
+                   limit: int = 0) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def iterate(self, filter: dict, projection: Optional[dict] = None, sort: Sort = None,
+                batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Stream matching documents without loading them all at once."""
+
+    @abstractmethod
+    async def count(self, filter: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def insert(self, doc: dict):
+        ...
+
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]):
+        ...
+
+    @abstractmethod
+    async def replace_many(self, docs: List[dict], key: str = "id"):
+        """Upsert ``docs`` by ``key`` in one round trip."""
+
+    @abstractmethod
+    async def update(self, filter: dict, set: Optional[dict] = None, inc: Optional[dict] = None,
+                     set_on_insert: Optional[dict] = None, upsert: bool = False) -> int:
+        """Update the first match; returns the number of documents matched."""
+
+    @abstractmethod
+    async def update_many(self, filter: dict, set: dict) -> Tuple[int, int]:
+        """Update every match; returns the numbers matched and modified."""
+
+    @abstractmethod
+    async def find_one_and_update(self, filter: dict, set: Optional[dict] = None,
+                                  inc: Optional[dict] = None, set_on_insert: Optional[dict] = None,
+                                  upsert: bool = False, sort: Sort = None,
+                                  return_new: bool = True) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def delete(self, filter: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def delete_many(self, filter: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def group(self, filter: dict, key: Optional[str] = None,
+                    sums: Optional[Dict[str, str]] = None) -> List[dict]:
+        """Count (and sum ``sums`` fields) per value of ``key``.
+
+        Rows look like ``{"_id": <key value>, "count": n, <name>: total}``;
+        groups with no documents are not returned.
+        """
+
+    @abstractmethod
+    async def bucket(self, filter: dict, field: str, boundaries: Sequence, default: str,
+                     sums: Optional[Dict[str, str]] = None) -> List[dict]:
+        """Count (and sum) matches per range of ``field``, like Mongo's ``$bucket``.
+
+        ``boundaries`` are ascending; each row's ``_id`` is the lower bound of
+        its ``[lower, upper)`` range, or ``default`` for documents outside all
+        of them (or without the field). Empty ranges are not returned.
+        """
+
+    @abstractmethod
+    async def latest_by(self, filter: dict, key: str, field: str,
+                        projection: Optional[dict] = None) -> List[dict]:
+        """The match with the greatest ``field`` for each value of ``key``, ordered by ``key``.
+
+        Backed by an index on ``(key, field desc)`` this reads one index
+        entry per key rather than every match.
+        """
+
+    @abstractmethod
+    async def unwind_group(self, filter: dict, array: str, keys: Dict[str, str],
+                           sums: Dict[str, str]) -> List[dict]:
+        """Count (and sum) the elements of ``array`` across matches, per ``keys``.
+
+        Like ``$unwind`` then ``$group``: ``keys`` and ``sums`` map output
+        names to fields, where ``"<array>.<field>"`` is a field of the element
+        and anything else a field of the document. Rows look like
+        ``{<key name>: value, ..., "count": n, <sum name>: total}``.
+        """
+
+    @abstractmethod
+    async def ensure_index(self, keys: IndexKeys, unique: bool = False,
+                           expire_after_seconds: Optional[int] = None):
+        ...
+
+
+class Storage(ABC):
+    """Collections by attribute or item access, like a Motor database."""
+
+    def __getattr__(self, name: str) -> Repository:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    @abstractmethod
+    def __getitem__(self, name: str) -> Repository:
+        ...
+
+    def close(self):
+        pass
+
+
+# ========== MONGODB ==========
+class MotorRepository(Repository):
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    async def get(self, filter, projection=None, sort=None):
+        return await self.collection.find_one(filter, projection, sort=sort)
+
+    async def list(self, filter, projection=None, sort=None, limit=0):
+        cursor = self.collection.find(filter, projection)
+        if sort:
+            cursor = cursor.sort(list(sort))
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(limit or None)
+
+    async def iterate(self, filter, projection=None, sort=None, batch_size=1000):
+        cursor = self.collection.find(filter, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(list(sort))
+        async for doc in cursor:
+            yield doc
+
+    async def count(self, filter):
+        return await self.collection.count_documents(filter)
+
+    async def insert(self, doc):
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError as e:
+            raise DuplicateKey(str(e))
+
+    async def insert_many(self, docs):
+        if docs:
+            await self.collection.insert_many(docs)
+
+    async def replace_many(self, docs, key="id"):
+        if docs:
+            await self.collection.bulk_write(
+                [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in docs], ordered=False
+            )
+
+    async def update(self, filter, set=None, inc=None, set_on_insert=None, upsert=False):
+        result = await self.collection.update_one(filter, update_document(set, inc, set_on_insert),
+                                                  upsert=upsert)
+        return result.matched_count
+
+    async def update_many(self, filter, set):
+        result = await self.collection.update_many(filter, {"$set": set})
+        return result.matched_count, result.modified_count
+
+    async def find_one_and_update(self, filter, set=None, inc=None, set_on_insert=None,
+                                  upsert=False, sort=None, return_new=True):
+        return await self.collection.find_one_and_update(
+            filter, update_document(set, inc, set_on_insert), upsert=upsert, sort=sort,
+            return_document=ReturnDocument.AFTER if return_new else ReturnDocument.BEFORE,
+        )
+
+    async def delete(self, filter):
+        return (await self.collection.delete_one(filter)).deleted_count
+
+    async def delete_many(self, filter):
+        return (await self.collection.delete_many(filter)).deleted_count
+
+    async def group(self, filter, key=None, sums=None):
+        stage = {"_id": f"${key}" if key else None, "count": {"$sum": 1}}
+        stage.update({name: {"$sum": f"${field}"} for name, field in (sums or {}).items()})
+        rows = await self.collection.aggregate([{"$match": filter}, {"$group": stage}]).to_list(None)
+        return [row for row in rows if row["count"]]
+
+    async def bucket(self, filter, field, boundaries, default, sums=None):
+        output = {"count": {"$sum": 1}}
+        output.update({name: {"$sum": f"${source}"} for name, source in (sums or {}).items()})
+        stage = {"groupBy": f"${field}", "boundaries": list(boundaries), "default": default, "output": output}
+        return await self.collection.aggregate([{"$match": filter}, {"$bucket": stage}]).to_list(None)
+
+    async def latest_by(self, filter, key, field, projection=None):
+        pipeline = [
+            {"$match": filter},
+            {"$sort": {key: 1, field: -1}},
+            {"$group": {"_id": f"${key}", "doc": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$doc"}},
+            {"$sort": {key: 1}},
+        ]
+        if projection:
+            pipeline.append({"$project": projection})
+        return await self.collection.aggregate(pipeline).to_list(None)
+
+    async def unwind_group(self, filter, array, keys, sums):
+        stage = {"_id": {name: f"${field}" for name, field in keys.items()}, "count": {"$sum": 1}}
+        stage.update({name: {"$sum": f"${field}"} for name, field in sums.items()})
+        pipeline = [{"$match": filter}, {"$unwind": f"${array}"}, {"$group": stage}]
+        rows = await self.collection.aggregate(pipeline).to_list(None)
+        return [{**row.pop("_id"), **row} for row in rows]
+
+    async def ensure_index(self, keys, unique=False, expire_after_seconds=None):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        options = {"unique": True} if unique else {}
+        if expire_after_seconds is not None:
+            options["expireAfterSeconds"] = expire_after_seconds
+        # create_index fails with IndexOptionsConflict when an index on the same
+        # keys has another TTL, so bring the existing one in line first
+        for name, info in (await self.collection.index_information()).items():
+            if [tuple(key) for key in info["key"]] != [tuple(key) for key in keys]:
+                continue
+            current = info.get("expireAfterSeconds")
+            if current is not None and expire_after_seconds is not None and current != expire_after_seconds:
+                logger.info("Changing TTL of %s.%s from %ss to %ss", self.name, name, current,
+                            expire_after_seconds)
+                await self.collection.database.command(
+                    "collMod", self.name, index={"name": name, "expireAfterSeconds": expire_after_seconds},
+                )
+                return
+            if (current is None) != (expire_after_seconds is None):
+                # Turning a TTL on or off: collMod cannot do both ways on every
+                # server version, so rebuild the index
+                logger.info("Rebuilding %s.%s to %s its TTL", self.name, name,
+                            "remove" if expire_after_seconds is None else "add")
+                await self.collection.drop_index(name)
+            break
+        await self.collection.create_index(keys, **options)
+
+
+class MotorStorage(Storage):
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return MotorRepository(self.db[name])
+
+    def close(self):
+        self.db.client.close()
+
+
+def update_document(set=None, inc=None, set_on_insert=None) -> dict:
+    update = {}
+    if set:
+        update["$set"] = set
+    if inc:
+        update["$inc"] = inc
+    if set_on_insert:
+        update["$setOnInsert"] = set_on_insert
+    return update
+
+
+# ========== SQLITE ==========
+# Datetimes are stored as tagged ISO strings: they sort and compare correctly
+# inside SQLite and decode back to datetimes, as they would from BSON
+DATE_TAG = "$date:"
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+# TTL indexes are enforced by purging expired rows at most this often
+EXPIRE_INTERVAL_SECONDS = 60
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return DATE_TAG + value.isoformat()
+    if isinstance(value, date):
+        # Same as BSON: a calendar date becomes midnight
+        return DATE_TAG + datetime.combine(value, time.min).isoformat()
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, str) and value.startswith(DATE_TAG):
+        return datetime.fromisoformat(value[len(DATE_TAG):])
+    if isinstance(value, dict):
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+def field_expr(field: str, column: str = "doc") -> str:
+    if not FIELD_NAME.match(field):
+        raise ValueError(f"Unsupported field name {field!r}")
+    return f"json_extract({column}, '$.{field}')"
+
+
+def bind(value):
+    value = encode_value(value)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        raise ValueError("Filters on embedded documents and arrays are not supported")
+    return value
+
+
+def compile_filter(filter: dict, params: list) -> str:
+    clauses = []
+    for field, condition in filter.items():
+        if field in ("$or", "$and"):
+            parts = [compile_filter(sub, params) for sub in condition]
+            joiner = " OR " if field == "$or" else " AND "
+            clauses.append("(" + joiner.join(parts or ["1"]) + ")")
+            continue
+        expr = field_expr(field)
+        if not (isinstance(condition, dict) and any(k.startswith("$") for k in condition)):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op == "$eq" and value is None:
+                clauses.append(f"{expr} IS NULL")
+            elif op == "$eq":
+                clauses.append(f"{expr} = ?")
+                params.append(bind(value))
+            elif op == "$ne" and value is None:
+                clauses.append(f"{expr} IS NOT NULL")
+            elif op == "$ne":
+                clauses.append(f"({expr} IS NULL OR {expr} != ?)")
+                params.append(bind(value))
+            elif op in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                marks = ", ".join("?" * len(values))
+                clauses.append(f"{expr} IN ({marks})" if op == "$in"
+                               else f"({expr} IS NULL OR {expr} NOT IN ({marks}))")
+                params.extend(bind(v) for v in values)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                sql_op = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+                clauses.append(f"{expr} {sql_op} ?")
+                params.append(bind(value))
+            elif op == "$exists":
+                clauses.append(f"json_type(doc, '$.{field}') IS {'NOT ' if value else ''}NULL")
+            else:
+                raise ValueError(f"Unsupported query operator {op}")
+    return " AND ".join(clauses) or "1"
+
+
+def compile_sort(sort: Sort) -> str:
+    if not sort:
+        return ""
+    return " ORDER BY " + ", ".join(f"{field_expr(f)} {'DESC' if d < 0 else 'ASC'}" for f, d in sort)
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return doc
+    included = [f for f, v in projection.items() if v and f != "_id"]
+    if not included:
+        return {k: v for k, v in doc.items() if projection.get(k, 1)}
+    result = {f: doc[f] for f in included if f in doc}
+    if projection.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    return result
+
+
+def set_path(doc: dict, field: str, value):
+    *parents, last = field.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def get_path(doc: dict, field: str):
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def apply_update(doc: dict, set=None, inc=None) -> dict:
+    for field, value in (set or {}).items():
+        set_path(doc, field, value)
+    for field, amount in (inc or {}).items():
+        set_path(doc, field, (get_path(doc, field) or 0) + amount)
+    return doc
+
+
+def upsert_document(filter: dict, set=None, inc=None, set_on_insert=None) -> dict:
+    # Like Mongo, equality conditions of the filter seed the new document
+    doc = {field: value for field, value in filter.items()
+           if not field.startswith("$") and not (isinstance(value, dict)
+                                                and any(k.startswith("$") for k in value))}
+    doc.update(set_on_insert or {})
+    return apply_update(doc, set, inc)
+
+
+class SQLiteRepository(Repository):
+    def __init__(self, storage: "SQLiteStorage", name: str):
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name):
+            raise ValueError(f"Unsupported collection name {name!r}")
+        self.storage = storage
+        self.name = name
+
+    async def _run(self, fn, *args):
+        return await self.storage.run(self.name, fn, *args)
+
+    def _select(self, conn, filter, sort=None, limit=0, offset=0,
+                after: Optional[int] = None) -> List[Tuple[int, dict]]:
+        params: list = []
+        sql = f'SELECT rowid, doc FROM "{self.name}" WHERE {compile_filter(filter, params)}'
+        if after is not None:
+            # Keyset paging for unsorted scans
+            sql += f" AND rowid > {int(after)} ORDER BY rowid"
+        else:
+            sql += compile_sort(sort)
+        if limit:
+            sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        return [(rowid, decode_value(json.loads(doc))) for rowid, doc in conn.execute(sql, params)]
+
+    def _write(self, conn, rowid: int, doc: dict):
+        try:
+            conn.execute(f'UPDATE "{self.name}" SET doc = ? WHERE rowid = ?',
+                         (json.dumps(encode_value(doc)), rowid))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e))
+
+    def _insert(self, conn, docs: List[dict]):
+        try:
+            conn.executemany(f'INSERT INTO "{self.name}" (doc) VALUES (?)',
+                             [(json.dumps(encode_value(doc)),) for doc in docs])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e))
+
+    async def get(self, filter, projection=None, sort=None):
+        rows = await self._run(self._select, filter, sort, 1)
+        return project(rows[0][1], projection) if rows else None
+
+    async def list(self, filter, projection=None, sort=None, limit=0):
+        rows = await self._run(self._select, filter, sort, limit)
+        return [project(doc, projection) for _, doc in rows]
+
+    async def iterate(self, filter, projection=None, sort=None, batch_size=1000):
+        offset, after = 0, None if sort else 0
+        while True:
+            rows = await self._run(self._select, filter, sort, batch_size, offset, after)
+            for _, doc in rows:
+                yield project(doc, projection)
+            if len(rows) < batch_size:
+                return
+            offset += batch_size
+            if after is not None:
+                after = rows[-1][0]
+
+    async def count(self, filter):
+        params: list = []
+        sql = f'SELECT COUNT(*) FROM "{self.name}" WHERE {compile_filter(filter, params)}'
+        return await self._run(lambda conn: conn.execute(sql, params).fetchone()[0])
+
+    async def insert(self, doc):
+        await self._run(self._insert, [doc])
+
+    async def insert_many(self, docs):
+        if docs:
+            await self._run(self._insert, docs)
+
+    async def replace_many(self, docs, key="id"):
+        def replace(conn):
+            for doc in docs:
+                rows = self._select(conn, {key: doc[key]}, limit=1)
+                if rows:
+                    self._write(conn, rows[0][0], doc)
+                else:
+                    self._insert(conn, [doc])
+        if docs:
+            await self._run(replace)
+
+    def _update_one(self, conn, filter, set, inc, set_on_insert, upsert, sort, return_new):
+        rows = self._select(conn, filter, sort, 1)
+        if not rows:
+            if upsert:
+                doc = upsert_document(filter, set, inc, set_on_insert)
+                self._insert(conn, [doc])
+                return 0, doc if return_new else None
+            return 0, None
+        rowid, doc = rows[0]
+        before = json.loads(json.dumps(encode_value(doc)))
+        apply_update(doc, set, inc)
+        self._write(conn, rowid, doc)
+        return 1, doc if return_new else decode_value(before)
+
+    async def update(self, filter, set=None, inc=None, set_on_insert=None, upsert=False):
+        matched, _ = await self._run(self._update_one, filter, set, inc, set_on_insert, upsert, None, True)
+        return matched
+
+    async def update_many(self, filter, set):
+        def update(conn):
+            rows = self._select(conn, filter)
+            modified = 0
+            for rowid, doc in rows:
+                if any(get_path(doc, f) != v for f, v in set.items()):
+                    self._write(conn, rowid, apply_update(doc, set))
+                    modified += 1
+            return len(rows), modified
+        return await self._run(update)
+
+    async def find_one_and_update(self, filter, set=None, inc=None, set_on_insert=None,
+                                  upsert=False, sort=None, return_new=True):
+        _, doc = await self._run(self._update_one, filter, set, inc, set_on_insert, upsert, sort, return_new)
+        return doc
+
+    async def delete(self, filter):
+        params: list = []
+        sql = (f'DELETE FROM "{self.name}" WHERE rowid IN '
+               f'(SELECT rowid FROM "{self.name}" WHERE {compile_filter(filter, params)} LIMIT 1)')
+        return await self._run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def delete_many(self, filter):
+        params: list = []
+        sql = f'DELETE FROM "{self.name}" WHERE {compile_filter(filter, params)}'
+        return await self._run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def group(self, filter, key=None, sums=None):
+        params: list = []
+        sums = sums or {}
+        columns = [field_expr(key) if key else "NULL", "COUNT(*)"]
+        columns += [f"TOTAL({field_expr(field)})" for field in sums.values()]
+        sql = f'SELECT {", ".join(columns)} FROM "{self.name}" WHERE {compile_filter(filter, params)}'
+        if key:
+            sql += " GROUP BY 1"
+
+        def group(conn):
+            rows = []
+            for _id, count, *totals in conn.execute(sql, params):
+                if count:
+                    totals = [int(t) if t == int(t) else t for t in totals]
+                    rows.append({"_id": decode_value(_id), "count": count, **dict(zip(sums, totals))})
+            return rows
+        return await self._run(group)
+
+    async def bucket(self, filter, field, boundaries, default, sums=None):
+        params: list = []
+        sums = sums or {}
+        value = field_expr(field)
+        cases = []
+        for n, (lower, upper) in enumerate(zip(boundaries, boundaries[1:])):
+            cases.append(f"WHEN {value} >= ? AND {value} < ? THEN {n}")
+            params += [bind(lower), bind(upper)]
+        columns = [f"CASE {' '.join(cases)} ELSE -1 END", "COUNT(*)"]
+        columns += [f"TOTAL({field_expr(source)})" for source in sums.values()]
+        sql = (f'SELECT {", ".join(columns)} FROM "{self.name}" '
+               f'WHERE {compile_filter(filter, params)} GROUP BY 1 ORDER BY 1')
+
+        def bucket(conn):
+            rows = []
+            for n, count, *totals in conn.execute(sql, params):
+                totals = [int(t) if t == int(t) else t for t in totals]
+                rows.append({"_id": default if n < 0 else boundaries[n], "count": count,
+                             **dict(zip(sums, totals))})
+            # Mongo returns the default bucket last
+            return sorted(rows, key=lambda row: row["_id"] == default)
+        return await self._run(bucket)
+
+    async def latest_by(self, filter, key, field, projection=None):
+        params: list = []
+        # SQLite takes the bare doc column from the row holding the MAX()
+        sql = (f'SELECT doc, MAX({field_expr(field)}) FROM "{self.name}" '
+               f'WHERE {compile_filter(filter, params)} GROUP BY {field_expr(key)} ORDER BY {field_expr(key)}')
+
+        def latest_by(conn):
+            return [project(decode_value(json.loads(doc)), projection) for doc, _ in conn.execute(sql, params)]
+        return await self._run(latest_by)
+
+    async def unwind_group(self, filter, array, keys, sums):
+        def expr(field):
+            if field.startswith(array + "."):
+                return field_expr(field[len(array) + 1:], "element.value")
+            return field_expr(field)
+
+        params: list = []
+        columns = [expr(f) for f in keys.values()] + ["COUNT(*)"]
+        columns += [f"TOTAL({expr(f)})" for f in sums.values()]
+        elements = field_expr(array).replace("json_extract", "json_each")
+        sql = (f'SELECT {", ".join(columns)} FROM "{self.name}", {elements} AS element '
+               f'WHERE {compile_filter(filter, params)} GROUP BY {", ".join(str(n + 1) for n in range(len(keys)))}')
+
+        def unwind_group(conn):
+            rows = []
+            for row in conn.execute(sql, params):
+                values, count, totals = row[:len(keys)], row[len(keys)], row[len(keys) + 1:]
+                totals = [int(t) if t == int(t) else t for t in totals]
+                rows.append({**dict(zip(keys, map(decode_value, values))), "count": count,
+                             **dict(zip(sums, totals))})
+            return rows
+        return await self._run(unwind_group)
+
+    async def ensure_index(self, keys, unique=False, expire_after_seconds=None):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        if expire_after_seconds is not None:
+            self.storage.expiry[self.name] = (keys[0][0], expire_after_seconds)
+        elif len(keys) == 1 and self.storage.expiry.get(self.name, (None,))[0] == keys[0][0]:
+            # The same index without a TTL: stop expiring documents
+            del self.storage.expiry[self.name]
+        index_name = "_".join([self.name] + [f"{f.replace('.', '_')}_{d}" for f, d in keys])
+        columns = ", ".join(f"{field_expr(f)} {'DESC' if d < 0 else 'ASC'}" for f, d in keys)
+        sql = (f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{index_name}" '
+               f'ON "{self.name}" ({columns})')
+        await self._run(lambda conn: conn.execute(sql))
+
+
+class SQLiteStorage(Storage):
+    """Embedded storage in one SQLite file (or ``":memory:"``).
+
+    Calls are serialised through one connection on a worker thread; each call
+    runs in its own transaction, so a read-modify-write such as
+    :meth:`Repository.find_one_and_update` is atomic.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        self.tables: set = set()
+        self.expiry: Dict[str, Tuple[str, int]] = {}
+        self.expired_at: Dict[str, float] = {}
+        self._connect()
+
+    def __getitem__(self, name):
+        return SQLiteRepository(self, name)
+
+    def _connect(self):
+        # Opened on first use after close(), the way Motor reconnects
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            if self.path != ":memory:":
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.tables = set()
+
+    def _call(self, table: str, fn, args):
+        with self.lock:
+            self._connect()
+            if table not in self.tables:
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (doc TEXT NOT NULL)')
+                # Mongo's implicit unique _id index; documents without an _id are exempt
+                self.conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}__id" '
+                                  f'ON "{table}" ({field_expr("_id")})')
+                self.tables.add(table)
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire(table)
+                result = fn(self.conn, *args)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def _expire(self, table: str):
+        if table not in self.expiry or clock.monotonic() - self.expired_at.get(table, 0) < EXPIRE_INTERVAL_SECONDS:
+            return
+        field, seconds = self.expiry[table]
+        # As with Mongo TTL indexes, the field holds a naive UTC datetime
+        cutoff = DATE_TAG + datetime.utcfromtimestamp(clock.time() - seconds).isoformat()
+        self.conn.execute(f'DELETE FROM "{table}" WHERE {field_expr(field)} < ?', (cutoff,))
+        self.expired_at[table] = clock.monotonic()
+
+    async def run(self, table: str, fn, *args):
+        return await asyncio.to_thread(self._call, table, fn, args)
+
+    def close(self):
+        """Close the connection; the next call opens a new one.
+
+        An in-memory database only lives as long as its connection, so it is
+        left open and keeps its data, as a MongoDB database would.
+        """
+        if self.path == ":memory:":
+            return
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -7,6 +7,7 @@ Tests all CRUD operations for Products, Customers, Companies, and Invoices
 import requests
 import json
 import uuid
+import time
 from datetime import datetime, timedelta
 import sys
 
@@ -39,8 +40,14 @@ class InventoryAPITester:
         try:
             response = self.session.post(f"{self.base_url}/seed")
             
-            if response.status_code == 200:
-                data = response.json()
+            if response.status_code == 202:
+                job = response.json()
+                for _ in range(60):
+                    if job["status"] in ("succeeded", "failed"):
+                        break
+                    time.sleep(0.5)
+                    job = self.session.get(f"{self.base_url}/jobs/{job['id']}").json()
+                data = job.get("result") or {}
                 if "message" in data and "data" in data:
                     self.log_result("Database Seeding", True, f"Seeded {data['data']}")
                     return True
@@ -457,20 +464,21 @@ class InventoryAPITester:
         # Test PUT update invoice
         update_data = {
             "status": "pending",
-            "notes": "Updated test invoice - payment pending"
+            "notes": "Updated test invoice - payment pending",
+            "dueDate": "2024-09-01"
         }
         
         try:
             response = self.session.put(f"{self.base_url}/invoices/{invoice_id}", json=update_data)
             if response.status_code == 200:
                 updated_invoice = response.json()
-                if updated_invoice["status"] == "pending":
+                if updated_invoice["status"] == "pending" and updated_invoice["dueDate"].startswith("2024-09-01"):
                     self.log_result("PUT Invoice Update", True, "Invoice updated successfully")
                 else:
                     self.log_result("PUT Invoice Update", False, "Update data not applied correctly")
                     return False
             else:
-                self.log_result("PUT Invoice Update", False, f"Status: {response.status_code}")
+                self.log_result("PUT Invoice Update", False, f"Status: {response.status_code}, Response: {response.text}")
                 return False
         except Exception as e:
             self.log_result("PUT Invoice Update", False, f"Exception: {str(e)}")
@@ -490,6 +498,32 @@ class InventoryAPITester:
         
         return True
     
+    def test_batched_lookup(self):
+        """Test POST /api/{entity}/lookup endpoints"""
+        print("\n=== Testing Batched Lookup ===")
+        
+        try:
+            products = self.session.get(f"{self.base_url}/products").json()
+            fake_id = str(uuid.uuid4())
+            ids = [p["id"] for p in reversed(products[:3])] + [fake_id]
+            response = self.session.post(f"{self.base_url}/products/lookup", json={"ids": ids})
+            if response.status_code == 200:
+                data = response.json()
+                returned_ids = [p["id"] for p in data["items"]]
+                if returned_ids == ids[:-1] and data["missing"] == [fake_id]:
+                    self.log_result("Products Lookup", True, f"Resolved {len(returned_ids)} products in order")
+                else:
+                    self.log_result("Products Lookup", False, "Order or missing ids not reported correctly")
+                    return False
+            else:
+                self.log_result("Products Lookup", False, f"Status: {response.status_code}")
+                return False
+        except Exception as e:
+            self.log_result("Products Lookup", False, f"Exception: {str(e)}")
+            return False
+        
+        return True
+    
     def test_error_handling(self):
         """Test error handling for invalid data"""
         print("\n=== Testing Error Handling ===")
@@ -535,6 +569,7 @@ class InventoryAPITester:
             self.test_customers_crud()
             self.test_companies_crud()
             self.test_invoices_crud()
+            self.test_batched_lookup()
         else:
             print("⚠️  Skipping CRUD tests due to seeding failure")
         
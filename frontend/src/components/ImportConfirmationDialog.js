@@ -20,6 +20,7 @@ import {
 } from './ui/table';
 import { Checkbox } from './ui/checkbox';
 import { Badge } from './ui/badge';
+import ImportStatusBadge from './shared/ImportStatusBadge';
 import { AlertTriangle, CheckCircle2, X } from 'lucide-react';
 
 const ImportConfirmationDialog = ({ 
@@ -177,6 +178,7 @@ const ImportConfirmationDialog = ({
             <TableHeader className="sticky top-0 bg-white">
               <TableRow>
                 <TableHead className="w-12">Select</TableHead>
+                <TableHead>Status</TableHead>
                 <TableHead className="min-w-48">Product Name *</TableHead>
                 <TableHead>SKU</TableHead>
                 <TableHead>Category</TableHead>
@@ -197,6 +199,9 @@ const ImportConfirmationDialog = ({
                       onCheckedChange={(checked) => handleSelectChange(index, checked)}
                     />
                   </TableCell>
+                  <TableCell>
+                    <ImportStatusBadge status={item.importStatus} problems={item.importProblems} />
+                  </TableCell>
                   <TableCell>
                     <Input
                       value={item.name}
@@ -43,7 +43,8 @@ import { useToast } from '../hooks/use-toast';
 import { 
   downloadInventoryTemplate, 
   processInventoryExcel,
-  exportToExcel 
+  applyImportValidation,
+  importIdempotencyKey
 } from '../utils/excelUtils';
 import apiService from '../services/api';
 import ImportConfirmationDialog from './ImportConfirmationDialog';
@@ -245,25 +246,22 @@ const Inventory = () => {
     }
   };
 
-  const handleExportExcel = () => {
-    const exportData = products.map(product => ({
-      'Product Name': product.name,
-      'SKU': product.sku,
-      'Category': product.category,
-      'Price': product.price,
-      'Stock Quantity': product.stock,
-      'Minimum Stock': product.minStock,
-      'Unit': product.unit,
-      'HSN Code': product.hsn,
-      'GST Rate (%)': product.gstRate,
-      'Supplier': product.supplier
-    }));
-
-    exportToExcel(exportData, 'Inventory_Export.xlsx', 'Inventory');
-    toast({
-      title: "Success",
-      description: "Inventory exported successfully",
-    });
+  // Built server-side so the file holds every product, not just the loaded page
+  const handleExportExcel = async () => {
+    try {
+      await apiService.exportProducts();
+      toast({
+        title: "Success",
+        description: "Inventory exported successfully",
+      });
+    } catch (error) {
+      console.error('Export error:', error);
+      toast({
+        title: "Export Error",
+        description: error.message || "Failed to export inventory",
+        variant: "destructive",
+      });
+    }
   };
 
   const handleDownloadTemplate = () => {
@@ -289,7 +287,8 @@ const Inventory = () => {
 
     try {
       const importedProducts = await processInventoryExcel(file);
-      setPendingImportItems(importedProducts);
+      const validation = await apiService.validateImport({ products: importedProducts });
+      setPendingImportItems(applyImportValidation(importedProducts, validation.products));
       setShowImportDialog(true);
     } catch (error) {
       console.error('Import error:', error);
@@ -313,7 +312,7 @@ const Inventory = () => {
       // Add imported products using API
       for (const product of selectedItems) {
         try {
-          const newProduct = await apiService.createProduct({
+          const payload = {
             name: product.name,
             sku: product.sku,
             category: product.category,
@@ -324,8 +323,17 @@ const Inventory = () => {
             hsn: product.hsn,
             gstRate: product.gstRate,
             supplier: product.supplier
-          });
-          setProducts(prevProducts => [...prevProducts, newProduct]);
+          };
+          if (product.importStatus === 'update' && product.existingId) {
+            // The SKU is already in inventory: update that product instead of adding a duplicate
+            const updatedProduct = await apiService.updateProduct(product.existingId, payload);
+            setProducts(prevProducts => prevProducts.map(p => p.id === updatedProduct.id ? updatedProduct : p));
+          } else {
+            const newProduct = await apiService.createProduct(
+              payload, importIdempotencyKey('product', product.sku, payload)
+            );
+            setProducts(prevProducts => [...prevProducts, newProduct]);
+          }
           successCount++;
         } catch (error) {
           console.error(`Failed to import product ${product.name}:`, error);
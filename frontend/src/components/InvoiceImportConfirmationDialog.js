@@ -20,6 +20,7 @@ import {
 } from './ui/table';
 import { Checkbox } from './ui/checkbox';
 import { Badge } from './ui/badge';
+import ImportStatusBadge from './shared/ImportStatusBadge';
 import { AlertTriangle, CheckCircle2, X, FileSpreadsheet } from 'lucide-react';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from './ui/tabs';
 
@@ -247,6 +248,7 @@ const InvoiceImportConfirmationDialog = ({
                 <TableHeader className="sticky top-0 bg-white">
                   <TableRow>
                     <TableHead className="w-12">Select</TableHead>
+                    <TableHead>Status</TableHead>
                     <TableHead className="min-w-32">Invoice Number *</TableHead>
                     <TableHead className="min-w-48">Customer Name *</TableHead>
                     <TableHead>Email</TableHead>
@@ -266,6 +268,9 @@ const InvoiceImportConfirmationDialog = ({
                           onCheckedChange={(checked) => handleInvoiceSelectChange(index, checked)}
                         />
                       </TableCell>
+                      <TableCell>
+                        <ImportStatusBadge status={invoice.importStatus} problems={invoice.importProblems} />
+                      </TableCell>
                       <TableCell>
                         <Input
                           value={invoice.invoiceNumber}
@@ -365,6 +370,7 @@ const InvoiceImportConfirmationDialog = ({
                 <TableHeader className="sticky top-0 bg-white">
                   <TableRow>
                     <TableHead className="w-12">Select</TableHead>
+                    <TableHead>Status</TableHead>
                     <TableHead className="min-w-48">Product Name *</TableHead>
                     <TableHead>SKU</TableHead>
                     <TableHead>Category</TableHead>
@@ -385,6 +391,9 @@ const InvoiceImportConfirmationDialog = ({
                           onCheckedChange={(checked) => handleProductSelectChange(index, checked)}
                         />
                       </TableCell>
+                      <TableCell>
+                        <ImportStatusBadge status={product.importStatus} problems={product.importProblems} />
+                      </TableCell>
                       <TableCell>
                         <Input
                           value={product.name}
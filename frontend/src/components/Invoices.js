@@ -43,7 +43,8 @@ import CreateInvoiceForm from './forms/CreateInvoiceForm';
 import { 
   downloadInvoiceTemplate, 
   processInvoiceExcel,
-  exportToExcel 
+  applyImportValidation,
+  importIdempotencyKey
 } from '../utils/excelUtils';
 import { useToast } from '../hooks/use-toast';
 import apiService from '../services/api';
@@ -169,24 +170,22 @@ const Invoices = () => {
     return matchesSearch && matchesStatus;
   });
 
-  const handleExportExcel = () => {
-    const exportData = invoices.map(invoice => ({
-      'Invoice Number': invoice.invoiceNumber,
-      'Customer Name': invoice.customerName,
-      'Date': formatDate(invoice.date),
-      'Due Date': formatDate(invoice.dueDate),
-      'Amount': invoice.amount,
-      'GST Amount': invoice.gstAmount,
-      'Total Amount': invoice.totalAmount,
-      'Status': invoice.status,
-      'Notes': invoice.notes || ''
-    }));
-
-    exportToExcel(exportData, 'Invoices_Export.xlsx', 'Invoices');
-    toast({
-      title: "Success",
-      description: "Invoices exported successfully",
-    });
+  // Built server-side so the file holds every matching invoice, not just the loaded page
+  const handleExportExcel = async () => {
+    try {
+      await apiService.exportInvoices(statusFilter === 'all' ? {} : { status: statusFilter });
+      toast({
+        title: "Success",
+        description: "Invoices exported successfully",
+      });
+    } catch (error) {
+      console.error('Export error:', error);
+      toast({
+        title: "Export Error",
+        description: error.message || "Failed to export invoices",
+        variant: "destructive",
+      });
+    }
   };
 
   const handleDownloadTemplate = () => {
@@ -212,7 +211,11 @@ const Invoices = () => {
 
     try {
       const importedData = await processInvoiceExcel(file);
-      setPendingImportData(importedData);
+      const validation = await apiService.validateImport(importedData);
+      setPendingImportData({
+        invoices: applyImportValidation(importedData.invoices, validation.invoices),
+        products: applyImportValidation(importedData.products, validation.products)
+      });
       setShowImportDialog(true);
     } catch (error) {
       console.error('Import error:', error);
@@ -238,7 +241,7 @@ const Invoices = () => {
       // Create invoices
       for (const invoice of selectedData.invoices) {
         try {
-          const newInvoice = await apiService.createInvoice({
+          const payload = {
             invoiceNumber: invoice.invoiceNumber,
             customerId: invoice.customerId,
             customerName: invoice.customerName,
@@ -251,7 +254,10 @@ const Invoices = () => {
             items: invoice.items,
             notes: invoice.notes,
             status: invoice.status
-          });
+          };
+          const newInvoice = await apiService.createInvoice(
+            payload, importIdempotencyKey('invoice', invoice.invoiceNumber, payload)
+          );
           setInvoices(prevInvoices => [...prevInvoices, newInvoice]);
           invoiceSuccessCount++;
         } catch (error) {
@@ -263,7 +269,7 @@ const Invoices = () => {
       // Create products in inventory
       for (const product of selectedData.products) {
         try {
-          const newProduct = await apiService.createProduct({
+          const payload = {
             name: product.name,
             sku: product.sku,
             category: product.category,
@@ -274,7 +280,15 @@ const Invoices = () => {
             hsn: product.hsn,
             gstRate: product.gstRate,
             supplier: product.supplier
-          });
+          };
+          if (product.importStatus === 'update' && product.existingId) {
+            // Already in inventory: refresh its details but leave its stock alone,
+            // since an invoice sheet says nothing about stock on hand
+            const { stock, ...details } = payload;
+            await apiService.updateProduct(product.existingId, details);
+          } else {
+            await apiService.createProduct(payload, importIdempotencyKey('product', product.sku, payload));
+          }
           productSuccessCount++;
         } catch (error) {
           console.error(`Failed to import product ${product.name}:`, error);
@@ -0,0 +1,22 @@
+import React from 'react';
+import { Badge } from '../ui/badge';
+
+const STATUS_VARIANTS = {
+  new: 'default',
+  update: 'secondary',
+  conflict: 'destructive',
+  'missing-reference': 'outline',
+};
+
+// Server-side dry-run result for one import row (see applyImportValidation)
+const ImportStatusBadge = ({ status, problems = [] }) => {
+  if (!status) return null;
+
+  return (
+    <Badge variant={STATUS_VARIANTS[status] || 'outline'} title={problems.join('\n')}>
+      {status}
+    </Badge>
+  );
+};
+
+export default ImportStatusBadge;
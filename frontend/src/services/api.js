@@ -3,16 +3,23 @@ const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || import.meta.env.REACT_
 class ApiService {
   constructor(baseURL) {
     this.baseURL = baseURL;
+    this.companyId = null;
+  }
+
+  // Scope products, customers and invoices to a company (tenant)
+  setCompanyId(companyId) {
+    this.companyId = companyId;
   }
 
   async request(endpoint, options = {}) {
     const url = `${this.baseURL}${endpoint}`;
     const config = {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...(this.companyId ? { 'X-Company-Id': this.companyId } : {}),
         ...options.headers,
       },
-      ...options,
     };
 
     try {
@@ -39,18 +46,47 @@ class ApiService {
     }
   }
 
+  // Appends ?fields=a,b so list/detail endpoints return only those columns
+  withFields(endpoint, fields) {
+    return fields && fields.length ? `${endpoint}?fields=${encodeURIComponent(fields.join(','))}` : endpoint;
+  }
+
+  // Fetches a file endpoint and saves the response body under its attachment name
+  async download(endpoint, fallbackName) {
+    const response = await fetch(`${this.baseURL}${endpoint}`, {
+      headers: this.companyId ? { 'X-Company-Id': this.companyId } : {},
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${await response.text()}`);
+    }
+    const disposition = response.headers.get('Content-Disposition') || '';
+    const match = disposition.match(/filename="([^"]+)"/);
+    const url = URL.createObjectURL(await response.blob());
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = match ? match[1] : fallbackName;
+    link.click();
+    URL.revokeObjectURL(url);
+  }
+
   // Generic CRUD methods
   async get(endpoint) {
     return this.request(endpoint, { method: 'GET' });
   }
 
-  async post(endpoint, data) {
+  async post(endpoint, data, headers = {}) {
     return this.request(endpoint, {
       method: 'POST',
       body: JSON.stringify(data),
+      headers,
     });
   }
 
+  // Retrying a create with the same key replays the original response
+  idempotencyHeaders(idempotencyKey) {
+    return idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {};
+  }
+
   async put(endpoint, data) {
     return this.request(endpoint, {
       method: 'PUT',
@@ -63,16 +99,25 @@ class ApiService {
   }
 
   // Products
-  async getProducts() {
-    return this.get('/api/products');
+  async getProducts(fields) {
+    return this.get(this.withFields('/api/products', fields));
+  }
+
+  async lookupProducts(ids) {
+    return this.post('/api/products/lookup', { ids });
+  }
+
+  // Full inventory in the import template layout, built server-side
+  async exportProducts() {
+    return this.download('/api/products/export.xlsx', 'inventory.xlsx');
   }
 
   async getProduct(id) {
     return this.get(`/api/products/${id}`);
   }
 
-  async createProduct(product) {
-    return this.post('/api/products', product);
+  async createProduct(product, idempotencyKey) {
+    return this.post('/api/products', product, this.idempotencyHeaders(idempotencyKey));
   }
 
   async updateProduct(id, product) {
@@ -84,16 +129,20 @@ class ApiService {
   }
 
   // Customers
-  async getCustomers() {
-    return this.get('/api/customers');
+  async getCustomers(fields) {
+    return this.get(this.withFields('/api/customers', fields));
+  }
+
+  async lookupCustomers(ids) {
+    return this.post('/api/customers/lookup', { ids });
   }
 
   async getCustomer(id) {
     return this.get(`/api/customers/${id}`);
   }
 
-  async createCustomer(customer) {
-    return this.post('/api/customers', customer);
+  async createCustomer(customer, idempotencyKey) {
+    return this.post('/api/customers', customer, this.idempotencyHeaders(idempotencyKey));
   }
 
   async updateCustomer(id, customer) {
@@ -105,16 +154,16 @@ class ApiService {
   }
 
   // Companies
-  async getCompanies() {
-    return this.get('/api/companies');
+  async getCompanies(fields) {
+    return this.get(this.withFields('/api/companies', fields));
   }
 
   async getCompany(id) {
     return this.get(`/api/companies/${id}`);
   }
 
-  async createCompany(company) {
-    return this.post('/api/companies', company);
+  async createCompany(company, idempotencyKey) {
+    return this.post('/api/companies', company, this.idempotencyHeaders(idempotencyKey));
   }
 
   async updateCompany(id, company) {
@@ -126,16 +175,26 @@ class ApiService {
   }
 
   // Invoices
-  async getInvoices() {
-    return this.get('/api/invoices');
+  async getInvoices(fields) {
+    return this.get(this.withFields('/api/invoices', fields));
+  }
+
+  async lookupInvoices(ids) {
+    return this.post('/api/invoices/lookup', { ids });
+  }
+
+  // One row per line item in the invoice import layout; takes the list filters
+  async exportInvoices(filters = {}) {
+    const query = new URLSearchParams(filters).toString();
+    return this.download(`/api/invoices/export.xlsx${query ? `?${query}` : ''}`, 'invoices.xlsx');
   }
 
   async getInvoice(id) {
     return this.get(`/api/invoices/${id}`);
   }
 
-  async createInvoice(invoice) {
-    return this.post('/api/invoices', invoice);
+  async createInvoice(invoice, idempotencyKey) {
+    return this.post('/api/invoices', invoice, this.idempotencyHeaders(idempotencyKey));
   }
 
   async updateInvoice(id, invoice) {
@@ -146,9 +205,69 @@ class ApiService {
     return this.delete(`/api/invoices/${id}`);
   }
 
-  // Seed database
+  // Sales analytics, read from the daily per-product rollups
+  async getTopProducts(params = {}) {
+    return this.get(`/api/sales/top-products?${new URLSearchParams(params)}`);
+  }
+
+  async getAbcClassification(params = {}) {
+    return this.get(`/api/sales/abc?${new URLSearchParams(params)}`);
+  }
+
+  async rebuildSalesRollups() {
+    return this.waitForJob(await this.post('/api/sales/rollups/rebuild', {}));
+  }
+
+  // Reorder suggestions grouped by supplier, from the last scheduled or manual run
+  async getReorderSuggestions(supplier) {
+    return this.get(`/api/reorder-suggestions${supplier !== undefined ? `?${new URLSearchParams({ supplier })}` : ''}`);
+  }
+
+  async runReorderSuggestions() {
+    return this.waitForJob(await this.post('/api/reorder-suggestions/run', {}));
+  }
+
+  // Dry-run an import: per-row new/update/conflict/missing-reference flags, nothing written
+  async validateImport({ products = [], invoices = [] }) {
+    return this.post('/api/import/validate', {
+      products: products.map(({ sku, name }) => ({ sku, name })),
+      invoices: invoices.map(({
+        invoiceNumber, customerId, customerName, customerGSTIN, customerEmail, items = []
+      }) => ({
+        invoiceNumber,
+        customerId,
+        customerName,
+        customerGSTIN,
+        customerEmail,
+        items: items.map(({ productId, sku }) => ({ productId, sku })),
+      })),
+    });
+  }
+
+  // Delta sync: ids changed/deleted since a change sequence number
+  async sync(since = 0) {
+    return this.get(`/api/sync?since=${since}`);
+  }
+
+  // Background jobs: heavy endpoints answer 202 with a job to poll
+  async getJob(id) {
+    return this.get(`/api/jobs/${id}`);
+  }
+
+  async waitForJob(job, intervalMs = 500) {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+      job = await this.getJob(job.id);
+    }
+    if (job.status === 'failed') {
+      throw new Error(`Job ${job.kind} failed: ${job.error}`);
+    }
+    return job.result;
+  }
+
+  // Seed database (runs as a job; resolves with the seed summary)
   async seedDatabase() {
-    return this.post('/api/seed', {});
+    return this.waitForJob(await this.post('/api/seed', {}));
   }
 }
 
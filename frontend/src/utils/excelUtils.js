@@ -127,11 +127,12 @@ export const processInventoryExcel = (file) => {
     reader.onload = (e) => {
       try {
         const data = e.target.result;
-        const workbook = XLSX.read(data, { type: 'binary' });
+        const workbook = XLSX.read(data, { type: 'binary', cellDates: true });
         const sheetName = workbook.SheetNames[0];
         const worksheet = workbook.Sheets[sheetName];
         const jsonData = XLSX.utils.sheet_to_json(worksheet, { 
           raw: false, // Keep original string values
+          dateNF: 'yyyy-mm-dd', // Date cells come out as ISO dates whatever their display format
           defval: '' // Default empty cells to empty string
         });
         
@@ -167,7 +168,7 @@ export const processInventoryExcel = (file) => {
           return {
             id: Date.now() + Math.random(), // Generate unique ID
             name: productName.trim(),
-            sku: sku.trim() || `SKU-${Date.now()}-${index}`,
+            sku: sku.trim() || `SKU-${stableHash(productName.trim())}`,
             category: category.trim() || 'General',
             price: parsedPrice,
             stock: parsedStock,
@@ -194,6 +195,41 @@ export const processInventoryExcel = (file) => {
   });
 };
 
+const MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'];
+
+// Normalise a date typed into a sheet to YYYY-MM-DD, or null if it is not a date.
+// Numeric dates are read day first (12/03/2024 is 12 March), as written in India;
+// two-digit years are taken as 20xx.
+export const toIsoDate = (value) => {
+  const text = String(value ?? '').trim();
+  let year, month, day;
+  let match = text.match(/^(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ].*)?$/);
+  if (match) {
+    [, year, month, day] = match.map(Number);
+  } else if ((match = text.match(/^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})$/))) {
+    [, day, month, year] = match.map(Number);
+  } else if ((match = text.match(/^(\d{1,2})[\s/.-]([A-Za-z]{3,9})[\s/.,-]+(\d{2}|\d{4})$/))) {
+    day = Number(match[1]);
+    month = MONTHS.indexOf(match[2].slice(0, 3).toLowerCase()) + 1;
+    year = Number(match[3]);
+  } else {
+    return null;
+  }
+  if (year < 100) year += 2000;
+  const parsed = new Date(Date.UTC(year, month - 1, day));
+  if (month < 1 || parsed.getUTCMonth() !== month - 1 || parsed.getUTCDate() !== day) {
+    return null;
+  }
+  return parsed.toISOString().split('T')[0];
+};
+
+// 30 days after the invoice date, so the same sheet always parses to the same invoice
+const defaultDueDate = (invoiceDate) => {
+  const parsed = new Date(invoiceDate);
+  const start = isNaN(parsed.getTime()) ? Date.now() : parsed.getTime();
+  return new Date(start + 30*24*60*60*1000).toISOString().split('T')[0];
+};
+
 // Process invoice Excel file
 export const processInvoiceExcel = (file) => {
   return new Promise((resolve, reject) => {
@@ -202,11 +238,12 @@ export const processInvoiceExcel = (file) => {
     reader.onload = (e) => {
       try {
         const data = e.target.result;
-        const workbook = XLSX.read(data, { type: 'binary' });
+        const workbook = XLSX.read(data, { type: 'binary', cellDates: true });
         const sheetName = workbook.SheetNames[0];
         const worksheet = workbook.Sheets[sheetName];
         const jsonData = XLSX.utils.sheet_to_json(worksheet, { 
           raw: false, // Keep original string values
+          dateNF: 'yyyy-mm-dd', // Date cells come out as ISO dates whatever their display format
           defval: '' // Default empty cells to empty string
         });
         
@@ -247,6 +284,12 @@ export const processInvoiceExcel = (file) => {
           const parsedStock = parseInt(stock.toString().replace(/[^0-9]/g, '')) || 1;
           const parsedGstRate = parseInt(gstRate.toString().replace(/[^0-9]/g, '')) || 18;
 
+          const isoInvoiceDate = toIsoDate(invoiceDate);
+          const isoDueDate = dueDate.toString().trim() ? toIsoDate(dueDate) : defaultDueDate(isoInvoiceDate);
+          if (!isoInvoiceDate || !isoDueDate) {
+            throw new Error(`Row ${index + 2}: Dates must look like 2024-03-12, 12/03/2024 or 12-Mar-24. Found: Invoice Date="${invoiceDate}", Due Date="${dueDate}"`);
+          }
+
           if (isNaN(parsedPrice) || isNaN(parsedStock)) {
             throw new Error(`Row ${index + 2}: Invalid numeric values. Price="${price}" (parsed: ${parsedPrice}), Stock="${stock}" (parsed: ${parsedStock})`);
           }
@@ -256,14 +299,15 @@ export const processInvoiceExcel = (file) => {
             invoicesMap[invoiceNumber] = {
               id: `INV-${Date.now()}-${Math.random()}`,
               invoiceNumber: invoiceNumber.trim(),
-              customerId: `CUST-${Date.now()}-${Math.random()}`,
+              // Derived from the customer's details so re-reading the sheet gives the same id
+              customerId: `CUST-${stableHash(customerGSTIN.trim() || customerEmail.trim() || customerName.trim())}`,
               customerName: customerName.trim(),
               customerEmail: customerEmail.trim() || '',
               customerPhone: customerPhone.trim() || '',
               customerAddress: customerAddress.trim() || '',
               customerGSTIN: customerGSTIN.trim() || '',
-              date: invoiceDate.trim(),
-              dueDate: dueDate.trim() || new Date(Date.now() + 30*24*60*60*1000).toISOString().split('T')[0],
+              date: isoInvoiceDate,
+              dueDate: isoDueDate,
               items: [],
               notes: notes.trim() || '',
               status: 'draft',
@@ -273,9 +317,9 @@ export const processInvoiceExcel = (file) => {
 
           // Add item to invoice
           const item = {
-            productId: sku.trim() || `PROD-${Date.now()}-${index}`,
+            productId: sku.trim() || `PROD-${stableHash(productName.trim())}`,
             name: productName.trim(),
-            sku: sku.trim() || `SKU-${Date.now()}-${index}`,
+            sku: sku.trim() || `SKU-${stableHash(productName.trim())}`,
             category: category.trim() || 'General',
             quantity: parsedStock,
             price: parsedPrice,
@@ -342,6 +386,46 @@ export const processInvoiceExcel = (file) => {
   });
 };
 
+// 53-bit string hash (cyrb53); the same input always gives the same short id
+export const stableHash = (text) => {
+  let h1 = 0xdeadbeef;
+  let h2 = 0x41c6ce57;
+  for (let i = 0; i < text.length; i++) {
+    const ch = text.charCodeAt(i);
+    h1 = Math.imul(h1 ^ ch, 2654435761);
+    h2 = Math.imul(h2 ^ ch, 1597334677);
+  }
+  h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+  h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+  return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(36);
+};
+
+// Idempotency-Key for creating an imported row. It depends only on the row's
+// natural key (SKU, invoice number) and the exact payload sent: re-running the
+// same import replays the earlier creates, while a corrected row gets a new key.
+export const importIdempotencyKey = (kind, naturalKey, payload) => {
+  return `import-${kind}-${encodeURIComponent(naturalKey)}-${stableHash(JSON.stringify(payload))}`;
+};
+
+// Attach the server's dry-run result (POST /api/import/validate) to each parsed row.
+// Conflicting rows start unselected so they are not imported by accident,
+// "update" rows keep the id of the record they update, and invoices matched
+// to an existing customer take that customer's id.
+export const applyImportValidation = (rows, results = []) => {
+  return rows.map((row, index) => {
+    const result = results[index];
+    if (!result) return row;
+    return {
+      ...row,
+      ...(result.customerId ? { customerId: result.customerId } : {}),
+      existingId: result.existingId || null,
+      importStatus: result.status,
+      importProblems: result.problems,
+      selected: row.selected && result.status !== 'conflict'
+    };
+  });
+};
+
 // Export data to Excel
 export const exportToExcel = (data, filename, sheetName = 'Sheet1') => {
   const ws = XLSX.utils.json_to_sheet(data);
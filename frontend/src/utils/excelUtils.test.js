@@ -0,0 +1,27 @@
+import { toIsoDate } from './excelUtils';
+
+describe('toIsoDate', () => {
+  it('keeps ISO dates', () => {
+    expect(toIsoDate('2024-03-12')).toBe('2024-03-12');
+    expect(toIsoDate('2024-3-2T10:00:00')).toBe('2024-03-02');
+  });
+
+  it('reads numeric dates day first', () => {
+    expect(toIsoDate('12/03/2024')).toBe('2024-03-12');
+    expect(toIsoDate('1.7.24')).toBe('2024-07-01');
+    expect(toIsoDate('31-12-2024')).toBe('2024-12-31');
+  });
+
+  it('reads dates with month names', () => {
+    expect(toIsoDate('3-Dec-24')).toBe('2024-12-03');
+    expect(toIsoDate('15 March 2024')).toBe('2024-03-15');
+  });
+
+  it('rejects anything that is not a real date', () => {
+    expect(toIsoDate('')).toBeNull();
+    expect(toIsoDate('next week')).toBeNull();
+    expect(toIsoDate('31/02/2024')).toBeNull();
+    expect(toIsoDate('12/13/2024')).toBeNull();
+    expect(toIsoDate('3-Foo-24')).toBeNull();
+  });
+});
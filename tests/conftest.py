@@ -0,0 +1,77 @@
+"""API tests against the embedded SQLite backend, no MongoDB needed.
+
+Run from the repository root with ``python -m pytest -q tests``.
+"""
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+server.job_queue.poll_interval = 0.05
+
+
+@pytest.fixture
+def client():
+    # A new client per test also runs startup and shutdown every time
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def company(client):
+    """A tenant of its own, so tests never see each other's data."""
+    company_id = f"test-{uuid.uuid4().hex[:8]}"
+    client.headers["X-Company-Id"] = company_id
+    return company_id
+
+
+def wait_for_job(client, response, timeout: float = 10) -> dict:
+    assert response.status_code == 202, response.text
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(response.headers["Location"]).json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def make_product(client, sku: str, **fields) -> dict:
+    payload = {"name": f"Product {sku}", "sku": sku, "category": "General", "price": 100.0,
+               "stock": 10, "minStock": 2, "hsn": "8471", "gstRate": 18, **fields}
+    response = client.post("/api/products", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def make_customer(client, name: str = "Acme Traders", **fields) -> dict:
+    payload = {"name": name, "email": f"{name.split()[0].lower()}@example.com", "phone": "+91 9000000000",
+               **fields}
+    response = client.post("/api/customers", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def invoice_payload(customer: dict, product: dict, number: str, quantity: int = 2, **fields) -> dict:
+    return {
+        "invoiceNumber": number,
+        "customerId": customer["id"],
+        "customerName": customer["name"],
+        "customerGSTIN": customer.get("gstin", ""),
+        "date": "2024-07-01",
+        "dueDate": "2024-07-31",
+        "items": [{"productId": product["id"], "name": product["name"], "sku": product["sku"],
+                   "quantity": quantity, "price": product["price"], "hsn": product["hsn"],
+                   "gstRate": product["gstRate"], "amount": quantity * product["price"]}],
+        "status": "pending",
+        **fields,
+    }
@@ -0,0 +1,46 @@
+import server
+
+
+def test_admin_endpoints_are_closed_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "")
+    assert client.get("/api/admin/backup").status_code == 503
+
+
+def test_admin_endpoints_check_the_token(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/api/admin/backup").status_code == 403
+    assert client.get("/api/admin/backup", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    # Past the token check, sqlite mode stops at the Mongo-only guard
+    assert client.get("/api/admin/backup", headers={"X-Admin-Token": "s3cret"}).status_code == 501
+
+
+def test_archiving_needs_the_admin_token(client, company, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/api/invoices/archive").status_code == 403
+    headers = {"X-Admin-Token": "s3cret"}
+    assert client.post("/api/invoices/archive", params={"older_than_days": -1}, headers=headers).status_code == 422
+    assert client.post("/api/invoices/archive", params={"older_than_days": 30}, headers=headers).status_code == 202
+
+
+def test_hsn_rates_are_changed_by_the_operator_only(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    rates = [{"hsn": "9999", "rate": 5}]
+    assert client.put("/api/gst/hsn-rates", json=rates).status_code == 403
+    response = client.put("/api/gst/hsn-rates", json=rates, headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200, response.text
+    assert {"hsn": "9999", "rate": 5.0, "description": ""} in client.get("/api/gst/hsn-rates").json()
+
+
+def test_jobs_are_visible_to_their_tenant_only(client, company, monkeypatch):
+    response = client.post("/api/sales/rollups/rebuild")
+    location = response.headers["Location"]
+    assert location.startswith(f"/api/companies/{company}/jobs/")
+    job_id = response.json()["id"]
+    assert client.get(f"/api/jobs/{job_id}").status_code == 200
+    assert client.get(f"/api/jobs/{job_id}", headers={"X-Company-Id": f"{company}-other"}).status_code == 404
+    assert client.get(f"/api/companies/{company}-other/jobs/{job_id}").status_code == 404
+
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    archive = client.post("/api/invoices/archive", headers={"X-Admin-Token": "s3cret"})
+    assert client.get(archive.headers["Location"]).status_code == 403
+    assert client.get(archive.headers["Location"], headers={"X-Admin-Token": "s3cret"}).status_code == 200
@@ -0,0 +1,254 @@
+import time
+from datetime import datetime, timedelta
+
+import server
+from fastapi.testclient import TestClient
+
+from .conftest import invoice_payload, make_customer, make_product, wait_for_job
+
+
+def test_app_restarts_on_the_same_store(client, company):
+    product = make_product(client, "RESTART-1")
+    client.__exit__(None, None, None)
+    with TestClient(server.app) as again:
+        response = again.get(f"/api/products/{product['id']}", headers={"X-Company-Id": company})
+    assert response.status_code == 200
+    assert response.json()["sku"] == "RESTART-1"
+
+
+def test_products_are_scoped_by_company(client, company):
+    make_product(client, "SCOPE-1")
+    assert [p["sku"] for p in client.get("/api/products").json()] == ["SCOPE-1"]
+    assert client.get("/api/products", headers={"X-Company-Id": f"{company}-other"}).json() == []
+
+
+def test_lookup_reports_missing_ids(client, company):
+    product = make_product(client, "LOOKUP-1")
+    response = client.post("/api/products/lookup", json={"ids": [product["id"], "nope", product["id"]]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [p["id"] for p in body["items"]] == [product["id"]]
+    assert body["missing"] == ["nope"]
+
+
+def test_sparse_fieldsets(client, company):
+    make_product(client, "FIELDS-1")
+    products = client.get("/api/products", params={"fields": "sku,price"}).json()
+    assert products == [{"id": products[0]["id"], "sku": "FIELDS-1", "price": 100.0}]
+
+
+def test_idempotency_key_replays_the_first_response(client, company):
+    headers = {"Idempotency-Key": "create-once"}
+    payload = {"name": "Once", "sku": "IDEM-1", "category": "General", "price": 5, "stock": 1}
+    first = client.post("/api/products", json=payload, headers=headers)
+    second = client.post("/api/products", json=payload, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+    assert len(client.get("/api/products").json()) == 1
+
+    changed = client.post("/api/products", json={**payload, "price": 6}, headers=headers)
+    assert changed.status_code == 422
+
+
+def test_invoice_dates_can_be_updated(client, company):
+    invoice = client.post("/api/invoices", json=invoice_payload(
+        make_customer(client), make_product(client, "DATES-1"), "INV-DATES")).json()
+    response = client.put(f"/api/invoices/{invoice['id']}", json={"date": "2024-08-01", "dueDate": "2024-09-01"})
+    assert response.status_code == 200, response.text
+    assert response.json()["date"].startswith("2024-08-01")
+    assert response.json()["dueDate"].startswith("2024-09-01")
+
+
+def test_invoice_gst_split_follows_place_of_supply(client, company):
+    client.portal.call(server.store.companies.insert, {"id": company, "name": "Test Co", "gstin": "33AAPFU0939F1ZY"})
+    product = make_product(client, "GST-1")
+    local = make_customer(client, "Local Buyer", gstin="33ABCDE1234F1Z5")
+    remote = make_customer(client, "Remote Buyer", gstin="29ABCDE1234F1Z5")
+
+    intra = client.post("/api/invoices", json=invoice_payload(local, product, "INV-GST-1")).json()
+    inter = client.post("/api/invoices", json=invoice_payload(remote, product, "INV-GST-2")).json()
+    assert intra["supplyType"] == "intra"
+    assert intra["cgstAmount"] == intra["sgstAmount"] == 18.0 and intra["igstAmount"] == 0
+    assert inter["supplyType"] == "inter"
+    assert inter["igstAmount"] == 36.0 and inter["cgstAmount"] == inter["sgstAmount"] == 0
+    assert intra["totalAmount"] == inter["totalAmount"] == 236.0
+
+
+def test_receivables_aging_and_statement(client, company):
+    customer = make_customer(client)
+    product = make_product(client, "AGING-1")
+    client.post("/api/invoices", json=invoice_payload(customer, product, "INV-AGE-1", dueDate="2024-07-31"))
+    client.post("/api/invoices", json=invoice_payload(customer, product, "INV-AGE-2", dueDate="2024-09-20"))
+
+    aging = client.get("/api/receivables/aging", params={"as_of": "2024-09-10"}).json()
+    buckets = {b["bucket"]: b["invoices"] for b in aging["buckets"]}
+    assert buckets["current"] == 1 and buckets["31-60"] == 1
+    assert aging["totalInvoices"] == 2
+
+    statement = client.get(f"/api/customers/{customer['id']}/statement", params={"as_of": "2024-09-10"})
+    assert statement.status_code == 200, statement.text
+
+
+def test_import_validation_flags_conflicts(client, company):
+    make_product(client, "IMPORT-1")
+    response = client.post("/api/import/validate", json={
+        "products": [{"sku": "IMPORT-1"}, {"sku": "IMPORT-2"}, {"sku": "IMPORT-2"}],
+    })
+    assert response.status_code == 200, response.text
+    assert [row["status"] for row in response.json()["products"]] == ["update", "new", "conflict"]
+
+
+def test_import_validation_matches_customers_without_their_id(client, company):
+    customer = make_customer(client, "Known Buyer", gstin="29ABCDE1234F1Z5")
+    product = make_product(client, "IMPORT-3")
+    item = {"productId": product["id"], "sku": product["sku"]}
+    response = client.post("/api/import/validate", json={"invoices": [
+        {"invoiceNumber": "IMP-1", "customerId": "CUST-made-up", "customerName": "Renamed",
+         "customerGSTIN": "29ABCDE1234F1Z5", "items": [item]},
+        {"invoiceNumber": "IMP-2", "customerId": "CUST-made-up", "customerName": "Known Buyer", "items": [item]},
+        {"invoiceNumber": "IMP-3", "customerId": "CUST-made-up", "customerName": "New Buyer", "items": [item]},
+        {"invoiceNumber": "IMP-4", "customerId": "CUST-made-up", "items": [item]},
+    ]})
+    assert response.status_code == 200, response.text
+    rows = response.json()["invoices"]
+    assert [row["customerId"] for row in rows] == [customer["id"], customer["id"], None, None]
+    assert [row["status"] for row in rows] == ["new", "new", "new", "missing-reference"]
+
+
+def test_sales_rollups_follow_invoice_writes(client, company):
+    customer = make_customer(client)
+    fast, slow = make_product(client, "FAST-1"), make_product(client, "SLOW-1")
+    client.post("/api/invoices", json=invoice_payload(customer, fast, "INV-S-1", quantity=5))
+    invoice = client.post("/api/invoices", json=invoice_payload(customer, slow, "INV-S-2", quantity=1)).json()
+
+    params = {"date_from": "2024-07-01", "date_to": "2024-07-01"}
+    top = client.get("/api/sales/top-products", params=params).json()
+    assert [(row["productId"], row["quantity"]) for row in top] == [(fast["id"], 5), (slow["id"], 1)]
+
+    client.delete(f"/api/invoices/{invoice['id']}")
+    top = client.get("/api/sales/top-products", params=params).json()
+    assert [row["productId"] for row in top] == [fast["id"]]
+
+    job = wait_for_job(client, client.post("/api/sales/rollups/rebuild"))
+    assert job["status"] == "succeeded"
+    assert client.get("/api/sales/top-products", params=params).json() == top
+
+
+def test_sales_rollups_follow_invoice_updates(client, company):
+    customer, product = make_customer(client), make_product(client, "ROLLUP-UPD-1")
+    invoice = client.post("/api/invoices", json=invoice_payload(customer, product, "INV-U-1", quantity=2)).json()
+    items = [{**invoice["items"][0], "quantity": 7, "amount": 700.0}]
+    assert client.put(f"/api/invoices/{invoice['id']}", json={"items": items}).status_code == 200
+
+    top = client.get("/api/sales/top-products", params={"date_from": "2024-07-01", "date_to": "2024-07-01"}).json()
+    assert [(row["productId"], row["quantity"]) for row in top] == [(product["id"], 7)]
+
+
+def test_seed_runs_as_a_job(client, company):
+    job = wait_for_job(client, client.post("/api/seed"))
+    assert job["status"] == "succeeded", job
+    assert len(client.get("/api/products").json()) == job["result"]["data"]["products"]
+
+
+def test_delta_sync_reports_changes_and_deletes(client, company):
+    start = client.get("/api/sync").json()["next"]
+    kept, dropped = make_product(client, "SYNC-1"), make_product(client, "SYNC-2")
+    client.delete(f"/api/products/{dropped['id']}")
+
+    changes = client.get("/api/sync", params={"since": start}).json()
+    assert changes["changed"]["products"] == [kept["id"]]
+    assert changes["deleted"]["products"] == [dropped["id"]]
+    assert client.get("/api/sync", params={"since": changes["next"]}).json()["changed"]["products"] == []
+
+
+def test_excel_exports_stream_workbooks(client, company):
+    make_product(client, "XLSX-1")
+    response = client.get("/api/products/export.xlsx")
+    assert response.status_code == 200
+    assert response.content[:2] == b"PK"
+
+
+def test_reorder_suggestions(client, company):
+    customer = make_customer(client)
+    product = make_product(client, "REORDER-1", stock=1, minStock=0)
+    today = datetime.utcnow().date()
+    for day in range(7):
+        client.post("/api/invoices", json=invoice_payload(
+            customer, product, f"INV-R-{day}", quantity=3, date=str(today - timedelta(days=day))))
+
+    job = wait_for_job(client, client.post("/api/reorder-suggestions/run"))
+    assert job["status"] == "succeeded", job
+    report = client.get("/api/reorder-suggestions").json()
+    assert report["suggestions"] == 1
+    assert report["suppliers"][0]["products"][0]["productId"] == product["id"]
+
+
+def test_reorder_suggestions_are_scheduled_at_startup(client, company):
+    make_product(client, "REORDER-START-1")
+    client.__exit__(None, None, None)
+    with TestClient(server.app) as again:
+        deadline = time.monotonic() + 5
+        while not again.portal.call(server.store.reorder_runs.get, {"companyId": company}):
+            assert time.monotonic() < deadline, "no reorder run after startup"
+            time.sleep(0.02)
+
+
+def test_status_latest_and_history(client):
+    for n in range(5):
+        client.post("/api/status", json={"client_name": f"status-test-{n % 2}"})
+    client.portal.call(server.status_writer.flush)
+
+    latest = {s["client_name"]: s for s in client.get("/api/status/latest").json()}
+    assert {"status-test-0", "status-test-1"} <= set(latest)
+
+    seen, params = [], {"client_name": "status-test-0", "limit": 2}
+    while True:
+        page = client.get("/api/status/history", params=params).json()
+        seen += [s["id"] for s in page["items"]]
+        if not page["hasMore"]:
+            break
+        params.update(before=page["nextBefore"], before_id=page["nextBeforeId"])
+    assert len(seen) == len(set(seen)) == 3
+    assert seen[0] == latest["status-test-0"]["id"]
+
+
+def test_stock_snapshot_is_taken_at_startup(client, company):
+    product = make_product(client, "SNAP-1", stock=4)
+    client.portal.call(server.store.stock_snapshots.delete_many, {})
+    client.__exit__(None, None, None)
+    with TestClient(server.app) as again:
+        deadline = time.monotonic() + 5
+        while not again.portal.call(server.store.stock_snapshots.get, {"productId": product["id"]}):
+            assert time.monotonic() < deadline, "no snapshot after startup"
+            time.sleep(0.02)
+        again.post(f"/api/products/{product['id']}/stock-movements", json={"quantity": -1, "reason": "adjustment"},
+                   headers={"X-Company-Id": company})
+        level = again.get(f"/api/products/{product['id']}/stock", headers={"X-Company-Id": company}).json()
+    assert level["stock"] == 3 and level["snapshotAt"] is not None
+
+
+def test_stale_idempotency_claim_is_taken_over(client, company, monkeypatch):
+    payload = {"name": "Stuck", "sku": "IDEM-STALE-1", "category": "General", "price": 5, "stock": 1}
+    record_id = f"{company}:products:stuck-key"
+    fingerprint = server.hashlib.sha256(server.json.dumps(
+        server.jsonable_encoder(server.ProductCreate(**payload)), sort_keys=True).encode()).hexdigest()
+    claimed_at = datetime.utcnow() - timedelta(seconds=30)
+    client.portal.call(server.store.idempotency_keys.insert, {
+        "_id": record_id, "fingerprint": fingerprint, "status": "pending",
+        "createdAt": claimed_at, "claimedAt": claimed_at,
+    })
+    headers = {"Idempotency-Key": "stuck-key"}
+    assert client.post("/api/products", json=payload, headers=headers).status_code == 409
+
+    monkeypatch.setattr(server, "IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", 10)
+    first = client.post("/api/products", json=payload, headers=headers)
+    assert first.status_code == 200, first.text
+    replay = client.post("/api/products", json=payload, headers=headers)
+    assert replay.headers.get("Idempotent-Replayed") == "true"
+    assert replay.json()["id"] == first.json()["id"]
+
+
+def test_multiple_workers_are_warned_about(monkeypatch, caplog):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    server.warn_if_multiple_workers()
+    assert "Run a single server process" in caplog.text
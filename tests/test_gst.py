@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from gst import compute_invoice, money, resolve_rate, state_code, summarize
+
+SUPPLIER = "33AAPFU0939F1ZY"
+
+
+def test_state_code_reads_valid_gstins_only():
+    assert state_code(" 29abcde1234f1z5 ") == "29"
+    assert state_code("29ABCDE1234F1Y5") is None
+    assert state_code("") is None and state_code(None) is None
+
+
+def test_money_rounds_half_up_to_the_paisa():
+    assert money("2.675") == Decimal("2.68")
+    assert money(0.125) == Decimal("0.13")
+
+
+def test_resolve_rate_uses_the_longest_prefix():
+    rates = {"84": Decimal("18"), "8471": Decimal("12")}
+    assert resolve_rate(rates, "8471.30", 5) == Decimal("12")
+    assert resolve_rate(rates, "8401", 5) == Decimal("18")
+    assert resolve_rate(rates, "9999", 5) == Decimal("5")
+    assert resolve_rate(rates, "", "28") == Decimal("28")
+
+
+def test_intra_state_supply_splits_cgst_and_sgst():
+    invoice = compute_invoice([{"hsn": "8471", "gstRate": 18, "amount": 100.05}], SUPPLIER,
+                              "33ABCDE1234F1Z5", {})
+    assert invoice["supplyType"] == "intra" and invoice["placeOfSupply"] == "33"
+    assert invoice["cgstAmount"] == invoice["sgstAmount"] == 9.0
+    assert invoice["igstAmount"] == 0
+    assert invoice["totalAmount"] == 118.05
+
+
+def test_inter_state_supply_charges_igst():
+    invoice = compute_invoice([{"hsn": "8471", "gstRate": 18, "amount": 100}], SUPPLIER,
+                              "29ABCDE1234F1Z5", {"8471": Decimal("12")})
+    assert invoice["supplyType"] == "inter" and invoice["placeOfSupply"] == "29"
+    assert invoice["igstAmount"] == 12 and invoice["cgstAmount"] == invoice["sgstAmount"] == 0
+    assert invoice["items"][0]["gstRate"] == 12
+
+
+def test_missing_customer_gstin_is_intra_state():
+    invoice = compute_invoice([{"gstRate": 5, "amount": 10}], SUPPLIER, "", {})
+    assert invoice["supplyType"] == "intra" and invoice["placeOfSupply"] == "33"
+
+
+def test_invoice_totals_are_sums_of_rounded_lines():
+    items = [{"gstRate": 18, "amount": 0.03}] * 3
+    invoice = compute_invoice(items, SUPPLIER, "", {})
+    line = invoice["items"][0]
+    assert line["cgst"] == line["sgst"] == 0.0
+    assert invoice["gstAmount"] == 0 and invoice["totalAmount"] == 0.09
+
+
+def test_summarize_groups_b2b_b2c_and_hsn():
+    b2b = compute_invoice([{"hsn": "8471", "gstRate": 18, "amount": 100, "quantity": 2}], SUPPLIER,
+                          "29ABCDE1234F1Z5", {})
+    b2c = compute_invoice([{"hsn": "8471", "gstRate": 18, "amount": 50, "quantity": 1}], SUPPLIER, "", {})
+    summary = summarize([{**b2b, "customerGSTIN": "29ABCDE1234F1Z5"}, {**b2c, "customerGSTIN": ""}])
+    assert [row["customerGSTIN"] for row in summary["b2b"]] == ["29ABCDE1234F1Z5"]
+    assert summary["b2c"] == [{"placeOfSupply": "33", "invoices": 1, "taxableValue": 50,
+                               "cgst": 4.5, "sgst": 4.5, "igst": 0}]
+    assert summary["hsn"][0]["quantity"] == 3 and summary["hsn"][0]["taxableValue"] == 150
+    assert summary["totals"]["igst"] == 18 and summary["totals"]["invoices"] == 2
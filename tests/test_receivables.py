@@ -0,0 +1,63 @@
+import asyncio
+from datetime import date, datetime
+
+from receivables import AgingCache, aging, aging_boundaries, aging_bucket, days_overdue
+from storage import SQLiteStorage
+
+AS_OF = date(2024, 9, 10)
+
+
+def test_aging_bucket_edges():
+    assert [aging_bucket(days) for days in (-1, 0, 30, 31, 60, 61, 90, 91)] == [
+        "current", "0-30", "0-30", "31-60", "31-60", "61-90", "61-90", "90+"]
+
+
+def test_boundaries_agree_with_days_overdue():
+    boundaries = aging_boundaries(AS_OF)
+    assert boundaries == sorted(boundaries)
+    # The last day of each bucket falls just before the next boundary
+    assert days_overdue(boundaries[1], AS_OF) == 90
+    assert days_overdue(boundaries[3], AS_OF) == 30
+    assert days_overdue(boundaries[4], AS_OF) == -1
+
+
+def test_aging_counts_and_sums_per_bucket():
+    due_dates = [datetime(2024, 9, 20), datetime(2024, 9, 10), datetime(2024, 7, 31), datetime(2024, 1, 1), None]
+
+    async def scenario():
+        store = SQLiteStorage(":memory:")
+        await store.invoices.insert_many([
+            {"id": str(n), "companyId": "c", "totalAmount": 100.005 + n,
+             **({"dueDate": due} if due else {})}
+            for n, due in enumerate(due_dates)
+        ])
+        return await aging(store.invoices, {"companyId": "c"}, AS_OF)
+
+    report = asyncio.run(scenario())
+    buckets = {row["bucket"]: (row["invoices"], row["amount"]) for row in report["buckets"]}
+    assert buckets == {"current": (1, 100.0), "0-30": (1, 101.0), "31-60": (1, 102.0),
+                       "61-90": (0, 0), "90+": (1, 103.0), "noDueDate": (1, 104.0)}
+    assert report["totalInvoices"] == 5
+    assert report["overdue"] == 306.0
+
+
+def test_aging_cache_expires_and_invalidates(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("receivables.clock.monotonic", lambda: now[0])
+    cache = AgingCache(ttl_seconds=30)
+    cache.put("a", None, AS_OF, {"n": 1})
+    cache.put("b", None, AS_OF, {"n": 2})
+    assert cache.get("a", None, AS_OF) == {"n": 1}
+
+    cache.invalidate("a")
+    assert cache.get("a", None, AS_OF) is None
+    assert cache.get("b", None, AS_OF) == {"n": 2}
+
+    now[0] += 31
+    assert cache.get("b", None, AS_OF) is None
+
+
+def test_aging_cache_is_off_with_zero_ttl():
+    cache = AgingCache(ttl_seconds=0)
+    cache.put("a", None, AS_OF, {"n": 1})
+    assert cache.get("a", None, AS_OF) is None
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from reorder import demand_matrix, group_by_supplier, suggest, suggestion_rows
+
+START = datetime(2024, 7, 1)
+
+
+def test_demand_matrix_places_sales_by_product_and_day():
+    rows = [
+        {"productId": "b", "day": START, "quantity": 2},
+        {"productId": "b", "day": START, "quantity": 1},
+        {"productId": "a", "day": START + timedelta(days=2), "quantity": 5},
+        {"productId": "a", "day": START + timedelta(days=3), "quantity": 9},  # past the window
+        {"productId": "z", "day": START, "quantity": 7},  # unknown product
+    ]
+    demand = demand_matrix(["a", "b"], rows, START, 3)
+    assert demand.tolist() == [[0, 0, 5], [3, 0, 0]]
+
+
+def test_demand_matrix_without_sales_is_zero():
+    assert demand_matrix(["a"], [], START, 2).tolist() == [[0, 0]]
+
+
+def test_suggest_orders_up_to_reorder_point_plus_review_period():
+    demand = np.array([[2.0, 2.0, 2.0, 2.0], [0.0, 0.0, 0.0, 0.0], [2.0, 2.0, 2.0, 2.0]])
+    stats = suggest(np.array([5.0, 5.0, 100.0]), demand, lead_time_days=4, review_days=7, service_z=1.65)
+    assert stats["avgDailyDemand"].tolist() == [2, 0, 2]
+    assert stats["reorderPoint"].tolist() == [8, 0, 8]
+    # 8 at the reorder point plus 14 over the review period, less the 5 on hand
+    assert stats["suggestedQuantity"].tolist() == [17, 0, 0]
+    assert stats["daysOfCover"][0] == 2.5 and np.isinf(stats["daysOfCover"][1])
+
+
+def test_suggest_adds_safety_stock_for_variable_demand():
+    stats = suggest(np.array([0.0]), np.array([[0.0, 4.0]]), lead_time_days=4, review_days=0, service_z=1.0)
+    deviation = np.std([0, 4], ddof=1)
+    assert stats["reorderPoint"][0] == 2 * 4 + deviation * 2
+    assert stats["suggestedMinStock"][0] == np.ceil(8 + deviation * 2)
+
+
+def test_rows_and_supplier_groups():
+    products = [
+        {"id": "a", "name": "A", "sku": "A", "supplier": "S2", "price": 10},
+        {"id": "b", "name": "B", "sku": "B", "supplier": "S1", "price": 1.5},
+        {"id": "c", "name": "C", "sku": "C", "supplier": "S1", "price": 2},
+        {"id": "d", "name": "D", "sku": "D", "supplier": "S1", "price": 2},
+    ]
+    stats = suggest(np.array([0.0, 0.0, 0.0, 50.0]), np.array([[1.0, 1.0], [2.0, 2.0], [3.0, 3.0], [1.0, 1.0]]),
+                    lead_time_days=1, review_days=1, service_z=0)
+    rows = suggestion_rows(products, stats)
+    assert [(row["productId"], row["suggestedQuantity"], row["estimatedCost"]) for row in rows] == [
+        ("a", 2, 20), ("b", 4, 6.0), ("c", 6, 12)]
+    assert rows[0]["daysOfCover"] == 0
+
+    groups = group_by_supplier(rows)
+    assert [group["supplier"] for group in groups] == ["S1", "S2"]
+    assert [row["productId"] for row in groups[0]["products"]] == ["c", "b"]
+    assert groups[0]["totalQuantity"] == 10 and groups[0]["estimatedCost"] == 18.0
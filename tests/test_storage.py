@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import SQLiteStorage, Storage
+
+
+def test_file_store_reopens_after_close(tmp_path):
+    async def scenario():
+        store = SQLiteStorage(str(tmp_path / "store.sqlite3"))
+        await store.products.insert({"id": "p1", "sku": "A"})
+        store.close()
+        found = await store.products.get({"id": "p1"}, {"_id": 0})
+        store.close()
+        return found
+
+    assert asyncio.run(scenario()) == {"id": "p1", "sku": "A"}
+
+
+def test_memory_store_keeps_its_data_across_close():
+    async def scenario():
+        store = SQLiteStorage(":memory:")
+        await store.products.insert({"id": "p1"})
+        store.close()
+        return await store.products.count({})
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_latest_by_returns_newest_document_per_key():
+    base = datetime(2024, 1, 1)
+
+    async def scenario():
+        store = SQLiteStorage(":memory:")
+        await store.status_checks.insert_many([
+            {"id": str(n), "client_name": f"c{n % 2}", "timestamp": base + timedelta(minutes=n)}
+            for n in range(6)
+        ])
+        return await store.status_checks.latest_by({}, "client_name", "timestamp", {"_id": 0, "id": 1})
+
+    assert asyncio.run(scenario()) == [{"id": "4"}, {"id": "5"}]
+
+
+def test_storage_backends_must_provide_collections():
+    with pytest.raises(TypeError):
+        Storage()